@@ -0,0 +1,99 @@
+# access_log.py
+from __future__ import annotations
+
+import atexit
+import queue
+import threading
+from contextlib import contextmanager
+
+from google_sheets_client import append_rows, background_priority
+
+# ------------------------------------------------------------
+# access_log の追記専用ライタ（ログインを待たせない）
+#  - log_access() はメモリのキューに積むだけで即座に戻る
+#  - バックグラウンドスレッドが一定間隔／一定件数でまとめて append_rows
+#  - シートは一切読まない（ログ件数に依存しない）
+#  - 失敗したバッチはキューに戻して次回に再送
+#  - シートを読み直して書き戻す処理（アーカイブ）は paused() の中で行う
+#    （先にキューを書き出し、その間の追記を止める＝書き戻しで消さない）
+# ------------------------------------------------------------
+SHEET_ACCESS_LOG = "access_log"
+FLUSH_INTERVAL_SEC = 10.0
+MAX_BATCH = 200
+MAX_QUEUE = 5000        # 溢れた場合は古いものから捨てる（ログなのでUXを優先）
+
+_q: "queue.Queue[dict]" = queue.Queue()
+_lock = threading.Lock()
+_write_lock = threading.RLock()   # 追記中／paused() 中は保持
+_worker: threading.Thread | None = None
+_wake = threading.Event()
+
+
+def _drain(limit: int) -> list[dict]:
+    out = []
+    while len(out) < limit:
+        try:
+            out.append(_q.get_nowait())
+        except queue.Empty:
+            break
+    return out
+
+
+def flush() -> int:
+    """キューを書き出す（書けた件数を返す）"""
+    written = 0
+    with _write_lock:
+        while True:
+            batch = _drain(MAX_BATCH)
+            if not batch:
+                return written
+            try:
+                append_rows(SHEET_ACCESS_LOG, batch)
+                written += len(batch)
+            except Exception:
+                # 戻して次回再送（順序はほぼ維持）
+                for e in batch:
+                    _q.put(e)
+                return written
+
+
+@contextmanager
+def paused():
+    """キューを書き出してから、抜けるまでシートへの追記を止める（積むのは止めない）"""
+    with _write_lock:
+        flush()
+        yield
+
+
+def _loop():
+    backoff = FLUSH_INTERVAL_SEC
+    # ログ書き込みは低優先度（クォータが逼迫していれば見送って次回再送）
+    with background_priority():
+        while True:
+            _wake.wait(backoff)
+            _wake.clear()
+            pending = _q.qsize()
+            n = flush()
+            # 書き込めなかったら間隔を延ばす（最大5分）
+            backoff = FLUSH_INTERVAL_SEC if (n or not pending) else min(backoff * 2, 300.0)
+
+
+def _ensure_worker():
+    global _worker
+    with _lock:
+        if _worker is None or not _worker.is_alive():
+            _worker = threading.Thread(target=_loop, name="access-log-writer", daemon=True)
+            _worker.start()
+
+
+def log_access(entry: dict):
+    """アクセスログを1件積む（ネットワークI/Oは行わない）"""
+    while _q.qsize() >= MAX_QUEUE:
+        _drain(1)
+    _q.put(dict(entry))
+    _ensure_worker()
+    if _q.qsize() >= MAX_BATCH:
+        _wake.set()
+
+
+atexit.register(flush)
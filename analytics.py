@@ -0,0 +1,142 @@
+# analytics.py
+from __future__ import annotations
+
+import os
+import threading
+from typing import List, Optional
+
+import season_export
+
+# ------------------------------------------------------------
+# エクスポート済み Parquet（season_export）への集計クエリ（DuckDB 埋め込み）
+#  - シートを読まない（API 枠を使わない）ので過去シーズンの分析向け
+#  - 表はビュー（bets / odds / result / bm_log）として hive パーティションごと読む
+#  - 確定ベットの net は payout 未記入なら odds から補う（画面の計算と同じ）
+#  ※ duckdb は使う時だけ import（未インストールなら available() が False）
+# ------------------------------------------------------------
+_lock = threading.Lock()
+_conn = None
+_conn_dir: Optional[str] = None
+
+# 確定ベット（1行1ベット、net 付き）
+_SETTLED_BETS = """
+    SELECT b.season, b.gw_n, b."user", b.match_id, upper(b.pick) AS pick,
+           coalesce(b.stake, 0) AS stake, b.odds,
+           coalesce(b.payout, CASE WHEN upper(b.result) = 'WIN'
+                                   THEN coalesce(b.stake, 0) * coalesce(b.odds, 1.0) ELSE 0 END) AS payout
+    FROM bets b
+    WHERE upper(coalesce(b.result, '')) IN ('WIN', 'LOSE')
+"""
+
+ODDS_BANDS = (1.0, 1.5, 2.0, 3.0, 5.0)
+
+
+def available() -> bool:
+    try:
+        import duckdb  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def _connect(out_dir: Optional[str] = None):
+    """エクスポート先ごとに1接続（ビューを張り直すのは出力先が変わった時だけ）"""
+    global _conn, _conn_dir
+    import duckdb
+
+    out_dir = out_dir or season_export.EXPORT_DIR
+    with _lock:
+        if _conn is not None and _conn_dir == out_dir:
+            return _conn
+        conn = duckdb.connect(database=":memory:")
+        for table in season_export.TABLES:
+            path = os.path.join(out_dir, table)
+            if not os.path.isdir(path):
+                continue
+            glob = os.path.join(path, "**", "*.parquet").replace("'", "''")
+            conn.execute(f"CREATE OR REPLACE VIEW {table} AS "
+                         f"SELECT * FROM read_parquet('{glob}', hive_partitioning = true, union_by_name = true, "
+                         f"hive_types = {{'season': 'VARCHAR', 'gw_n': 'INTEGER'}})")
+        _conn, _conn_dir = conn, out_dir
+        return conn
+
+
+def refresh():
+    """エクスポートし直した後に呼ぶ（ビューを張り直す）"""
+    global _conn, _conn_dir
+    with _lock:
+        if _conn is not None:
+            _conn.close()
+        _conn, _conn_dir = None, None
+
+
+def _query(sql: str, params: Optional[list] = None) -> List[dict]:
+    conn = _connect()
+    with _lock:
+        cur = conn.execute(sql, params or [])
+        cols = [d[0] for d in cur.description]
+        return [dict(zip(cols, r)) for r in cur.fetchall()]
+
+
+def _season_filter(season: Optional[str], alias: str = "s") -> tuple:
+    if season is None:
+        return "", []
+    return f"WHERE {alias}.season = ?", [str(season)]
+
+
+# ---- ダッシュボード系 ----
+def roi_by_user(season: Optional[str] = None) -> List[dict]:
+    where, params = _season_filter(season)
+    return _query(f"""
+        SELECT s."user", count(*) AS n_bets, sum(s.stake) AS stake, sum(s.payout) AS payout,
+               sum(s.payout) - sum(s.stake) AS net,
+               (sum(s.payout) - sum(s.stake)) / nullif(sum(s.stake), 0) AS roi
+        FROM ({_SETTLED_BETS}) s {where}
+        GROUP BY s."user" ORDER BY net DESC
+    """, params)
+
+
+def roi_by_team(season: Optional[str] = None) -> List[dict]:
+    """予想したチーム別（Draw は 'Draw'）"""
+    where, params = _season_filter(season)
+    return _query(f"""
+        SELECT CASE s.pick WHEN 'HOME' THEN o.home WHEN 'AWAY' THEN o.away ELSE 'Draw' END AS team,
+               count(*) AS n_bets, sum(s.stake) AS stake, sum(s.payout) - sum(s.stake) AS net,
+               (sum(s.payout) - sum(s.stake)) / nullif(sum(s.stake), 0) AS roi
+        FROM ({_SETTLED_BETS}) s
+        LEFT JOIN odds o ON o.season = s.season AND o.gw_n = s.gw_n AND o.match_id = s.match_id
+        {where}
+        GROUP BY team ORDER BY net DESC
+    """, params)
+
+
+def roi_by_odds_band(season: Optional[str] = None) -> List[dict]:
+    where, params = _season_filter(season)
+    bands = " ".join(f"WHEN s.odds < {hi} THEN '{lo:.1f}-{hi:.1f}'"
+                     for lo, hi in zip(ODDS_BANDS, ODDS_BANDS[1:]))
+    return _query(f"""
+        SELECT CASE {bands} ELSE '{ODDS_BANDS[-1]:.1f}+' END AS band,
+               count(*) AS n_bets, sum(s.stake) AS stake, sum(s.payout) - sum(s.stake) AS net,
+               (sum(s.payout) - sum(s.stake)) / nullif(sum(s.stake), 0) AS roi,
+               avg(CASE WHEN s.payout > 0 THEN 1.0 ELSE 0.0 END) AS hit_rate
+        FROM ({_SETTLED_BETS}) s {where}
+        GROUP BY band ORDER BY min(s.odds)
+    """, params)
+
+
+# ---- 履歴系 ----
+def user_history(user: str, season: Optional[str] = None) -> List[dict]:
+    """ユーザーの GW ごとの確定ベット集計"""
+    params: list = [user]
+    extra = ""
+    if season is not None:
+        extra = "AND s.season = ?"
+        params.append(str(season))
+    return _query(f"""
+        SELECT s.season, s.gw_n, count(*) AS n_bets, sum(s.stake) AS stake, sum(s.payout) AS payout,
+               sum(s.payout) - sum(s.stake) AS net,
+               avg(CASE WHEN s.payout > 0 THEN 1.0 ELSE 0.0 END) AS hit_rate
+        FROM ({_SETTLED_BETS}) s
+        WHERE s."user" = ? {extra}
+        GROUP BY s.season, s.gw_n ORDER BY s.season DESC, s.gw_n DESC
+    """, params)
@@ -1,13 +1,22 @@
 import json
+import threading
+import time
 from datetime import datetime, timezone, timedelta
-from typing import Dict, List, Tuple
+from types import MappingProxyType
+from typing import Dict, List, Mapping, Tuple
 
 import pytz
 import streamlit as st
 
 from google_sheets_client import (
+    SheetReadError,
+    background_priority,
+    invalidate_registry,
+    quota_headroom,
     read_config_map,
     read_rows_by_sheet,
+    read_rows_if_exists,
+    update_cols,
     upsert_row,
 )
 from football_api import (
@@ -15,7 +24,24 @@ from football_api import (
     fetch_scores_for_match_ids,
     # ★ 追加
     fetch_matches_by_gw,
+    ApiConfig,
 )
+from util import gw_key
+import cache_store
+import write_journal
+from access_log import log_access
+import prefetch
+import prewarm
+import warm_cache
+import archive
+import standings
+import analytics
+import season_export
+import live_pnl
+import pnl
+import scenarios
+import montecarlo
+import liability
 
 # ------------------------------------------------------------
 # スタイル（アイコンは使わない・落ち着いた最小限）
@@ -75,40 +101,28 @@ def parse_float(x, default=None):
     except Exception:
         return default
 
-def _gw_sort_key(x):
-    """GWの並び替え用：GW7 / 7 / None / '' が混在しても安全にソート"""
-    s = "" if x is None else str(x).trim() if hasattr(str(x), "trim") else str(x).strip()
-    n = 999999
-    num = ""
-    for ch in s:
-        if ch.isdigit():
-            num += ch
-        elif num:
-            break
-    if num:
-        try:
-            n = int(num)
-        except Exception:
-            n = 999999
-    return (n, s)
-
 # ---- 追加：ID正規化（数字だけを抜き出して文字列化） ----
 def norm_id(x) -> str:
     s = "".join(ch for ch in str(x or "").strip() if ch.isdigit())
     return s or str(x or "").strip()
 
-# ★ 追加：GW番号の安全抽出（"GW7"/"7"→7、失敗時はNone）
-def _parse_gw_number(gw_name: str):
-    try:
-        digits = "".join(ch for ch in str(gw_name or "") if ch.isdigit())
-        return int(digits) if digits else None
-    except Exception:
-        return None
+# ★ 追加：行のGW番号（読込時に "_gw" として1回だけ解析済み。未解析行はその場で解析）
+def _row_gw(r) -> int:
+    if "_gw" in r:
+        return r["_gw"]
+    n = gw_key(r.get("gw") or None)
+    return n if n is not None else gw_key(r.get("gw_number") or None)
+
+def _annotate_gw(rows_: List[Dict]) -> List[Dict]:
+    for r in rows_:
+        if "gw" in r or "gw_number" in r:
+            r["_gw"] = _row_gw(r)
+    return rows_
 
 # === 追加：GW同値判定（番号ベースで比較）=====================
 def _gw_equal(a: str, b: str) -> bool:
-    na = _parse_gw_number(a)
-    nb = _parse_gw_number(b)
+    na = gw_key(a)
+    nb = gw_key(b)
     if na is not None and nb is not None:
         return na == nb
     # フォールバック
@@ -120,59 +134,228 @@ def _gw_equal(a: str, b: str) -> bool:
 #  - 「データ更新」クリックでのみ世代(rev)を進めて再取得
 # ------------------------------------------------------------
 def _data_rev() -> int:
+    rev = cache_store.rev_override()  # 裏スレッド内はセッション外なので投入側が固定した世代
+    if rev is not None:
+        return rev
     return int(st.session_state.get("_data_rev", 0))
 
-@st.cache_data(show_spinner=False)
-def _cached_sheet_rows(sheet: str, rev: int):
-    return read_rows_by_sheet(sheet) or []
-
-@st.cache_data(show_spinner=False)
-def _cached_fetch_matches_by_gw(conf: Dict[str, str], gw_label: str, rev: int):
-    ms, gw = fetch_matches_by_gw(conf, gw_label)
-    return ms or [], gw
+def _bump_data_rev():
+    """世代を進めて読込キャッシュを破棄（全セッション共通）"""
+    st.session_state["_data_rev"] = _data_rev() + 1
+    st.cache_data.clear()
+    cache_store.clear_all()
+    invalidate_registry()  # 手編集によるシート追加・ヘッダ変更もここで拾い直す
+    liability.invalidate()  # BM 負債の索引も次の表示で読み直す
+    prewarm.restart(_prewarm_task, _data_rev())
+
+# ★ 世代(rev)キーのキャッシュはリソース別に上限付きLRU（cache_store）で保持。
+#   クリックの度に増える古い世代は件数・バイト上限で自動的に追い出される。
+_SHEET_CACHE = cache_store.cache("sheets", max_entries=48, max_bytes=96 * 1024 * 1024)
+_FIXTURE_CACHE = cache_store.cache("fixtures", max_entries=64, max_bytes=8 * 1024 * 1024, ttl=6 * 3600)
+_SCORE_CACHE = cache_store.cache("scores", max_entries=256, max_bytes=16 * 1024 * 1024, ttl=3600)
+_SCORE_MISS_CACHE = cache_store.cache("score_misses", max_entries=256, max_bytes=1024 * 1024, ttl=120)
+_CONF_CACHE = cache_store.cache("config", max_entries=4, ttl=1800)
+
+# ★ シートは不変テーブル（行=読み取り専用Mapping のタプル）としてプロセス内で共有。
+#   cache_data のような呼び出し毎の pickle コピーが発生しない（読み出しはゼロコピー）。
+#   行を書き換えたい場合は dict(r) でコピーしてから使うこと。
+def _freeze_rows(rows_: List[Dict]) -> Tuple[Mapping, ...]:
+    return tuple(MappingProxyType(r) for r in rows_)
+
+def _load_sheet_fresh(sheet: str, missing_ok: bool = False) -> Tuple[Mapping, ...]:
+    # ★ strict：読み取り失敗は SheetReadError（空の結果をキャッシュ・スナップショットにしない）
+    rows_ = (read_rows_if_exists(sheet, strict=True) if missing_ok else read_rows_by_sheet(sheet, strict=True)) or []
+    warm_cache.remember_sheet(sheet, rows_)
+    return _freeze_rows(_annotate_gw(rows_))
+
+REVALIDATE_RETRY_SEC = (5, 15, 45)   # 取り直しの再試行間隔（見送り・失敗時）
+
+def _revalidate_in_background(cache_, key, loader):
+    def _run():
+        # ★ 画面は既にスナップショットで出ているので低優先度（枠不足なら見送り → 間隔をあけて再試行）
+        for wait in (0,) + REVALIDATE_RETRY_SEC:
+            time.sleep(wait)
+            try:
+                with background_priority():
+                    value = loader()
+            except Exception:
+                continue
+            cache_.put(key, value)
+            return
+        # 取り直せなかった：古いスナップショットを世代いっぱい残さず、次の表示で読み直させる
+        cache_.discard(key)
+    threading.Thread(target=_run, name=f"revalidate-{key}", daemon=True).start()
+
+def _cached_sheet_rows(sheet: str, rev: int, missing_ok: bool = False) -> Tuple[Mapping, ...]:
+    def _load():
+        # ★ 起動直後はディスクのスナップショットで即返し、最新はバックグラウンドで取り直す
+        snap = warm_cache.take_sheet(sheet)
+        if snap is not None:
+            _revalidate_in_background(_SHEET_CACHE, (sheet, rev), lambda: _load_sheet_fresh(sheet, missing_ok))
+            return _freeze_rows(_annotate_gw(snap))
+        return _load_sheet_fresh(sheet, missing_ok)
+    return _SHEET_CACHE.get_or_load((sheet, rev), _load)
+
+# ★ API系キャッシュは conf 全体ではなく ApiConfig の fingerprint をキーにする
+#   （users_json 等の無関係な設定変更で無効化されない）
+def _cached_fetch_matches_by_gw(api: ApiConfig, gw_n: int, rev: int):
+    # キーは整数GW番号のみ（"GW7" と "7" で二重にキャッシュしない）
+    def _load():
+        ms, gw = fetch_matches_by_gw(api, f"GW{gw_n}")
+        for m in ms or []:
+            m["_gw"] = gw_key(m.get("gw")) if m.get("gw") else gw_n
+        # ★ 共有値なので読み取り専用で保持（呼び出し側にはコピーを返す）
+        return _freeze_rows(ms or []), gw
+    ms, gw = _FIXTURE_CACHE.get_or_load((api.fingerprint, gw_n, rev), _load)
+    return [dict(m) for m in ms], gw
+
+def _cached_fetch_scores(api: ApiConfig, ids_tuple: tuple, rev: int):
+    # キャッシュは試合ID単位（どのID集合で問い合わせても共有できる）
+    out, missing = {}, []
+    for mid in ids_tuple:
+        key = (api.fingerprint, mid, rev)
+        sc = _SCORE_CACHE.get(key)
+        if sc is not None:
+            out[mid] = dict(sc)
+        elif key not in _SCORE_MISS_CACHE:
+            missing.append(mid)
+    if missing:
+        fetched = fetch_scores_for_match_ids(api, missing) or {}
+        for mid in missing:
+            sc = fetched.get(mid)
+            if sc is not None:
+                _SCORE_CACHE.put((api.fingerprint, mid, rev), MappingProxyType(dict(sc)))
+            else:
+                # APIに無かったIDは短時間だけ覚える（一時的な取りこぼしを世代いっぱい固定しない）
+                _SCORE_MISS_CACHE.put((api.fingerprint, mid, rev), True)
+        out.update({k: v for k, v in fetched.items() if k in set(missing)})
+    return out
 
-@st.cache_data(show_spinner=False)
-def _cached_fetch_scores(conf: Dict[str, str], ids_tuple: tuple, rev: int):
-    ids = list(ids_tuple)
-    return fetch_scores_for_match_ids(conf, ids) or {}
+# ★ 無いシートは WorksheetNotFound。未作成があり得るシート（集計・アーカイブ）は missing_ok=True を明示
+def rows(sheet: str, missing_ok: bool = False):
+    try:
+        return _cached_sheet_rows(sheet, _data_rev(), missing_ok)
+    except SheetReadError:
+        # 読めなかった回は空で表示（キャッシュしないので次の表示で読み直す）
+        return ()
 
-def rows(sheet: str):
-    return _cached_sheet_rows(sheet, _data_rev())
+# ★ BM 負債の索引は書き込みの度に差分更新。全件からの作り直しは世代の切替後に1回だけ、
+#   スナップショットやキャッシュではなくシートの最新（未反映の書き込み込み）から
+def _seed_liability():
+    liability.seed(lambda: read_rows_by_sheet("bets") or [])
 
 def api_matches_by_gw(conf: Dict[str, str], gw_label: str):
-    ms, _ = _cached_fetch_matches_by_gw(conf, gw_label, _data_rev())
+    n = gw_key(gw_label)
+    if n is None:
+        return []
+    api = ApiConfig.from_conf(conf)
+    ms, _ = _cached_fetch_matches_by_gw(api, n, _data_rev())
     return ms
 
 def api_scores(conf: Dict[str, str], ids: List[str]):
-    return _cached_fetch_scores(conf, tuple(ids), _data_rev())
+    # ★ 確定済み（FINISHED/AWARDED）のスコアは永続ストアから返し、APIは未確定分だけ
+    final = warm_cache.final_scores()
+    pending = tuple(i for i in ids if i not in final)
+    out = {i: final[i] for i in ids if i in final}
+    if pending:
+        api = ApiConfig.from_conf(conf)
+        fetched = _cached_fetch_scores(api, pending, _data_rev())
+        warm_cache.remember_final_scores(fetched)
+        out.update(fetched)
+    return out
 
-# ★ 追加：与えたGW表記（"GW7"や"7"）でマッチ取得（両表記を順番に試す／キャッシュ利用）
+# ★ 追加：与えたGW表記（"GW7"や"7"）でマッチ取得（GW番号に正規化して1回だけ／キャッシュ利用）
 def _fetch_matches_by_gw_any(conf: Dict[str, str], gw_label: str) -> List[Dict]:
-    variants = []
-    n = _parse_gw_number(gw_label)
-    if gw_label:
-        variants.append(str(gw_label))
-    if n is not None:
-        variants.extend([f"GW{n}", str(n)])
-    seen = []
-    for v in variants:
-        if v in seen:
-            continue
-        seen.append(v)
-        try:
-            ms = api_matches_by_gw(conf, v)
-            if ms:
-                return ms
-        except Exception:
-            pass
-    return []
+    try:
+        return api_matches_by_gw(conf, gw_label) or []
+    except Exception:
+        return []
 
 # ------------------------------------------------------------
 # 設定読込
 # ------------------------------------------------------------
-@st.cache_data(ttl=1800, show_spinner=False)
 def get_conf() -> Dict[str, str]:
-    return read_config_map()
+    # ★ config は秘密情報（トークン・パスワード）を含むのでディスクのスナップショットには載せない
+    # 呼び出し側で書き換えられても共有値が汚れないようコピーを返す
+    return dict(_CONF_CACHE.get_or_load("conf", read_config_map))
+
+# ------------------------------------------------------------
+# プリウォーム（プロセス起動直後／キャッシュ全クリア直後に1回だけ裏で実行）
+#   config → 各シート → アクティブGWの判定 → 今節の試合とスコア
+# ------------------------------------------------------------
+PREWARM_SHEETS = ("bm_log", "odds", "bets", "result", "gw_summary", "standings")
+# 精算後に作られる派生シート（未作成なら空として読む）
+OPTIONAL_SHEETS = frozenset({standings.SUMMARY_SHEET, standings.STANDINGS_SHEET})
+PREWARM_WAIT_SEC = 10.0
+
+def _prewarm_task(rev: int):
+    conf = get_conf()
+    for sheet in PREWARM_SHEETS:
+        rows(sheet, missing_ok=sheet in OPTIONAL_SHEETS)
+    gw = get_active_gw_label(conf)
+    gw_n = gw_key(gw)
+    ids = {norm_id(m.get("id")) for m in _fetch_matches_by_gw_any(conf, gw) if m.get("id")}
+    ids |= {norm_id(r.get("fd_match_id")) for r in rows("odds")
+            if _row_gw(r) == gw_n and r.get("fd_match_id")}
+    if ids:
+        api_scores(conf, sorted(ids))
+
+def _wait_for_prewarm():
+    """プリウォーム中はスケルトンを出して完了を待つ（同じ世代を見ているセッションのみ）"""
+    if prewarm.is_ready() or prewarm.target_rev() != _data_rev():
+        return
+    ph = st.empty()
+    with ph.container():
+        st.markdown(
+            '<div class="kpi-row">'
+            + '<div class="kpi"><div class="h">読み込み中…</div><div class="v">&nbsp;</div></div>' * 3
+            + '</div>',
+            unsafe_allow_html=True,
+        )
+        with st.spinner("データを準備しています…"):
+            prewarm.wait(PREWARM_WAIT_SEC)
+    ph.empty()
+
+# ------------------------------------------------------------
+# 再実行冒頭の並列プリフェッチ
+#   各ページのデータ依存を宣言し、タブ描画前に同時に読み込む。
+#   ページ側は従来どおり rows()/api_*() を呼ぶだけ（読込中なら合流して待つ）。
+# ------------------------------------------------------------
+PAGE_DATA_DEPS = {
+    "home": ("bm_log", "standings"),
+    "bets": ("bm_log", "bets", "odds"),
+    "history": ("bm_log", "bets", "odds", "gw_summary"),
+    "realtime": ("bm_log", "bets", "odds"),
+    "dashboard": ("bm_log", "bets", "odds", "gw_summary", "standings"),
+    "odds": ("bm_log", "odds"),
+}
+
+def _active_gw_score_ids(conf: Dict[str, str], gw: str) -> List[str]:
+    """今節の全試合ID（API・odds・bets の和集合）"""
+    gw_n = gw_key(gw)
+    matches = _fetch_matches_by_gw_any(conf, gw)
+    gw_odds = [r for r in rows("odds") if _row_gw(r) == gw_n]
+    in2fd = {norm_id(r.get("match_id")): norm_id(r.get("fd_match_id")) for r in gw_odds if norm_id(r.get("fd_match_id"))}
+    ids = {norm_id(m["id"]) for m in matches}
+    ids |= {norm_id(r.get("fd_match_id")) for r in gw_odds
+            if r.get("fd_match_id") and str(r.get("home", "")).strip() and str(r.get("away", "")).strip()}
+    ids |= {in2fd[norm_id(b.get("match_id"))] for b in rows("bets")
+            if _row_gw(b) == gw_n and norm_id(b.get("match_id")) in in2fd}
+    return sorted(ids)
+
+def _prefetch_active_gw(conf: Dict[str, str]):
+    gw = get_active_gw_label(conf)
+    ids = _active_gw_score_ids(conf, gw)
+    if ids:
+        api_scores(conf, ids)
+
+def prefetch_for_pages(conf: Dict[str, str], pages) -> Dict[str, "prefetch.Future"]:
+    rev = _data_rev()
+    sheets = sorted({s for p in pages for s in PAGE_DATA_DEPS.get(p, ())})
+    tasks = {f"sheet:{s}": (lambda s=s: rows(s, missing_ok=s in OPTIONAL_SHEETS)) for s in sheets}
+    # アクティブGWの試合・スコアは bm_log に依存するので1タスク内で連鎖
+    tasks["active_gw"] = lambda: _prefetch_active_gw(conf)
+    return prefetch.submit_all(tasks, rev=rev)
 
 def get_users(conf: Dict[str, str]) -> List[Dict]:
     users_json = conf.get("users_json", "").strip()
@@ -183,6 +366,38 @@ def get_users(conf: Dict[str, str]) -> List[Dict]:
     except Exception:
         return [{"username": "guest", "password": "guest", "role": "user", "team": ""}]
 
+# ------------------------------------------------------------
+# アーカイブ（過去シーズン・確定済みGW）の参照
+#   ホットなシートから外したGWは gw_summary（集計）で数え、
+#   明細は履歴で選ばれた時だけアーカイブシートから読む
+# ------------------------------------------------------------
+def _current_season(conf: Dict[str, str]) -> str:
+    return ApiConfig.from_conf(conf).season
+
+def _archived_summaries() -> List[Mapping]:
+    return [r for r in rows(archive.SUMMARY_SHEET) if str(r.get("archived", "")).upper() == "YES"]
+
+def _archived_rows(sheet: str, season: str):
+    # アーカイブ未実行のシーズンはシートが無い
+    return rows(archive.archive_sheet_name(sheet, season), missing_ok=True)
+
+# ★ 書き込みはジャーナル経由で非同期（保存直後の try/except では失敗を拾えない）
+#   → 反映待ち・直近の失敗・あきらめた書き込みを、保存を確認する場所に出す
+def render_write_status():
+    n_pending = write_journal.pending_count()
+    dead = write_journal.dead_letters()
+    if n_pending:
+        msg = f"シートへ反映待ちの書き込み: {n_pending} 件（自動で再送中）"
+        if write_journal.last_error:
+            st.warning(f"{msg}。直近のエラー: {write_journal.last_error}")
+        else:
+            st.caption(msg)
+    if dead:
+        st.error(
+            f"シートへ反映できなかった書き込みが {len(dead)} 件あります"
+            f"（例: {dead[-1].get('sheet')} — {dead[-1].get('error')}）。管理者に連絡してください。"
+        )
+
 # ------------------------------------------------------------
 # 右上：データ更新ボタン（景観控えめ）
 #   ※ 重複キー回避のため page_id を必須に
@@ -193,10 +408,16 @@ def render_refresh_bar(page_id: str):
     with cols[-1]:
         if st.button("データ更新", key=f"btn_data_refresh_{page_id}", use_container_width=True):
             # 世代を進めてキャッシュ全クリア → 同じタブのまま再実行
-            st.session_state["_data_rev"] = _data_rev() + 1
-            st.cache_data.clear()
+            _bump_data_rev()
             st.toast("最新データを取得しました。", icon="✅")
             st.rerun()
+    render_write_status()
+    # ★ API 枠の残りが少ない時だけ表示（重い処理は自動で後回し）
+    headroom = quota_headroom()
+    low = [f"{'読込' if kind == 'read' else '書込'} 残り {h['remaining']}/{h['limit']}"
+           for kind, h in headroom.items() if h["background_remaining"] <= 0]
+    if low:
+        st.caption("Sheets API の分あたり枠が逼迫しています（" + "・".join(low) + "）。バックグラウンド処理を後回しにしています。")
 
 # ------------------------------------------------------------
 # 認証（ログイン後はUIを描画しない） ★枠ナシ見出し（既存維持）
@@ -266,7 +487,7 @@ def login_ui(conf: Dict[str, str]) -> Dict:
                 st.session_state["_data_rev"] = 0  # スナップショット初期化
                 st.toast(f"ようこそ {selected['username']} さん！", icon="✅")
 
-                # --- ⑤ access_log に追記（JST時刻 & 画面情報） ---
+                # --- ⑤ access_log に追記（JST時刻 & 画面情報）※ キューに積むだけ・書込みは裏で一括 ---
                 try:
                     sw = st.query_params.get("sw", None)
                     sh = st.query_params.get("sh", None)
@@ -278,16 +499,12 @@ def login_ui(conf: Dict[str, str]) -> Dict:
                     jst = pytz.timezone("Asia/Tokyo")
                     access_time_jst = datetime.now(jst).isoformat(timespec="seconds")
 
-                    upsert_row(
-                        "access_log",
-                        {
-                            "username": selected["username"],
-                            "access_time": access_time_jst,   # JSTで保存
-                            "display_size": display_size,
-                            "devicePixelRatio": dpr_str,
-                        },
-                        key_cols=["username", "access_time"],
-                    )
+                    log_access({
+                        "username": selected["username"],
+                        "access_time": access_time_jst,   # JSTで保存
+                        "display_size": display_size,
+                        "devicePixelRatio": dpr_str,
+                    })
                 except Exception:
                     # ログ書込みエラーはUXに影響させない
                     pass
@@ -336,12 +553,11 @@ def _pick_next_bm(users: List[str], counts: Dict[str, int]) -> str:
 
 # ========== 追加：このGWのブックメーカーを取得 ==========
 def get_bookmaker_for_gw(gw_name: str) -> str:
-    rows_ = rows("bm_log")
-    targets = {str(gw_name).strip(), str(gw_name).replace("GW", "").strip()}
-    for r in rows_:
-        gw_cell = str(r.get("gw", "")).strip()
-        gw_num = str(r.get("gw_number", "")).strip()
-        if gw_cell in targets or gw_num in targets:
+    n = gw_key(gw_name)
+    if n is None:
+        return ""
+    for r in rows("bm_log"):
+        if _row_gw(r) == n:
             return str(r.get("bookmaker") or r.get("user") or "").strip()
     return ""
 
@@ -349,18 +565,7 @@ def get_bookmaker_for_gw(gw_name: str) -> str:
 def _get_latest_gw_number_in_bm_log() -> int:
     try:
         rows_ = rows("bm_log")
-        cand = []
-        for r in rows_:
-            n = None
-            if r.get("gw_number"):
-                try:
-                    n = int(str(r["gw_number"]).strip())
-                except Exception:
-                    n = None
-            if n is None and r.get("gw"):
-                n = _parse_gw_number(r["gw"])
-            if n is not None:
-                cand.append(n)
+        cand = [n for n in (_row_gw(r) for r in rows_) if n is not None]
         return max(cand) if cand else None
     except Exception:
         return None
@@ -475,10 +680,18 @@ def _toast_next_bm_once(conf: Dict[str, str], me: Dict):
 #   3) result 更新 → bets 自動精算（既存ロジック）
 #   ※ 書き込み系なのでキャッシュは使わず生I/O
 # ------------------------------------------------------------
-def sync_results_and_settle(conf: Dict[str, str]):
+def sync_results_and_settle(conf: Dict[str, str]) -> Tuple[set, List[Dict], int]:
+    """result 更新＆bets 精算。返り値：(精算したGW番号, 精算後の bets 行, 書き込んだ行数)"""
+    settled_gws: set = set()
+    bets_now: List[Dict] = []
+    written = 0
     try:
-        odds_rows = read_rows_by_sheet("odds") or []
-        bets_rows = read_rows_by_sheet("bets") or []
+        # ★ odds / bets / result を同時に読み始める（result は (3) まで待たない）
+        futs = prefetch.submit_all({s: (lambda s=s: read_rows_by_sheet(s) or [])
+                                    for s in ("odds", "bets", "result")})
+        odds_rows = futs["odds"].result()
+        bets_rows = futs["bets"].result()
+        bets_now = list(bets_rows)
 
         # ---------- (1) 超シンプル補完：fd_match_id ← match_id をコピー ----------
         copied_any = False
@@ -490,6 +703,7 @@ def sync_results_and_settle(conf: Dict[str, str]):
                 newrow["fd_match_id"] = norm_id(mid)
                 newrow["updated_at"] = datetime.utcnow().isoformat(timespec="seconds")
                 upsert_row("odds", newrow, key_cols=["match_id", "gw"])
+                written += 1
                 copied_any = True
 
         if copied_any:
@@ -512,11 +726,11 @@ def sync_results_and_settle(conf: Dict[str, str]):
         ]
 
         if need_fix:
-            gw_set = sorted({str(r.get("gw")).strip() for r in need_fix})
+            gw_set = sorted({_row_gw(r) for r in need_fix} - {None})
             fd_lookup_by_gw = {}
             for gw in gw_set:
                 try:
-                    api_matches, _ = fetch_matches_by_gw(conf, gw)
+                    api_matches, _ = fetch_matches_by_gw(conf, f"GW{gw}")
                     lut = {(_norm_name(m["home"]), _norm_name(m["away"])): norm_id(m["id"])
                            for m in api_matches}
                     fd_lookup_by_gw[gw] = lut
@@ -525,7 +739,7 @@ def sync_results_and_settle(conf: Dict[str, str]):
 
             fixed_any = False
             for r in need_fix:
-                gw = str(r.get("gw")).strip()
+                gw = _row_gw(r)
                 key = (_norm_name(r.get("home")), _norm_name(r.get("away")))
                 fd_id = fd_lookup_by_gw.get(gw, {}).get(key)
                 if fd_id:
@@ -533,6 +747,7 @@ def sync_results_and_settle(conf: Dict[str, str]):
                     newrow["fd_match_id"] = fd_id
                     newrow["updated_at"] = datetime.utcnow().isoformat(timespec="seconds")
                     upsert_row("odds", newrow, key_cols=["match_id", "gw"])
+                    written += 1
                     fixed_any = True
 
             if fixed_any:
@@ -554,9 +769,9 @@ def sync_results_and_settle(conf: Dict[str, str]):
 
         candidate_fd_ids = sorted({v for v in in2fd.values() if v})
         if not candidate_fd_ids:
-            return
+            return settled_gws, bets_now, written
 
-        result_rows = read_rows_by_sheet("result") or []
+        result_rows = futs["result"].result()
         result_by_fd = {norm_id(r.get("match_id")): r for r in result_rows if r.get("match_id")}
 
         scores = fetch_scores_for_match_ids(conf, candidate_fd_ids) or {}
@@ -568,7 +783,7 @@ def sync_results_and_settle(conf: Dict[str, str]):
                 continue
             home_score = parse_int(sc.get("home_score"), 0)
             away_score = parse_int(sc.get("away_score"), 0)
-            winner = "DRAW" if home_score == away_score else ("HOME" if home_score > away_score else "AWAY")
+            winner = pnl.winner(home_score, away_score)
             exist = result_by_fd.get(fd) or {}
             meta = meta_by_fd.get(fd, {})
             if (parse_int(exist.get("home_score"), -999) != home_score) or \
@@ -589,10 +804,11 @@ def sync_results_and_settle(conf: Dict[str, str]):
                     "updated_at": datetime.utcnow().isoformat(timespec="seconds"),
                 }
                 upsert_row("result", row, key_col="match_id")
+                written += 1
                 result_by_fd[fd] = row
 
         if result_by_fd:
-            for b in bets_rows:
+            for i, b in enumerate(bets_rows):
                 if (b.get("status") or "").upper() != "OPEN":
                     continue
                 internal_mid = norm_id(b.get("match_id"))
@@ -606,20 +822,49 @@ def sync_results_and_settle(conf: Dict[str, str]):
                 odds = parse_float(b.get("odds"), 1.0) or 1.0
                 pick = (b.get("pick") or "").upper()
                 winner = (res.get("winner") or "").upper()
-                win_flag = (pick == winner)
-                payout = float(stake) * float(odds) if win_flag else 0.0
-                net = payout - float(stake)
+                result, payout, net = pnl.settle(stake, odds, pick, winner)
                 row = dict(b)
                 row.update({
                     "status": "SETTLED",
-                    "result": "WIN" if win_flag else "LOSE",
+                    "result": result,
                     "payout": f"{payout:.2f}",
                     "net": f"{net:.2f}",
                     "settled_at": datetime.utcnow().isoformat(timespec="seconds"),
                 })
                 upsert_row("bets", row, key_col="key")
+                written += 1
+                liability.observe(row)
+                bets_now[i] = row
+                settled_gws.add(_row_gw(b))
     except Exception:
         pass
+    return settled_gws - {None}, bets_now, written
+
+# ★ 確定集計（gw_summary / standings）を精算で変わったGWだけ更新
+#   （集計漏れ・BM変更のGWも拾う）。何か書いたら True
+#   失敗したGWはプロセス内に覚えておき、次の同期でやり直す（stale_gws では拾えない変更もあるため）
+_STANDINGS_RETRY: set = set()
+_STANDINGS_RETRY_LOCK = threading.Lock()
+
+def _refresh_standings(conf: Dict[str, str], settled_gws: set, bets_rows: List[Dict]) -> bool:
+    with _STANDINGS_RETRY_LOCK:
+        gws = set(settled_gws) | _STANDINGS_RETRY
+        _STANDINGS_RETRY.clear()
+    try:
+        season = _current_season(conf)
+        bm_logs = read_rows_by_sheet("bm_log") or []
+        summary = read_rows_if_exists(standings.SUMMARY_SHEET) or []
+        gws |= standings.stale_gws(season, bets_rows, bm_logs, summary)
+        users = [u["username"] for u in get_users(conf)]
+        written = standings.refresh(season, gws, bets_rows, bm_logs, users, summary_rows=summary)
+        return any(written.values())
+    except Exception as e:
+        with _STANDINGS_RETRY_LOCK:
+            _STANDINGS_RETRY.update(gws)
+        labels = ", ".join(f"GW{n}" for n in sorted(gws)) or "-"
+        st.warning(f"集計（{standings.SUMMARY_SHEET} / {standings.STANDINGS_SHEET}）の更新に失敗しました"
+                   f"（{labels}。次回の同期で再実行します）: {e}")
+        return False
 
 # ============================================================
 # ★★★ 追加（BM損益とユーザー総収支の計算ヘルパー）表示専用 ★★★
@@ -627,32 +872,14 @@ def sync_results_and_settle(conf: Dict[str, str]):
 def _bm_net_for_gw(bets_rows: List[Dict], gw_label: str, bm_user: str) -> float:
     """
     指定GWにおけるBMの損益（= 他メンバー確定net合計 × -1）を返す。
-    - 対象は result が WIN/LOSE の確定ベットのみ
+    - 対象は result が WIN/LOSE の確定ベットのみ（payout 未記入は odds から補う）
     - bets.gw は "GW7"/"7" いずれにも対応
     """
     if not bm_user:
         return 0.0
-    # 指定GW・BM以外ユーザー・確定ベット
-    target = [
-        b for b in bets_rows
-        if _gw_equal(b.get("gw"), gw_label)
-        and (b.get("user") or "") != bm_user
-        and (str(b.get("result") or "")).upper() in ("WIN", "LOSE")
-    ]
-    total = 0.0
-    for b in target:
-        stake = parse_int(b.get("stake", 0))
-        payout = parse_float(b.get("payout"), None)
-        if payout is None:
-            # 念のためフォールバック計算（通常はpayout列が埋まっている想定）
-            odds = parse_float(b.get("odds"), 1.0) or 1.0
-            if (str(b.get("result") or "")).upper() == "WIN":
-                payout = stake * odds
-            else:
-                payout = 0.0
-        net = float(payout) - float(stake)
-        total += net
-    return -total  # BM損益
+    gw_n = gw_key(gw_label)
+    per = pnl.settled_by_gw_user(pnl.batch(b for b in bets_rows if _row_gw(b) == gw_n))
+    return pnl.bm_net({u: p - s for (_, u), (_, s, p) in per.items()}, bm_user)
 
 def _user_total_with_bm(bets_rows: List[Dict], bm_logs: List[Dict], users_conf: List[Dict]) -> Dict[str, Dict[str, float]]:
     """
@@ -660,46 +887,8 @@ def _user_total_with_bm(bets_rows: List[Dict], bm_logs: List[Dict], users_conf:
     総収支 = 自分のベットnet（確定のみ） + 自分がBMのGWのBM寄与の合計
     返り値: { username: {"total_net": float, "bet_net": float, "bm_contrib": float} }
     """
-    # ユーザー一覧（configベースで必ず表示対象とする）
-    user_names = [u["username"] for u in users_conf]
-
-    # ユーザー別ベットnet集計（確定のみ）
-    bet_net_by_user = {u: 0.0 for u in user_names}
-    for b in bets_rows:
-        u = b.get("user")
-        if u not in bet_net_by_user:
-            continue
-        if (str(b.get("result") or "")).upper() not in ("WIN", "LOSE"):
-            continue
-        stake = parse_int(b.get("stake", 0))
-        payout = parse_float(b.get("payout"), None)
-        if payout is None:
-            odds = parse_float(b.get("odds"), 1.0) or 1.0
-            payout = (stake * odds) if (str(b.get("result") or "")).upper() == "WIN" else 0.0
-        bet_net_by_user[u] += float(payout) - float(stake)
-
-    # ユーザー別BM寄与集計
-    bm_contrib_by_user = {u: 0.0 for u in user_names}
-    for r in bm_logs or []:
-        gw_label = r.get("gw") or r.get("gw_number")
-        bm_user = str(r.get("bookmaker") or r.get("user") or "").strip()
-        if not gw_label or not bm_user:
-            continue
-        if bm_user not in bm_contrib_by_user:
-            continue
-        bm_contrib_by_user[bm_user] += _bm_net_for_gw(bets_rows, str(gw_label), bm_user)
-
-    # 合成
-    out = {}
-    for u in user_names:
-        bet_net = bet_net_by_user.get(u, 0.0)
-        bm_contrib = bm_contrib_by_user.get(u, 0.0)
-        out[u] = {
-            "total_net": bet_net + bm_contrib,
-            "bet_net": bet_net,
-            "bm_contrib": bm_contrib,
-        }
-    return out
+    return pnl.totals_with_bm(pnl.batch(bets_rows, gw_of=_row_gw), standings.bm_by_gw(bm_logs or []),
+                              [u["username"] for u in users_conf])
 
 # ------------------------------------------------------------
 # UI: トップ（BM表示＋カウンタ）
@@ -744,6 +933,85 @@ def page_home(conf: Dict[str, str], me: Dict):
     badges = " ".join([f'<span class="badge">{u}: {counts.get(u,0)}</span>' for u in users])
     st.markdown(f'<div class="badges">{badges}</div>', unsafe_allow_html=True)
 
+    # ★ 追加：今シーズンの通算（精算時に更新される standings を読むだけ）
+    season = _current_season(conf)
+    table = sorted((r for r in rows(standings.STANDINGS_SHEET, missing_ok=True) or []
+                    if str(r.get("season") or "") == season and r.get("user") in users),
+                   key=lambda r: parse_float(r.get("total_net"), 0.0) or 0.0, reverse=True)
+    if table:
+        st.markdown(f'<div class="section">通算収支（{season}・確定分）</div>', unsafe_allow_html=True)
+        for rank, r in enumerate(table, start=1):
+            st.caption(
+                f"{rank}. {r.get('user')}: {parse_float(r.get('total_net'), 0.0) or 0.0:,.2f}"
+                f"（ベット {parse_float(r.get('bet_net'), 0.0) or 0.0:,.2f} ／ BM {parse_float(r.get('bm_net'), 0.0) or 0.0:,.2f}）"
+            )
+
+    # ★ 追加：管理者向けキャッシュ状況（件数・推定メモリ・hit/miss/evict）
+    if me and me.get("role") == "admin":
+        with st.expander("キャッシュ状況（管理者）", expanded=False):
+            for c in cache_store.all_stats():
+                st.caption(
+                    f"- {c['name']}: {c['entries']}/{c['max_entries']} 件, "
+                    f"{c['bytes'] / 1024 / 1024:,.1f}/{c['max_bytes'] / 1024 / 1024:,.0f} MB, "
+                    f"hit {c['hits']} / miss {c['misses']} / evict {c['evictions']}"
+                )
+                if c["oversize"]:
+                    # 上限を超える値はキャッシュされず毎回読み直しになる → 上限の見直しが必要
+                    st.warning(
+                        f"{c['name']}: 上限超えで保存しなかった値 {c['oversize']} 件"
+                        f"（直近 {c['last_oversize_bytes'] / 1024 / 1024:,.1f} MB）"
+                    )
+        # ★ 反映をあきらめた書き込み（原因を直したら再送）
+        dead = write_journal.dead_letters()
+        if dead:
+            with st.expander(f"シートへ反映できなかった書き込み（{len(dead)} 件）", expanded=False):
+                for e in dead[-20:]:
+                    st.caption(f"- {e.get('sheet')} {e.get('row', {}).get('key') or ''}: "
+                               f"{e.get('error')}（{e.get('attempts')} 回）")
+                if st.button("再送する", key="btn_wal_requeue"):
+                    st.toast(f"{write_journal.requeue_dead_letters()} 件を再送に戻しました。", icon="✅")
+                    st.rerun()
+        # ★ 追加：確定済みGWのアーカイブ（ホットなシートを小さく保つ）
+        with st.expander("データのアーカイブ（管理者）", expanded=False):
+            season = _current_season(conf)
+            st.caption(
+                f"全ベットが確定済みの過去GWを {season} シーズンのアーカイブシートへ移し、"
+                f"集計を {archive.SUMMARY_SHEET} に残します。"
+            )
+            include_active = st.checkbox("アクティブGWも含める（シーズン終了後）", key="archive_include_active")
+            if st.button("アーカイブを実行", key="btn_archive_run"):
+                active_n = gw_key(get_active_gw_label(conf)) or 0
+                if include_active:
+                    active_n += 1
+                try:
+                    with st.spinner("アーカイブ中…"):
+                        res = archive.run(season, active_n, users)
+                except Exception as e:
+                    st.error(f"アーカイブに失敗しました: {e}")
+                else:
+                    if res["gws"] or res["access_log"]:
+                        moved = ", ".join(f"{k} {v}件" for k, v in res["moved"].items())
+                        st.success(
+                            f"アーカイブしました：{', '.join(res['gws']) or '-'}（{moved or '-'}）"
+                            f"／access_log {res['access_log']}件"
+                        )
+                        _bump_data_rev()
+                    else:
+                        st.info("アーカイブ対象はありません。")
+        # ★ 追加：分析用の Parquet エクスポート（season/GW パーティション）
+        with st.expander("分析用エクスポート（管理者）", expanded=False):
+            season = _current_season(conf)
+            done = season_export.exported_seasons()
+            st.caption(f"エクスポート済み: {', '.join(done) if done else 'なし'}")
+            if st.button(f"{season} シーズンを Parquet に書き出す", key="btn_export_season"):
+                try:
+                    with st.spinner("書き出し中…"):
+                        counts = season_export.export_season(season)
+                    analytics.refresh()
+                    st.success("書き出しました：" + ", ".join(f"{k} {v}行" for k, v in counts.items()))
+                except Exception as e:
+                    st.error(f"書き出しに失敗しました: {e}")
+
 # ------------------------------------------------------------
 # UI: 試合とベット（GW基準＝get_active_gw_label）
 # ------------------------------------------------------------
@@ -760,7 +1028,9 @@ def page_matches_and_bets(conf: Dict[str, str], me: Dict):
         return
 
     bets_all = rows("bets")
-    my_gw_bets = [b for b in bets_all if (b.get("user") == me["username"] and (b.get("gw") == gw_name or b.get("gw") == gw_name.replace("GW","")))]
+    _seed_liability()
+    gw_n = gw_key(gw_name)
+    my_gw_bets = [b for b in bets_all if (b.get("user") == me["username"] and _row_gw(b) == gw_n)]
     my_total = sum(parse_int(b.get("stake", 0)) for b in my_gw_bets)
     max_total = parse_int(conf.get("max_total_stake_per_gw", 5000), 5000)
     st.markdown(f'<div class="kpi-row"><div class="kpi"><div class="h">このGWのあなたの投票合計</div><div class="v">{my_total:,} / 上限 {max_total:,}</div></div></div>', unsafe_allow_html=True)
@@ -923,10 +1193,12 @@ def page_matches_and_bets(conf: Dict[str, str], me: Dict):
                     "result": "", "payout": "", "net": "", "settled_at": "",
                 }
                 upsert_row("bets", row, key_col="key")
+                liability.observe(row)
                 saved += 1
 
             if saved > 0:
                 st.success(f"ベットを一括保存しました（更新 {saved} 件）。")
+                render_write_status()
             if skipped:
                 msg = " / ".join([f"{k}: {reason}" for k, reason in skipped])
                 st.info(f"スキップ：{msg}")
@@ -940,15 +1212,32 @@ def page_history(conf: Dict[str, str], me: Dict):
     render_refresh_bar("history")
     st.markdown("## 履歴")
 
-    bets = rows("bets")
-    if not bets:
+    hot_bets = rows("bets")
+    season_now = _current_season(conf)
+    # ★ アーカイブ済みGW（gw_summary）も選択肢に含める（明細は選ばれた時だけ読む）
+    archived = {}
+    for r in _archived_summaries():
+        n, season = _row_gw(r), str(r.get("season") or "")
+        if n is not None and season:
+            label = f"GW{n}" if season == season_now else f"{season} GW{n}"
+            archived[label] = (season, n)
+    if not hot_bets and not archived:
         st.info("履歴はまだありません。")
         return
 
-    gw_vals = {(b.get("gw") if b.get("gw") not in (None, "") else "") for b in bets}
-    # ▼ 改修：降順＆最新GWをデフォルト表示
-    gw_set = sorted(gw_vals, key=_gw_sort_key, reverse=True)
-    sel_gw = st.selectbox("表示するGW", gw_set, index=0 if gw_set else None, key="hist_gw")
+    gw_vals = {_row_gw(b) for b in hot_bets} - {None}
+    # ▼ 改修：降順＆最新GWをデフォルト表示（GW番号で重複なく並べる）
+    gw_set = [f"GW{n}" for n in sorted(gw_vals, reverse=True)]
+    gw_set += [label for label, _ in sorted(archived.items(), key=lambda kv: kv[1], reverse=True)
+               if label not in gw_set]
+    sel_label_gw = st.selectbox("表示するGW", gw_set, index=0 if gw_set else None, key="hist_gw")
+    if sel_label_gw in archived and sel_label_gw not in [f"GW{n}" for n in gw_vals]:
+        arch_season, sel_gw_n = archived[sel_label_gw]
+        bets = _archived_rows("bets", arch_season)
+    else:
+        arch_season, sel_gw_n = None, gw_key(sel_label_gw)
+        bets = hot_bets
+    sel_gw = f"GW{sel_gw_n}"
 
     all_users = sorted({b.get("user") for b in bets if b.get("user")})
     my_name = me.get("username")
@@ -979,6 +1268,14 @@ def page_history(conf: Dict[str, str], me: Dict):
     sel_user = info["user"]
     viewing_bm_summary = info["is_bm_label"]  # BM選択時はサマリーのみ表示
 
+    # ★ 追加：エクスポート済みシーズンの GW 別成績（DuckDB、シートは読まない）
+    if season_export.exported_seasons() and analytics.available():
+        with st.expander(f"{sel_user} の GW 別成績（エクスポート済みデータ）", expanded=False):
+            try:
+                st.dataframe(analytics.user_history(sel_user), use_container_width=True, hide_index=True)
+            except Exception as e:
+                st.info(f"分析データを読めませんでした: {e}")
+
     # ★ BMサマリー表示モード
     if viewing_bm_summary:
         # BM損益 = 他メンバー確定ベットnet合計 × -1
@@ -998,7 +1295,7 @@ def page_history(conf: Dict[str, str], me: Dict):
         return
 
     # ★ 従来どおり：選択ユーザーのベット明細（BMラベルでない通常表示）
-    target = [b for b in bets if (_gw_equal(b.get("gw"), sel_gw) and b.get("user") == sel_user)]
+    target = [b for b in bets if (_row_gw(b) == sel_gw_n and b.get("user") == sel_user)]
     if not target:
         st.info("対象のデータがありません。")
         return
@@ -1016,12 +1313,11 @@ def page_history(conf: Dict[str, str], me: Dict):
     """
     st.markdown(kpi_html, unsafe_allow_html=True)
 
-    odds_rows = rows("odds") or []
+    odds_rows = (_archived_rows("odds", arch_season) if arch_season else rows("odds")) or []
     away_lut = {}
     for r in odds_rows:
-        gw = str(r.get("gw") or "")
         mid = str(r.get("match_id") or "")
-        away_lut[(gw, mid)] = r.get("away", "")
+        away_lut[(_row_gw(r), mid)] = r.get("away", "")
 
     def row_view(b):
         stake = parse_int(b.get("stake", 0))
@@ -1032,12 +1328,12 @@ def page_history(conf: Dict[str, str], me: Dict):
         if pick == "HOME":
             pred_team = b.get("match", "")
         elif pick == "AWAY":
-            pred_team = away_lut.get((b.get("gw"), str(b.get("match_id"))), "AWAY")
+            pred_team = away_lut.get((_row_gw(b), str(b.get("match_id"))), "AWAY")
         else:
             pred_team = "Draw"
 
         if result in ["WIN", "LOSE"]:
-            payout = parse_float(b.get("payout"), stake * odds if result == "WIN" else 0.0) or 0.0
+            stake, payout = pnl.settled_amounts(b)
             net = payout - stake
             res_tag = "Hit!!" if result == "WIN" else "Miss"
             # ▼ 改修：ユーザー名を表示しない
@@ -1048,6 +1344,28 @@ def page_history(conf: Dict[str, str], me: Dict):
     for b in target:
         row_view(b)
 
+# ------------------------------------------------------------
+# 時点損益グラフ（live_pnl）の取得
+#  - (用途, GW, キャッシュ世代) ごとに1つ。スコア更新の再実行では
+#    状態が変わった試合のベットだけ計算し直す
+# ------------------------------------------------------------
+def _live_specs(gw_bets: List, in2fd: Dict[str, str], odds_by_fd: Dict[str, Mapping]) -> List[live_pnl.BetSpec]:
+    """ベット行 → (fd, stake, odds) 解決済みの BetSpec（odds 未記入は odds 表で補う）"""
+    def resolve(b):
+        fd = in2fd.get(norm_id(b.get("match_id")))
+        odds = parse_float(b.get("odds"), None)
+        if odds is None:
+            odds_key = {"HOME": "home_win", "DRAW": "draw", "AWAY": "away_win"}.get(b.get("pick") or "")
+            odds = parse_float((odds_by_fd.get(fd) or {}).get(odds_key), 1.0) if fd else 1.0
+        return fd, parse_int(b.get("stake", 0)), odds
+
+    return live_pnl.specs(gw_bets, resolve)
+
+
+def _live_graph(scope: str, gw_n: int, specs: List[live_pnl.BetSpec], scores: Dict) -> live_pnl.LivePnlGraph:
+    return live_pnl.graph((scope, gw_n, _data_rev()), specs, scores)
+
+
 # ------------------------------------------------------------
 # UI: リアルタイム（GW基準＝get_active_gw_label）
 #   ★ 改修：今節の「全試合」（過去・進行中・未来）を対象に表示
@@ -1058,17 +1376,17 @@ def page_realtime(conf: Dict[str, str], me: Dict):
     st.caption("更新ボタンで最新スコアを手動取得。自動更新はしません。")
 
     gw = get_active_gw_label(conf)
+    gw_n = gw_key(gw)
     matches_raw = _fetch_matches_by_gw_any(conf, gw)
 
     # APIに載っている今節の全試合メタ
-    api_ids = [norm_id(m["id"]) for m in matches_raw]
     api_meta = {norm_id(m["id"]): {"home": m["home"], "away": m["away"], "utc_kickoff": m.get("utc_kickoff")} for m in matches_raw}
 
     # 今節の odds / bets を取得
     odds_rows = rows("odds")
     bets_rows = rows("bets")
-    gw_odds = [r for r in odds_rows if str(r.get("gw", "")) == str(gw)]
-    gw_bets = [r for r in bets_rows if str(r.get("gw", "")) == str(gw)]
+    gw_odds = [r for r in odds_rows if _row_gw(r) == gw_n]
+    gw_bets = [r for r in bets_rows if _row_gw(r) == gw_n]
 
     # 内部match_id → API(fd)の対応
     in2fd = {}
@@ -1081,23 +1399,14 @@ def page_realtime(conf: Dict[str, str], me: Dict):
     def has_teams(r):
         return bool(str(r.get("home","")).strip() and str(r.get("away","")).strip())
 
-    # odds/bets からも候補IDを補強
-    odds_ids = [norm_id(r.get("fd_match_id")) for r in gw_odds if r.get("fd_match_id") and has_teams(r)]
-    bet_ids = []
-    for r in gw_bets:
-        internal_mid = norm_id(r.get("match_id"))
-        fd = in2fd.get(internal_mid)
-        if fd:
-            bet_ids.append(fd)
-
     # APIに無いが odds にチーム名がある試合はメタも補完
     for r in gw_odds:
         fd = norm_id(r.get("fd_match_id"))
         if fd and fd not in api_meta and has_teams(r):
             api_meta[fd] = {"home": r.get("home"), "away": r.get("away"), "utc_kickoff": None}
 
-    # ★ 今節の全試合ID（過去・現在・未来すべて）
-    all_ids = sorted(list({*api_ids, *odds_ids, *bet_ids}))
+    # ★ 今節の全試合ID（過去・現在・未来すべて：API・odds・bets から補強）
+    all_ids = _active_gw_score_ids(conf, gw)
 
     # スコア取得（結果・進行状況を含む）
     scores = api_scores(conf, all_ids)
@@ -1109,37 +1418,14 @@ def page_realtime(conf: Dict[str, str], me: Dict):
             odds_by_fd[fd] = r
 
     # 時点ペイアウト（終了→確定値／進行中→現在スコア基準／未開始→0）
-    def current_payout(b):
-        internal_mid = norm_id(b.get("match_id"))
-        fd = in2fd.get(internal_mid)
-        if not fd:
-            return 0.0
-        stake = parse_int(b.get("stake", 0))
-        pick = (b.get("pick") or "")
-        odds = parse_float(b.get("odds"), None)
-        if odds is None:
-            odrow = odds_by_fd.get(fd, {})
-            odds_key = {"HOME":"home_win","DRAW":"draw","AWAY":"away_win"}.get(pick)
-            odds = parse_float(odrow.get(odds_key), 1.0)
-        sc = scores.get(fd) or {}
-        status = (sc.get("status") or "").upper()
-        hs, as_ = parse_int(sc.get("home_score", 0), 0), parse_int(sc.get("away_score", 0), 0)
-
-        if status in ("SCHEDULED", "TIMED", "POSTPONED"):
-            return 0.0
-        if status in ("FINISHED", "AWARDED"):
-            winner = "DRAW" if hs == as_ else ("HOME" if hs > as_ else "AWAY")
-            return stake * odds if pick == winner else 0.0
-        # 進行中
-        if hs == as_:
-            return stake * odds if pick == "DRAW" else 0.0
-        winner_now = "HOME" if hs > as_ else "AWAY"
-        return stake * odds if pick == winner_now else 0.0
+    #   試合→ベット→ユーザー合計のグラフで、状態が変わった試合の分だけ再計算
+    specs = _live_specs(gw_bets, in2fd, odds_by_fd)
+    live = _live_graph("realtime", gw_n, specs, scores)
 
     # KPI（今節の全ベットで集計）
-    this_gw_bets = [b for b in bets_rows if (b.get("gw") == gw)]
-    total_stake = sum(parse_int(b.get("stake", 0)) for b in this_gw_bets)
-    total_curr = sum(current_payout(b) for b in this_gw_bets)
+    this_gw_bets = gw_bets
+    total_stake, total_curr = live.totals()
+    total_stake = int(total_stake)
     total_net = total_curr - total_stake
 
     st.markdown(
@@ -1158,23 +1444,14 @@ def page_realtime(conf: Dict[str, str], me: Dict):
     current_bm = get_bookmaker_for_gw(gw)
     if users:
         st.markdown('<div class="section">ユーザー別の時点収支</div>', unsafe_allow_html=True)
-        user_net = {}
-        for u in users:
-            ub = [b for b in this_gw_bets if b.get("user") == u]
-            ustake = sum(parse_int(b.get("stake", 0)) for b in ub)
-            upayout = sum(current_payout(b) for b in ub)
-            user_net[u] = upayout - ustake
-
-        if current_bm:
-            others_net_sum = sum(v for k, v in user_net.items() if k != current_bm)
-            user_net[current_bm] = -others_net_sum
+        user_totals = live.user_totals()
+        user_net = live.user_net(current_bm)
 
         disp_users = list(users)
         cols = st.columns(max(2, min(4, len(disp_users))))
         for i, u in enumerate(disp_users):
-            ub = [b for b in this_gw_bets if b.get("user") == u]
-            ustake = sum(parse_int(b.get("stake", 0)) for b in ub)
-            upayout = sum(current_payout(b) for b in ub)
+            ustake, upayout = user_totals.get(u, (0.0, 0.0))
+            ustake = int(ustake)
             unat = user_net.get(u, upayout - ustake)
             with cols[i % len(cols)]:
                 st.markdown(
@@ -1184,6 +1461,46 @@ def page_realtime(conf: Dict[str, str], me: Dict):
                     unsafe_allow_html=True
                 )
 
+    # ★ シナリオ：ベットのある未終了の試合が HOME/DRAW/AWAY のどれで終わるか、全組み合わせで評価
+    if users:
+        bet_fds = sorted({s.fd for s in specs if s.fd})
+        # 精算済みのベットは記録済みの払戻で固定（スコアが取れなくても未終了扱いにしない）
+        settled = {sp.key: pnl.settled_amounts(b)[1] for sp, b in zip(specs, gw_bets) if pnl.is_settled(b)}
+        scen = scenarios.cached((gw_n, _data_rev()), specs, scores, bet_fds, current_bm, settled)
+        n_open = len(scen.open_fds) if scen is not None else \
+            sum(1 for o in scenarios.fixed_outcomes(scores, bet_fds).values() if o is None)
+        with st.expander(f"シナリオ（残り {n_open} 試合・{3 ** n_open:,} 通り）", expanded=False):
+            if scen is None:
+                st.info(f"未終了の試合が多すぎるため省略（{scenarios.MAX_OPEN} 試合まで）。")
+            elif not scen.open_fds:
+                st.caption("ベットのある試合はすべて終了しています。")
+            else:
+                def _label(fd, o):
+                    info = api_meta.get(fd, {})
+                    return {"HOME": info.get("home", "HOME"), "AWAY": info.get("away", "AWAY")}.get(o, "Draw")
+
+                def _outcomes_text(d):
+                    return " / ".join(_label(fd, o) for fd, o in d.items())
+
+                st.dataframe(
+                    [{"ユーザー": f'{e["user"]}{"（BM）" if e["user"] == current_bm else ""}',
+                      "最良": round(e["best"], 2), "最悪": round(e["worst"], 2),
+                      "首位の割合": f'{e["lead_share"]:.1%}',
+                      "最良になる結果": _outcomes_text(e["best_outcomes"]),
+                      "最悪になる結果": _outcomes_text(e["worst_outcomes"])}
+                     for e in scenarios.extremes(scen)],
+                    use_container_width=True, hide_index=True,
+                )
+                sw = [w for w in scenarios.swings(scen) if w["swing"]]
+                if sw:
+                    st.markdown("**首位が入れ替わる試合**（結果別に最も多く首位になるユーザー）")
+                    for w in sw:
+                        info = api_meta.get(w["fd"], {})
+                        parts = [f'{_label(w["fd"], o)} → {u}（{share:.0%}）' for o, (u, share) in w["leaders"].items()]
+                        st.caption(f'- {info.get("home", "?")} vs {info.get("away", "?")}：' + "　".join(parts))
+                else:
+                    st.caption("どの試合の結果でも首位は変わりません。")
+
     # ★ 試合別（今節の全試合：過去・進行中・未来）
     st.markdown('<div class="section">試合別（現在スコアに基づく暫定：今節の全試合）</div>', unsafe_allow_html=True)
 
@@ -1203,12 +1520,12 @@ def page_realtime(conf: Dict[str, str], me: Dict):
         status = s.get("status", "-")
         hs, as_ = parse_int(s.get("home_score", 0), 0), parse_int(s.get("away_score", 0), 0)
         st.markdown(f"**{info['home']} vs {info['away']}**　（{status}　{hs}-{as_}）")
-        rows_ = [b for b in this_gw_bets if bet_fd(b) == fd]
+        rows_ = [(i, b) for i, b in enumerate(this_gw_bets) if bet_fd(b) == fd]
         if not rows_:
             st.caption("（ベットなし）")
             continue
-        for b in rows_:
-            cp = current_payout(b)
+        for i, b in rows_:
+            cp = live.payout(specs[i].key)
             st.caption(f"- {b.get('user')}：{b.get('pick')} / {b.get('stake')} at {b.get('odds')} → 時点 {cp:,.2f}")
 
     st.button("スコアを更新", use_container_width=True)
@@ -1222,27 +1539,27 @@ def page_dashboard(conf: Dict[str, str], me: Dict):
     st.markdown("## ダッシュボード")
 
     bets = rows("bets")
-    if not bets:
+    summaries = rows(standings.SUMMARY_SHEET, missing_ok=True) or []
+    if not bets and not summaries:
         st.info("データがありません。")
         return
 
     users_conf = get_users(conf)
-    bm_logs = rows("bm_log") or []
-
-    # ▼ 既存（確定のみ）合計（参考として保持）
-    totals_settled = _user_total_with_bm(bets, bm_logs, users_conf)
+    season_now = _current_season(conf)
 
     # ▼ 新規：見込みを含めるか
     include_proj = st.checkbox("見込みを含める（LIVE評価）", value=True)
 
-    # ▼ 以降、GWごとに「確定」「見込み」を集計
+    # ▼ 確定分は精算時に更新される gw_summary／standings を読むだけ。
+    #   生の bets から作るのは見込み（OPEN のベットがあるGW）だけ
     odds_rows = rows("odds") or []
-    all_gw = sorted({b.get("gw") for b in bets if b.get("gw")}, key=_gw_sort_key, reverse=True)
+    open_bets = [b for b in bets if (str(b.get("status") or "")).upper() == "OPEN"]
+    open_gws = sorted({_row_gw(b) for b in open_bets} - {None}, reverse=True)
 
-    # ヘルパ：GW内の in→fd 対応とスコアを準備
-    def _prep_gw(gw_label: str):
+    # ヘルパ：GW内の in→fd 対応とスコアを準備し、OPEN ベットの時点ペイアウトのグラフを返す
+    def _prep_gw(gw_n: int):
         in2fd = {}
-        gw_odds = [r for r in odds_rows if _gw_equal(r.get("gw"), gw_label)]
+        gw_odds = [r for r in odds_rows if _row_gw(r) == gw_n]
         for r in gw_odds:
             in_id = norm_id(r.get("match_id"))
             fd_id = norm_id(r.get("fd_match_id"))
@@ -1251,31 +1568,16 @@ def page_dashboard(conf: Dict[str, str], me: Dict):
         fd_ids = sorted({v for v in in2fd.values() if v})
         scores = api_scores(conf, fd_ids) if fd_ids else {}
         odds_by_fd = {norm_id(r.get("fd_match_id")): r for r in gw_odds if r.get("fd_match_id")}
-        def current_payout(b):
-            internal_mid = norm_id(b.get("match_id"))
-            fd = in2fd.get(internal_mid)
-            if not fd:
-                return 0.0
-            stake = parse_int(b.get("stake", 0))
-            pick = (b.get("pick") or "")
-            odds = parse_float(b.get("odds"), None)
-            if odds is None:
-                odrow = odds_by_fd.get(fd, {})
-                odds_key = {"HOME":"home_win","DRAW":"draw","AWAY":"away_win"}.get(pick)
-                odds = parse_float(odrow.get(odds_key), 1.0)
-            sc = scores.get(fd) or {}
-            status = (sc.get("status") or "").upper()
-            hs, as_ = parse_int(sc.get("home_score", 0), 0), parse_int(sc.get("away_score", 0), 0)
-            if status in ("SCHEDULED", "TIMED", "POSTPONED"):
-                return 0.0
-            if status in ("FINISHED", "AWARDED"):
-                winner = "DRAW" if hs == as_ else ("HOME" if hs > as_ else "AWAY")
-                return stake * odds if pick == winner else 0.0
-            if hs == as_:
-                return stake * odds if pick == "DRAW" else 0.0
-            winner_now = "HOME" if hs > as_ else "AWAY"
-            return stake * odds if pick == winner_now else 0.0
-        return in2fd, scores, current_payout
+        gw_open = [b for b in open_bets if _row_gw(b) == gw_n]
+        return _live_graph("dashboard_open", gw_n, _live_specs(gw_open, in2fd, odds_by_fd), scores)
+
+    # ★ 見込み対象GWのスコア取得を先に並列で投げておく（_prep_gw はキャッシュに合流するだけ）
+    rev = _data_rev()
+    for gw_n in open_gws:
+        fd_ids = sorted({norm_id(r.get("fd_match_id")) for r in odds_rows
+                         if _row_gw(r) == gw_n and r.get("fd_match_id")})
+        if fd_ids:
+            prefetch.submit(api_scores, conf, fd_ids, rev=rev)
 
     usernames = [u["username"] for u in users_conf]
 
@@ -1283,41 +1585,49 @@ def page_dashboard(conf: Dict[str, str], me: Dict):
     agg_confirmed = {u: 0.0 for u in usernames}
     agg_projected = {u: 0.0 for u in usernames}
 
+    # 確定：gw_summary を (season, GW) ごとに
+    summary_by_gw: Dict[Tuple[str, int], Dict[str, Mapping]] = {}
+    for r in summaries:
+        season, n = str(r.get("season") or ""), _row_gw(r)
+        if n is not None and season:
+            summary_by_gw.setdefault((season, n), {})[r.get("user")] = r
+    # ★ 手修正等で明細と集計が食い違うGW（stale_gws）は、次の同期を待たずに明細から作り直して表示
+    #   standings 側の stake / payout も同じ差分だけ補正する
+    settled_delta = {u: [0.0, 0.0] for u in usernames}
+    bm_logs = rows("bm_log") or []
+    stale_now = standings.stale_gws(season_now, bets, bm_logs, summaries)
+    if stale_now:
+        bms = standings.bm_by_gw(bm_logs)
+        for n in stale_now:
+            old_recs = summary_by_gw.get((season_now, n), {})
+            live = standings.summarize_gw(season_now, n, [b for b in bets if _row_gw(b) == n], usernames, bms.get(n, ""))
+            for r in live:
+                u, prev = r["user"], old_recs.get(r["user"], {})
+                settled_delta[u][0] += r["stake"] - (parse_float(prev.get("stake"), 0.0) or 0.0)
+                settled_delta[u][1] += r["payout"] - (parse_float(prev.get("payout"), 0.0) or 0.0)
+            summary_by_gw[(season_now, n)] = {r["user"]: r for r in live}
+    gw_keys = set(summary_by_gw) | {(season_now, n) for n in open_gws}
+
     # ▼ GWごとの内訳を保持して後で表示
     gw_breakdowns = []  # [(gw_label, {user: (total, confirmed, projected)}, bm_user)]
 
-    for gw in all_gw:
-        gw_bets = [b for b in bets if _gw_equal(b.get("gw"), gw)]
-        if not gw_bets:
-            continue
-        in2fd, scores, curr_fn = _prep_gw(gw)
-        bm_user = get_bookmaker_for_gw(gw)
+    for season, gw_n in sorted(gw_keys, reverse=True):
+        recs = summary_by_gw.get((season, gw_n), {})
+        bm_user = next((u for u, r in recs.items() if str(r.get("role") or "").upper() == "BM"), "")
+        if season == season_now and not bm_user:
+            bm_user = get_bookmaker_for_gw(gw_n)
 
-        confirmed_by_user = {u: 0.0 for u in usernames}
+        confirmed_by_user = {u: (parse_float(recs[u].get("total_net"), 0.0) or 0.0) if u in recs else 0.0
+                             for u in usernames}
         projected_by_user = {u: 0.0 for u in usernames}
 
-        for u in usernames:
-            ub = [b for b in gw_bets if b.get("user") == u]
-            # 確定
-            for b in ub:
-                if (str(b.get("result") or "")).upper() in ("WIN", "LOSE"):
-                    stake = parse_int(b.get("stake", 0))
-                    payout = parse_float(b.get("payout"), None)
-                    if payout is None:
-                        odds = parse_float(b.get("odds"), 1.0) or 1.0
-                        payout = stake * odds if (str(b.get("result")).upper()=="WIN") else 0.0
-                    confirmed_by_user[u] += float(payout) - float(stake)
-            # 見込み（OPENのみ）
-            for b in ub:
-                if (str(b.get("status") or "")).upper() == "OPEN":
-                    projected_by_user[u] += curr_fn(b) - parse_int(b.get("stake", 0))
-
-        # BM 反映（確定／見込み）
-        if bm_user:
-            others_conf = sum(v for k, v in confirmed_by_user.items() if k != bm_user)
-            others_proj = sum(v for k, v in projected_by_user.items() if k != bm_user)
-            confirmed_by_user[bm_user] += -others_conf
-            projected_by_user[bm_user] += -others_proj
+        # 見込み（OPENのみ）
+        if season == season_now and gw_n in open_gws:
+            for u, (ustake, upayout) in _prep_gw(gw_n).user_totals().items():
+                if u in projected_by_user:
+                    projected_by_user[u] += upayout - ustake
+            if bm_user in projected_by_user:
+                projected_by_user[bm_user] += -sum(v for k, v in projected_by_user.items() if k != bm_user)
 
         # 合計と集約
         totals_by_user = {}
@@ -1326,7 +1636,22 @@ def page_dashboard(conf: Dict[str, str], me: Dict):
             agg_projected[u] += projected_by_user[u]
             totals_by_user[u] = (confirmed_by_user[u] + projected_by_user[u], confirmed_by_user[u], projected_by_user[u])
 
-        gw_breakdowns.append((gw, totals_by_user, bm_user))
+        label = f"GW{gw_n}" if season == season_now else f"{season} GW{gw_n}"
+        gw_breakdowns.append((label, totals_by_user, bm_user))
+
+    # stake / payout（確定）は今シーズンの standings（＋食い違うGWの補正）＋未確定ベットの stake
+    settled_stake = {u: int(round(d[0])) for u, d in settled_delta.items()}
+    settled_payout = {u: d[1] for u, d in settled_delta.items()}
+    for r in rows(standings.STANDINGS_SHEET, missing_ok=True) or []:
+        u = r.get("user")
+        if u in settled_stake and str(r.get("season") or "") == season_now:
+            settled_stake[u] += int(parse_float(r.get("stake"), 0.0) or 0.0)
+            settled_payout[u] += parse_float(r.get("payout"), 0.0) or 0.0
+    open_stake = {u: 0 for u in usernames}
+    for b in bets:
+        u = b.get("user")
+        if u in open_stake and (str(b.get("result") or "")).upper() not in ("WIN", "LOSE"):
+            open_stake[u] += parse_int(b.get("stake", 0))
 
     my_name = me.get("username")
     # 既存KPIの“トータル収支”表示を置換（確定＋見込み or 確定のみ）
@@ -1335,10 +1660,8 @@ def page_dashboard(conf: Dict[str, str], me: Dict):
     total_net_display = my_confirmed + my_projected
 
     # 従来表示の stake/payout は変更せず（確定値）
-    my_bets = [b for b in bets if b.get("user") == my_name]
-    total_stake = sum(parse_int(b.get("stake", 0)) for b in my_bets)
-    total_payout = sum((parse_float(b.get("payout"), 0.0) or 0.0)
-                       for b in my_bets if (b.get("result") in ["WIN", "LOSE"]))
+    total_stake = settled_stake.get(my_name, 0) + open_stake.get(my_name, 0)
+    total_payout = settled_payout.get(my_name, 0.0)
 
     st.markdown(
         f"""
@@ -1360,10 +1683,8 @@ def page_dashboard(conf: Dict[str, str], me: Dict):
         cols = st.columns(max(2, min(4, len(others))))
         for i, u in enumerate(others):
             unat_total = agg_confirmed.get(u, 0.0) + (agg_projected.get(u, 0.0) if include_proj else 0.0)
-            ub = [b for b in bets if b.get("user") == u]
-            ustake = sum(parse_int(b.get("stake", 0)) for b in ub)
-            upayout = sum((parse_float(b.get("payout"), 0.0) or 0.0)
-                          for b in ub if (b.get("result") in ["WIN", "LOSE"]))
+            ustake = settled_stake.get(u, 0) + open_stake.get(u, 0)
+            upayout = settled_payout.get(u, 0.0)
             with cols[i % len(cols)]:
                 st.markdown(
                     f'<div class="kpi"><div class="h">{u}</div>'
@@ -1372,6 +1693,48 @@ def page_dashboard(conf: Dict[str, str], me: Dict):
                     unsafe_allow_html=True
                 )
 
+    # ▼ 追加：シーズン1位の確率（未確定ベットの試合を odds の確率で抽選するモンテカルロ）
+    season_open = [b for b in open_bets if _row_gw(b) is not None]
+    if season_open:
+        with st.expander("シーズン1位の確率（モンテカルロ）", expanded=False):
+            odds_by_match = {(_row_gw(r), norm_id(r.get("match_id"))): r for r in odds_rows}
+            fixed = {}
+            for gw_n in open_gws:
+                in2fd = {norm_id(r.get("match_id")): norm_id(r.get("fd_match_id"))
+                         for r in odds_rows if _row_gw(r) == gw_n and r.get("fd_match_id")}
+                sc_gw = api_scores(conf, sorted(set(in2fd.values()))) if in2fd else {}
+                for mid, fd in in2fd.items():
+                    sc = sc_gw.get(fd) or {}
+                    if str(sc.get("status") or "").upper() in pnl.FINAL:
+                        fixed[(gw_n, mid)] = pnl.winner(sc.get("home_score", 0), sc.get("away_score", 0))
+
+            def _market():
+                base = {u: 0.0 for u in usernames}
+                for r in rows(standings.STANDINGS_SHEET, missing_ok=True) or []:
+                    if str(r.get("season") or "") == season_now and r.get("user") in base:
+                        base[r.get("user")] += parse_float(r.get("total_net"), 0.0) or 0.0
+                mc_bets = []
+                for b in season_open:
+                    gw_n, mid = _row_gw(b), norm_id(b.get("match_id"))
+                    pick = (b.get("pick") or "").upper()
+                    odds = parse_float(b.get("odds"), None)
+                    if odds is None:
+                        odds_key = {"HOME": "home_win", "DRAW": "draw", "AWAY": "away_win"}.get(pick)
+                        odds = parse_float((odds_by_match.get((gw_n, mid)) or {}).get(odds_key), 1.0)
+                    mc_bets.append(montecarlo.OpenBet(b.get("user") or "", gw_n, (gw_n, mid), pick,
+                                                      parse_int(b.get("stake", 0)), odds))
+                bm_by_gw = {n: get_bookmaker_for_gw(n) for n in open_gws}
+                return montecarlo.build_market(mc_bets, odds_by_match, bm_by_gw, base, fixed)
+
+            mc = montecarlo.cached((season_now, _data_rev(), tuple(sorted(fixed.items()))), _market)
+            st.caption(f"確定通算＋未確定ベット（{len(season_open)} 件）の結果を "
+                       f"{montecarlo.N_SIMS:,} 回抽選。確率は odds シートの倍率から（控除分を除いて正規化）。")
+            st.dataframe(
+                [{"ユーザー": r["user"], "1位の確率": f'{r["p_first"]:.1%}', "期待収支": round(r["mean_net"], 2)}
+                 for r in mc if r["user"] in usernames],
+                use_container_width=True, hide_index=True,
+            )
+
     # ▼ 追加：節ごとのユーザー別内訳（最新→過去）
     st.markdown('<div class="section">節ごとのユーザー別内訳（合計 / 確定 / 見込み）</div>', unsafe_allow_html=True)
     for gw, totals_by_user, bm_user in gw_breakdowns:
@@ -1382,6 +1745,54 @@ def page_dashboard(conf: Dict[str, str], me: Dict):
                     tot = conf  # トグルOFF時は確定のみの合計を見せる
                 st.caption(f"- {u}{'（BM）' if u==bm_user else ''}: 合計 {tot:,.2f} ／ 確定 {conf:,.2f} ／ 見込み {proj:,.2f}")
 
+    # ▼ 追加：エクスポート済みシーズンの分析（シートは読まない）
+    seasons = season_export.exported_seasons()
+    if seasons and analytics.available():
+        st.markdown('<div class="section">シーズン分析（エクスポート済みデータ）</div>', unsafe_allow_html=True)
+        with st.expander("ROI（ユーザー別／チーム別／オッズ帯別）", expanded=False):
+            sel_season = st.selectbox("シーズン", ["全シーズン"] + seasons[::-1], key="dash_analytics_season")
+            season_arg = None if sel_season == "全シーズン" else sel_season
+            try:
+                st.caption("ユーザー別")
+                st.dataframe(analytics.roi_by_user(season_arg), use_container_width=True, hide_index=True)
+                st.caption("予想チーム別")
+                st.dataframe(analytics.roi_by_team(season_arg), use_container_width=True, hide_index=True)
+                st.caption("オッズ帯別")
+                st.dataframe(analytics.roi_by_odds_band(season_arg), use_container_width=True, hide_index=True)
+            except Exception as e:
+                st.info(f"分析データを読めませんでした: {e}")
+
+# ------------------------------------------------------------
+# OPEN ベットの一括再設定（オッズ保存後）
+#  - 対象は BM 負債の索引（liability）から引く（保存ごとに bets を全件読まない）
+#    索引はプロセス内の全セッションの書き込みで差分更新され（新規ベット・pick の変更も入る）、
+#    データ更新の度にシートの最新から作り直される
+#  - odds / updated_at の2列だけを update_cols でまとめて書く
+#    （sheets では WAL 経由で1回の batch_update になる）
+# ------------------------------------------------------------
+def reprice_open_bets(gw: str, saved_map: Dict[str, Dict[str, float]]) -> int:
+    """saved_map: {match_id: {"HOME": x, "DRAW": y, "AWAY": z}}。更新したベット数を返す"""
+    # ★ OPEN ベットは負債索引（書き込みの度に差分更新・データ更新の度に最新から作り直し）から引く
+    #   保存の度に bets を全件読まない
+    _seed_liability()
+    by_match = liability.open_bets(gw)
+    now = datetime.utcnow().isoformat(timespec="seconds")
+    updates = []
+    for mid, new in saved_map.items():
+        for key, pick, old_odds in by_match.get(str(mid), []):
+            new_odds = new.get(pick)
+            if not new_odds:
+                continue
+            # 変更不要ならスキップ（小数誤差も考慮しつつ）
+            if abs(float(old_odds) - float(new_odds)) < 1e-9:
+                continue
+            updates.append({"key": key, "odds": f"{float(new_odds):.2f}", "updated_at": now})
+    if updates:
+        update_cols("bets", updates, key_col="key")
+        for u in updates:
+            liability.observe(u)
+    return len(updates)
+
 # ------------------------------------------------------------
 # UI: オッズ管理（GW基準＝get_active_gw_label）
 #   ★ 変更：試合ごとの個別保存 → 「このGWのオッズを一括保存」に統一
@@ -1403,6 +1814,19 @@ def page_odds_admin(conf: Dict[str, str], me: Dict):
     odds_rows = rows("odds")
     odds_by_match = {str(r.get("match_id")): r for r in odds_rows if r.get("match_id")}
 
+    # ★ BM の負債（OPEN ベットの試合×ピック別 stake／払戻）は索引から引くだけ（bets は走査しない）
+    _seed_liability()
+    exposure = liability.exposure(gw)
+    worst = liability.worst_case(gw)
+    if worst:
+        total_stake = sum(w["stake"] for w in worst.values())
+        total_worst = sum(w["bm_net"] for w in worst.values())
+        st.markdown(
+            f'<div class="kpi-row"><div class="kpi"><div class="h">受付 stake（OPEN）</div><div class="v">{total_stake:,.0f}</div></div>'
+            f'<div class="kpi"><div class="h">BM 最悪ケース（全試合）</div><div class="v">{total_worst:,.2f}</div></div></div>',
+            unsafe_allow_html=True,
+        )
+
     # ★ ここから「一括保存」フォーム
     with st.form("odds_bulk_form", clear_on_submit=False):
         for m in matches_raw:
@@ -1411,6 +1835,12 @@ def page_odds_admin(conf: Dict[str, str], me: Dict):
 
             with st.container(border=True):
                 st.markdown(f"**{m['home']} vs {m['away']}**　（{gw}）")
+                w = worst.get(mid)
+                if w:
+                    by_pick = exposure.get(mid, {})
+                    parts = [f"{p} {by_pick[p][0]:,.0f}→{by_pick[p][1]:,.2f}" for p in ("HOME", "DRAW", "AWAY") if p in by_pick]
+                    st.caption(f"受付（stake→払戻）: {' / '.join(parts)}　｜　最悪: {w['pick']} で払戻 {w['payout']:,.2f}"
+                               f"（BM {w['bm_net']:,.2f}）")
 
                 c1, c2, c3, c4 = st.columns([1,1,1,1])
                 with c1:
@@ -1470,39 +1900,10 @@ def page_odds_admin(conf: Dict[str, str], me: Dict):
             except Exception:
                 skipped.append((f"{m['home']} vs {m['away']}", "保存時に予期せぬエラー"))
 
-        # ★ ここから：既存 bets（OPEN）のオッズを最新に上書き
-        #   - 対象: 現在GW == gw、status == OPEN の行
-        #   - pick(HOME/DRAW/AWAY)に応じて新オッズ saved_map[mid] を反映
+        # ★ ここから：既存 bets（OPEN）のオッズを最新に上書き（索引で対象だけ拾い、1回の一括書き込み）
         try:
             if saved_map:
-                bets_rows = read_rows_by_sheet("bets") or []
-                updated = 0
-                for b in bets_rows:
-                    try:
-                        if str(b.get("gw")) != str(gw):
-                            continue
-                        if (str(b.get("status") or "")).upper() != "OPEN":
-                            continue
-                        mid = str(b.get("match_id") or "")
-                        if mid not in saved_map:
-                            continue
-                        pick = (b.get("pick") or "").upper()
-                        new_odds = saved_map[mid].get(pick)
-                        if not new_odds:
-                            continue
-                        # 変更不要ならスキップ（小数誤差も考慮しつつ）
-                        old_odds = parse_float(b.get("odds"), None)
-                        if old_odds is not None and abs(float(old_odds) - float(new_odds)) < 1e-9:
-                            continue
-
-                        row = dict(b)
-                        row["odds"] = f"{float(new_odds):.2f}"
-                        row["updated_at"] = datetime.utcnow().isoformat(timespec="seconds")
-                        upsert_row("bets", row, key_col="key")
-                        updated += 1
-                    except Exception:
-                        continue
-
+                updated = reprice_open_bets(gw, saved_map)
                 if updated > 0:
                     st.success(f"既存ベットのオッズを更新しました（{updated} 件）。")
         except Exception:
@@ -1515,24 +1916,33 @@ def page_odds_admin(conf: Dict[str, str], me: Dict):
             st.info(f"スキップ：{msg}")
 
         # ★ 保存直後に最新を即反映（キャッシュ世代を進め、再描画）
-        st.session_state["_data_rev"] = _data_rev() + 1
-        st.cache_data.clear()
+        _bump_data_rev()
         st.rerun()
 
 # ------------------------------------------------------------
 # メイン
 # ------------------------------------------------------------
 def main():
+    # ★ プロセスで初回だけ、ログイン操作の裏でキャッシュを温めておく
+    prewarm.start(_prewarm_task, 0)
     conf = get_conf()
 
     me = login_ui(conf)
     if not me:
         st.stop()
 
+    _wait_for_prewarm()
+    # ★ 全タブが毎回描画されるので、全ページの依存データをここで並列に読み始める
+    prefetch_for_pages(conf, PAGE_DATA_DEPS.keys())
+
     # ★ ログイン後に一度だけ同期（result更新＆bets精算）
     if not st.session_state.get("_synced_once"):
-        sync_results_and_settle(conf)
+        settled_gws, bets_now, n_written = sync_results_and_settle(conf)
         auto_assign_bm_if_needed(conf)
+        # ★ 精算結果を集計テーブルへ反映し、実際に行を書き換えた時だけ読込キャッシュを新世代に
+        refreshed = _refresh_standings(conf, settled_gws, bets_now)
+        if refreshed or n_written:
+            _bump_data_rev()
         _toast_next_bm_once(conf, me)
         st.session_state["_synced_once"] = True
 
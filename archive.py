@@ -0,0 +1,153 @@
+# archive.py
+from __future__ import annotations
+
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, List, Optional, Sequence
+
+import access_log
+import standings
+import write_journal
+from google_sheets_client import (
+    append_rows,
+    ensure_sheet,
+    read_rows_by_sheet,
+    read_rows_if_exists,
+    replace_rows,
+    upsert_row,
+)
+from util import gw_key
+
+# ------------------------------------------------------------
+# シーズン終了分のアーカイブ（ホットなシートを小さく保つ）
+#  - 全ベットが SETTLED になった過去GWの bets / odds / result を
+#    シーズン別のアーカイブシート（例: bets_archive_2025）へ移す
+#  - GW×ユーザーの集計を gw_summary に残す（ダッシュボードはこれを読む）
+#  - ホットなシートには進行中・今後のGWだけを書き戻す
+#  - access_log は ACCESS_LOG_KEEP_DAYS より古い行を access_log_archive へ
+#  - 順序：アーカイブ追記 → 集計 → ホット書き戻し（途中で落ちても再実行で続きから・重複しない）
+# ------------------------------------------------------------
+HOT_SHEETS = ("bets", "odds", "result")
+SUMMARY_SHEET = standings.SUMMARY_SHEET
+ACCESS_LOG_SHEET = "access_log"
+ACCESS_LOG_KEEP_DAYS = 60
+WAL_WAIT_SEC = 30.0
+
+# 行の同一性（アーカイブへの重複追記防止）
+_ROW_KEYS: Dict[str, Sequence[str]] = {
+    "bets": ("key",),
+    "odds": ("match_id", "gw"),
+    "result": ("match_id",),
+    ACCESS_LOG_SHEET: ("username", "access_time"),
+}
+
+
+def archive_sheet_name(sheet: str, season: Optional[str] = None) -> str:
+    return f"{sheet}_archive_{season}" if season else f"{sheet}_archive"
+
+
+def _gw_of(r) -> Optional[int]:
+    n = gw_key(r.get("gw") or None)
+    return n if n is not None else gw_key(r.get("gw_number") or None)
+
+
+def _row_id(sheet: str, r) -> tuple:
+    return tuple(str(r.get(k, "")) for k in _ROW_KEYS.get(sheet, ()))
+
+
+# ---- 計画（I/O なし）----
+def archivable_gws(bets: Iterable, odds: Iterable, active_gw_n: int) -> List[int]:
+    """アクティブGWより前で、未確定（SETTLED 以外）のベットが1件も無いGW"""
+    seen, open_ = set(), set()
+    for b in bets:
+        n = _gw_of(b)
+        if n is None:
+            continue
+        seen.add(n)
+        if str(b.get("status") or "").upper() != "SETTLED":
+            open_.add(n)
+    seen |= {n for n in (_gw_of(r) for r in odds) if n is not None}
+    return sorted(n for n in seen - open_ if n < active_gw_n)
+
+
+# ---- 実行 ----
+def _move(sheet: str, moving: List[dict], season: Optional[str]) -> int:
+    """アーカイブシートへ追記（既に入っている行は飛ばす）"""
+    if not moving:
+        return 0
+    name = archive_sheet_name(sheet, season)
+    header = list(moving[0].keys())
+    ensure_sheet(name, [h for h in header if not str(h).startswith("_")])
+    have = {_row_id(sheet, r) for r in read_rows_by_sheet(name)}
+    new = [r for r in moving if _row_id(sheet, r) not in have]
+    if new:
+        append_rows(name, new)
+    return len(new)
+
+
+def _archive_access_log(now: datetime) -> int:
+    # 読んでから書き戻すまでの間にライタが追記した行を消さないよう、ライタを止めて行う
+    with access_log.paused():
+        return _archive_access_log_paused(now)
+
+
+def _archive_access_log_paused(now: datetime) -> int:
+    cutoff = now - timedelta(days=ACCESS_LOG_KEEP_DAYS)
+    recs = read_rows_if_exists(ACCESS_LOG_SHEET)
+    old, keep = [], []
+    for r in recs:
+        try:
+            t = datetime.fromisoformat(str(r.get("access_time") or ""))
+            if t.tzinfo is None:
+                t = t.replace(tzinfo=timezone.utc)
+        except ValueError:
+            keep.append(r)
+            continue
+        (old if t < cutoff else keep).append(r)
+    if not old:
+        return 0
+    _move(ACCESS_LOG_SHEET, old, None)
+    replace_rows(ACCESS_LOG_SHEET, keep)
+    return len(old)
+
+
+def run(season: str, active_gw_n: int, usernames: List[str]) -> Dict[str, object]:
+    """
+    アーカイブを実行して件数を返す。
+    ※ 未反映の書き込み（WAL）が残っている間は実行しない（書き戻しで消さないため）
+    """
+    if not write_journal.wait_idle(WAL_WAIT_SEC):
+        raise RuntimeError("シートへ反映待ちの書き込みがあるため、アーカイブを中止しました。")
+
+    hot = {s: [dict(r) for r in read_rows_by_sheet(s)] for s in HOT_SHEETS}
+    gws = archivable_gws(hot["bets"], hot["odds"], active_gw_n)
+    stats: Dict[str, object] = {"gws": [f"GW{n}" for n in gws], "moved": {}, "summary_rows": 0, "access_log": 0}
+    if gws:
+        gw_set = set(gws)
+        bm_by_gw = standings.bm_by_gw(read_rows_by_sheet("bm_log"))
+
+        # 1) アーカイブへ追記
+        for sheet in HOT_SHEETS:
+            moving = [r for r in hot[sheet] if _gw_of(r) in gw_set]
+            stats["moved"][sheet] = _move(sheet, moving, season)
+
+        # 2) 集計を残す（archived=YES：以後の精算では作り直さない）
+        ensure_sheet(SUMMARY_SHEET, standings.SUMMARY_HEADER)
+        for n in gws:
+            gw_bets = [b for b in hot["bets"] if _gw_of(b) == n]
+            for row in standings.summarize_gw(season, n, gw_bets, usernames, bm_by_gw.get(n, ""), archived=True):
+                upsert_row(SUMMARY_SHEET, row, key_cols=standings.SUMMARY_KEY)
+                stats["summary_rows"] += 1
+
+        # 3) ホットなシートには残りだけを書き戻す（直前に読み直して、その間の書き込みを消さない）
+        #    読み直し〜置き換えの間は WAL の再生を止める（保留分は読みに重なり、置き換え後に再生される）
+        if not write_journal.wait_idle(WAL_WAIT_SEC):
+            raise RuntimeError("シートへ反映待ちの書き込みがあるため、書き戻しを中止しました（アーカイブへの追記は済み）。")
+        with write_journal.held(HOT_SHEETS):
+            for sheet in HOT_SHEETS:
+                fresh = read_rows_by_sheet(sheet)
+                keep = [r for r in fresh if _gw_of(r) not in gw_set]
+                if len(keep) != len(fresh):
+                    replace_rows(sheet, keep)
+
+    stats["access_log"] = _archive_access_log(datetime.now(timezone.utc))
+    return stats
@@ -0,0 +1,84 @@
+# bench_decode.py
+# ------------------------------------------------------------
+# シート読込デコードのベンチマーク（オフライン・ネットワーク無し）
+#   python bench_decode.py [行数=20000] [繰り返し=5]
+#  - 合成した bets シート（生値）を、
+#    旧経路（get_all_records 相当：全セル型推測＋行ごと dict）と
+#    新経路（sheet_decode：宣言型で列単位デコード）で変換して比較
+#  - 旧経路は gspread.utils が import できる場合のみ計測
+# ------------------------------------------------------------
+from __future__ import annotations
+
+import random
+import sys
+import time
+
+import sheet_decode
+
+HEADER = ["key", "gw", "user", "match_id", "match", "pick", "stake", "odds",
+          "placed_at", "status", "result", "payout", "net", "settled_at", "updated_at"]
+
+
+def synth_values(n: int, seed: int = 7) -> tuple[list, list]:
+    """(UNFORMATTED_VALUE 相当, FORMATTED_VALUE 相当) の2通りを返す"""
+    rnd = random.Random(seed)
+    raw, fmt = [HEADER], [HEADER]
+    for i in range(n):
+        gw = rnd.randint(1, 38)
+        user = f"user{rnd.randint(1, 12)}"
+        mid = f"{rnd.randint(1, 999):06d}"          # 先頭ゼロ付きの ID
+        stake = rnd.choice((100, 200, 500, 1000))
+        odds = round(rnd.uniform(1.2, 6.0), 2)
+        settled = rnd.random() < 0.7
+        win = settled and rnd.random() < 0.4
+        payout = round(stake * odds) if win else 0
+        ts = f"2025-{rnd.randint(8, 12):02d}-{rnd.randint(1, 28):02d} 12:00:00"
+        row = [f"GW{gw}:{user}:{mid}", f"GW{gw}", user, mid, "Home vs Away",
+               rnd.choice(("HOME", "DRAW", "AWAY")), stake, odds, ts,
+               "SETTLED" if settled else "OPEN", ("WIN" if win else "LOSE") if settled else "",
+               payout if settled else "", (payout - stake) if settled else "", ts if settled else "", ts]
+        raw.append(row)
+        fmt.append(["" if v == "" else str(v) for v in row])
+    return raw, fmt
+
+
+def old_path(values: list) -> list[dict]:
+    from gspread.utils import numericise_all
+    keys = values[0]
+    return [dict(zip(keys, numericise_all(row, empty2zero=False, default_blank=""))) for row in values[1:]]
+
+
+def new_path(values: list) -> list[dict]:
+    return sheet_decode.decode("bets", values).records()
+
+
+def bench(fn, values, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t = time.perf_counter()
+        fn(values)
+        best = min(best, time.perf_counter() - t)
+    return best
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    raw, fmt = synth_values(n)
+    t_new = bench(new_path, raw, repeat)
+    t_cols = bench(lambda v: sheet_decode.decode("bets", v), raw, repeat)
+    print(f"rows={n} repeat={repeat} (best)")
+    print(f"  sheet_decode columns : {t_cols * 1000:8.1f} ms")
+    print(f"  sheet_decode records : {t_new * 1000:8.1f} ms")
+    try:
+        t_old = bench(old_path, fmt, repeat)
+    except ImportError:
+        print("  get_all_records 相当 : (gspread 未インストールのため省略)")
+        return
+    print(f"  get_all_records 相当 : {t_old * 1000:8.1f} ms  (x{t_old / t_new:.1f})")
+    old, new = old_path(fmt[:2]), new_path(raw[:2])
+    print(f"  match_id: old={old[0]['match_id']!r} new={new[0]['match_id']!r}")
+
+
+if __name__ == "__main__":
+    main()
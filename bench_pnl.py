@@ -0,0 +1,212 @@
+# bench_pnl.py
+# ------------------------------------------------------------
+# 損益カーネル（pnl）のベンチマーク＋一致確認（オフライン・ネットワーク無し）
+#   python bench_pnl.py [行数=20000] [繰り返し=5]
+#  - 合成した bets / bm_log / スコアに対して、
+#    旧実装（app.py にあった行ごとの計算をそのまま写したもの）と pnl の結果を突き合わせ、
+#    食い違いがあれば一覧を出して終了コード 1
+#  - 計測は best-of-N（確定分の総収支・GW別 BM 損益・時点ペイアウト）
+#  ※ 時点ペイアウトは列の構築（pnl.batch）込みだと旧実装より遅い。速いのは
+#    構築済みの列を使い回す場合だけ（「同・列構築済み」の行）。画面の時点損益は
+#    pnl.batch ではなく live_pnl の差分グラフ（変わった試合のベットだけ再計算）を使う
+# ------------------------------------------------------------
+from __future__ import annotations
+
+import random
+import sys
+import time
+
+import pnl
+from util import gw_key
+
+USERS = [f"user{i}" for i in range(1, 9)]
+N_GW = 38
+N_MATCH = 10
+TOL = 1e-6
+
+
+def synth(n: int, seed: int = 11):
+    rnd = random.Random(seed)
+    bets = []
+    for i in range(n):
+        gw = rnd.randint(1, N_GW)
+        stake = rnd.choice((100, 200, 500, 1000))
+        odds = round(rnd.uniform(1.2, 6.0), 2)
+        settled = rnd.random() < 0.7
+        win = settled and rnd.random() < 0.4
+        b = {"key": f"k{i}", "gw": f"GW{gw}", "user": rnd.choice(USERS),
+             "match_id": str(gw * 100 + rnd.randint(1, N_MATCH)), "pick": rnd.choice(pnl.OUTCOMES),
+             "stake": stake, "odds": odds if rnd.random() < 0.95 else "",
+             "status": "SETTLED" if settled else "OPEN", "result": ("WIN" if win else "LOSE") if settled else ""}
+        # payout 列は大半が記入済み、一部は空（odds から補う経路）
+        b["payout"] = (round(stake * odds, 2) if win else 0) if settled and rnd.random() < 0.9 else ""
+        bets.append(b)
+    bm_logs = [{"gw": f"GW{g}", "bookmaker": rnd.choice(USERS)} for g in range(1, N_GW + 1)]
+    statuses = ("SCHEDULED", "TIMED", "IN_PLAY", "PAUSED", "FINISHED", "AWARDED", "")
+    scores = {str(g * 100 + m): {"status": rnd.choice(statuses),
+                                 "home_score": rnd.randint(0, 3), "away_score": rnd.randint(0, 3)}
+              for g in range(1, N_GW + 1) for m in range(1, N_MATCH + 1)}
+    return bets, bm_logs, scores
+
+
+# ---- 旧実装（行ごと）----
+def _parse_int(x, default=0):
+    try:
+        return int(x)
+    except Exception:
+        return default
+
+
+def _parse_float(x, default=None):
+    try:
+        return float(x)
+    except Exception:
+        return default
+
+
+def _row_gw(r):
+    return gw_key(r.get("gw") or None)
+
+
+def legacy_bm_net_for_gw(bets_rows, gw_label, bm_user):
+    if not bm_user:
+        return 0.0
+    gw_n = gw_key(gw_label)
+    total = 0.0
+    for b in bets_rows:
+        if _row_gw(b) != gw_n or (b.get("user") or "") == bm_user \
+                or str(b.get("result") or "").upper() not in ("WIN", "LOSE"):
+            continue
+        stake = _parse_int(b.get("stake", 0))
+        payout = _parse_float(b.get("payout"), None)
+        if payout is None:
+            odds = _parse_float(b.get("odds"), 1.0) or 1.0
+            payout = stake * odds if str(b.get("result") or "").upper() == "WIN" else 0.0
+        total += float(payout) - float(stake)
+    return -total
+
+
+def legacy_user_total_with_bm(bets_rows, bm_logs, user_names):
+    bet_net = {u: 0.0 for u in user_names}
+    for b in bets_rows:
+        u = b.get("user")
+        if u not in bet_net or str(b.get("result") or "").upper() not in ("WIN", "LOSE"):
+            continue
+        stake = _parse_int(b.get("stake", 0))
+        payout = _parse_float(b.get("payout"), None)
+        if payout is None:
+            odds = _parse_float(b.get("odds"), 1.0) or 1.0
+            payout = (stake * odds) if str(b.get("result") or "").upper() == "WIN" else 0.0
+        bet_net[u] += float(payout) - float(stake)
+    bm = {u: 0.0 for u in user_names}
+    for r in bm_logs:
+        n, bm_user = _row_gw(r), str(r.get("bookmaker") or "").strip()
+        if n is not None and bm_user in bm:
+            bm[bm_user] += legacy_bm_net_for_gw(bets_rows, n, bm_user)
+    return {u: {"total_net": bet_net[u] + bm[u], "bet_net": bet_net[u], "bm_contrib": bm[u]} for u in user_names}
+
+
+def legacy_current_payout(b, scores):
+    fd = str(b.get("match_id") or "")
+    stake = _parse_int(b.get("stake", 0))
+    pick = b.get("pick") or ""
+    odds = _parse_float(b.get("odds"), None)
+    if odds is None:
+        odds = 1.0
+    sc = scores.get(fd) or {}
+    status = (sc.get("status") or "").upper()
+    hs, as_ = _parse_int(sc.get("home_score", 0), 0), _parse_int(sc.get("away_score", 0), 0)
+    if status in ("SCHEDULED", "TIMED", "POSTPONED"):
+        return 0.0
+    if hs == as_:
+        return stake * odds if pick == "DRAW" else 0.0
+    return stake * odds if pick == ("HOME" if hs > as_ else "AWAY") else 0.0
+
+
+# ---- カーネル経由 ----
+def kernel_totals(bets, bm_logs):
+    bm_by_gw = {_row_gw(r): r["bookmaker"] for r in bm_logs}
+    return pnl.totals_with_bm(pnl.batch(bets, gw_of=_row_gw), bm_by_gw, USERS)
+
+
+def kernel_bm_nets(bets, bm_logs):
+    per = pnl.settled_by_gw_user(pnl.batch(bets, gw_of=_row_gw))
+    nets = {}
+    for (n, u), (_, s, p) in per.items():
+        nets.setdefault(n, {})[u] = nets.get(n, {}).get(u, 0.0) + p - s
+    return {_row_gw(r): pnl.bm_net(nets.get(_row_gw(r), {}), r["bookmaker"]) for r in bm_logs}
+
+
+def kernel_live(bets, scores, cols=None):
+    """試合ごとに結果を1回だけ求め、ベット列をまとめて評価（cols は構築済みなら再利用）"""
+    cols = cols or pnl.batch(bets)
+    by_match = {fd: pnl.live_outcome(sc) for fd, sc in scores.items()}
+    outcomes = [by_match.get(str(b.get("match_id") or "")) for b in bets]
+    return pnl.evaluate(cols, outcomes)[0]
+
+
+def bench(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        t = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t)
+    return best
+
+
+def check(bets, bm_logs, scores) -> list:
+    bad = []
+    old, new = legacy_user_total_with_bm(bets, bm_logs, USERS), kernel_totals(bets, bm_logs)
+    for u in USERS:
+        for k in ("total_net", "bet_net", "bm_contrib"):
+            if abs(old[u][k] - new[u][k]) > TOL:
+                bad.append(f"totals {u}.{k}: {old[u][k]} != {new[u][k]}")
+    nets = kernel_bm_nets(bets, bm_logs)
+    for r in bm_logs:
+        a, b = legacy_bm_net_for_gw(bets, r["gw"], r["bookmaker"]), nets[_row_gw(r)]
+        if abs(a - b) > TOL:
+            bad.append(f"bm_net {r['gw']}: {a} != {b}")
+    # 時点ペイアウトは odds 列が入っているベットで比較（空欄は呼び出し側が odds 表で補う）
+    live = kernel_live(bets, scores)
+    for b, v in zip(bets, live):
+        if b["odds"] != "" and abs(legacy_current_payout(b, scores) - v) > TOL:
+            bad.append(f"live {b['key']}: {legacy_current_payout(b, scores)} != {v}")
+    for b in bets:
+        if b["status"] == "SETTLED" and b["odds"] != "":
+            res, p, _ = pnl.settle(b["stake"], b["odds"], b["pick"], "HOME")
+            if (res == "WIN") != (b["pick"] == "HOME") or abs(p - (b["stake"] * b["odds"] if res == "WIN" else 0)) > TOL:
+                bad.append(f"settle {b['key']}: {res} {p}")
+    return bad
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    bets, bm_logs, scores = synth(n)
+    cols = pnl.batch(bets)
+
+    bad = check(bets, bm_logs, scores)
+    print(f"rows={n} gws={N_GW} repeat={repeat} (best)")
+    print(f"  一致確認               : {'OK' if not bad else f'NG ({len(bad)} 件)'}")
+    for line in bad[:20]:
+        print("    " + line)
+
+    rows = [
+        ("確定 総収支（BM込み）", lambda: legacy_user_total_with_bm(bets, bm_logs, USERS),
+         lambda: kernel_totals(bets, bm_logs)),
+        ("GW別 BM 損益（全GW）", lambda: [legacy_bm_net_for_gw(bets, r["gw"], r["bookmaker"]) for r in bm_logs],
+         lambda: kernel_bm_nets(bets, bm_logs)),
+        ("時点ペイアウト（列構築込み）", lambda: [legacy_current_payout(b, scores) for b in bets],
+         lambda: kernel_live(bets, scores)),
+        ("同・列構築済み", lambda: [legacy_current_payout(b, scores) for b in bets],
+         lambda: kernel_live(bets, scores, cols)),
+    ]
+    for label, old_fn, new_fn in rows:
+        t_old, t_new = bench(old_fn, repeat), bench(new_fn, repeat)
+        print(f"  {label:<13}: 旧 {t_old * 1000:8.1f} ms / pnl {t_new * 1000:8.1f} ms  (x{t_old / t_new:.1f})")
+    print("  ※ 時点ペイアウトは列構築込みでは旧実装より遅い（構築済みの列を使い回す時だけ速い）")
+    sys.exit(1 if bad else 0)
+
+
+if __name__ == "__main__":
+    main()
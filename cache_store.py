@@ -0,0 +1,215 @@
+# cache_store.py
+from __future__ import annotations
+
+import sys
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Mapping
+from concurrent.futures import Future
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Hashable, Optional
+
+# ------------------------------------------------------------
+# プロセス共有のキャッシュ層（リソース別の上限付き LRU）
+#  - 件数上限（max_entries）とバイト上限（max_bytes）の両方で追い出し
+#  - 任意で TTL（秒）
+#  - hit / miss / eviction の統計を保持
+#  - max_bytes を超える単一の値は保存しない（入れた直後に自分ごと追い出して
+#    他の値まで巻き込むのを防ぐ）。件数は oversize に数える
+#  - 同じキーの同時ロードは1回にまとめる（single-flight）
+#  ※ Streamlit はメインスクリプトを毎回再実行するため、
+#    インスタンスはこのモジュール（import は1回）に置く
+# ------------------------------------------------------------
+
+def estimate_size(obj: Any, _seen: Optional[set] = None) -> int:
+    """オブジェクトのおおよそのバイト数（共有オブジェクトは1回だけ数える）"""
+    if _seen is None:
+        _seen = set()
+    oid = id(obj)
+    if oid in _seen:
+        return 0
+    _seen.add(oid)
+    size = sys.getsizeof(obj, 64)
+    if isinstance(obj, (str, bytes, int, float, bool)) or obj is None:
+        return size
+    if isinstance(obj, Mapping):
+        for k, v in obj.items():
+            size += estimate_size(k, _seen) + estimate_size(v, _seen)
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        for v in obj:
+            size += estimate_size(v, _seen)
+    elif hasattr(obj, "__dict__"):
+        size += estimate_size(vars(obj), _seen)
+    return size
+
+
+class BoundedCache:
+    def __init__(self, name: str, max_entries: int = 128,
+                 max_bytes: int = 64 * 1024 * 1024, ttl: Optional[float] = None):
+        self.name = name
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()  # key -> (value, nbytes, stored_at)
+        self._bytes = 0
+        self._inflight: Dict[Hashable, Future] = {}
+        self._epoch = 0   # clear() 毎に進める（クリア前に始まったロード結果は捨てる）
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.oversize = 0
+        self.last_oversize_bytes = 0
+
+    # ---- 内部 ----
+    def _drop(self, key):
+        _, nbytes, _ = self._data.pop(key)
+        self._bytes -= nbytes
+
+    def _expired(self, stored_at: float) -> bool:
+        return self.ttl is not None and (time.monotonic() - stored_at) > self.ttl
+
+    def _evict(self):
+        while self._data and (len(self._data) > self.max_entries or self._bytes > self.max_bytes):
+            oldest = next(iter(self._data))
+            self._drop(oldest)
+            self.evictions += 1
+
+    # ---- 公開API ----
+    def get(self, key: Hashable, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None or self._expired(item[2]):
+                if item is not None:
+                    self._drop(key)
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return item[0]
+
+    def __contains__(self, key: Hashable) -> bool:
+        with self._lock:
+            item = self._data.get(key)
+            return item is not None and not self._expired(item[2])
+
+    def put(self, key: Hashable, value: Any):
+        nbytes = estimate_size(value)
+        with self._lock:
+            if key in self._data:
+                self._drop(key)
+            if nbytes > self.max_bytes:
+                self.oversize += 1
+                self.last_oversize_bytes = nbytes
+                return
+            self._data[key] = (value, nbytes, time.monotonic())
+            self._bytes += nbytes
+            self._evict()
+
+    def discard(self, key: Hashable):
+        """1件だけ捨てる（次の get_or_load で読み直させる）"""
+        with self._lock:
+            if key in self._data:
+                self._drop(key)
+
+    def get_or_load(self, key: Hashable, loader: Callable[[], Any]):
+        _miss = object()
+        value = self.get(key, _miss)
+        if value is not _miss:
+            return value
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None and not self._expired(item[2]):
+                return item[0]
+            fut = self._inflight.get(key)
+            owner = fut is None
+            if owner:
+                fut = Future()
+                self._inflight[key] = fut
+            epoch = self._epoch
+        if not owner:
+            # 他スレッドが読込中 → その結果を待つ
+            return fut.result()
+        try:
+            value = loader()
+            with self._lock:
+                if epoch == self._epoch:
+                    self.put(key, value)
+            fut.set_result(value)
+            return value
+        except BaseException as e:
+            fut.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                if self._inflight.get(key) is fut:
+                    del self._inflight[key]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+            self._epoch += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "name": self.name,
+                "entries": len(self._data),
+                "bytes": self._bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "oversize": self.oversize,
+                "last_oversize_bytes": self.last_oversize_bytes,
+            }
+
+
+# ------------------------------------------------------------
+# キャッシュ世代(rev)の固定
+#  バックグラウンドスレッドは st.session_state を読めないため、
+#  投入側が世代を固定して渡す（app._data_rev() が参照する）
+# ------------------------------------------------------------
+_tls = threading.local()
+
+def rev_override() -> Optional[int]:
+    return getattr(_tls, "rev", None)
+
+@contextmanager
+def pinned_rev(rev: Optional[int]):
+    prev = rev_override()
+    _tls.rev = rev
+    try:
+        yield
+    finally:
+        _tls.rev = prev
+
+
+# ------------------------------------------------------------
+# レジストリ（名前ごとに1インスタンス）
+# ------------------------------------------------------------
+_REGISTRY: Dict[str, BoundedCache] = {}
+_REGISTRY_LOCK = threading.Lock()
+
+def cache(name: str, **limits) -> BoundedCache:
+    """名前付きキャッシュを取得（初回のみ limits で生成）"""
+    with _REGISTRY_LOCK:
+        c = _REGISTRY.get(name)
+        if c is None:
+            c = BoundedCache(name, **limits)
+            _REGISTRY[name] = c
+        return c
+
+def clear_all():
+    with _REGISTRY_LOCK:
+        caches = list(_REGISTRY.values())
+    for c in caches:
+        c.clear()
+
+def all_stats() -> list[dict]:
+    with _REGISTRY_LOCK:
+        caches = list(_REGISTRY.values())
+    return [c.stats() for c in caches]
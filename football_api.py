@@ -1,21 +1,56 @@
 # football_api.py
+import hashlib
+from dataclasses import dataclass, field, replace
 from datetime import datetime, timezone, timedelta
-from typing import Dict, List, Tuple
+from typing import Dict, List, Tuple, Union
 
 import requests
 import pytz
 import streamlit as st
 
-BASE = "https://api.football-data.org/v4"
+from util import gw_key
 
-def _headers(conf: Dict[str, str]) -> Dict[str, str]:
-    token = conf.get("FOOTBALL_DATA_API_TOKEN", "").strip()
-    return {"X-Auth-Token": token} if token else {}
+BASE = "https://api.football-data.org/v4"
 
-def _league_and_season(conf: Dict[str, str]) -> Tuple[str, str]:
-    comp = conf.get("FOOTBALL_DATA_COMPETITION", "2021")  # EPL=2021
-    season = conf.get("API_FOOTBALL_SEASON", "2025")
-    return comp, season
+# ------------------------------------------------------------
+# API層が依存する設定だけを切り出した不変オブジェクト
+#  - conf 全体（users_json 等）をキャッシュキーにしない
+#  - fingerprint はキャッシュキー用に生成時に1回だけ計算
+#    （current_gw は API 応答に影響しないので含めない＝節替わりでキャッシュを捨てない）
+# ------------------------------------------------------------
+@dataclass(frozen=True)
+class ApiConfig:
+    token: str = ""
+    competition: str = "2021"  # EPL=2021
+    season: str = "2025"
+    timezone: str = "UTC"
+    current_gw: str = ""
+    fingerprint: str = field(default="", init=False, compare=False)
+
+    def __post_init__(self):
+        raw = "\x1f".join([self.token, self.competition, self.season, self.timezone])
+        object.__setattr__(self, "fingerprint", hashlib.sha1(raw.encode("utf-8")).hexdigest()[:16])
+
+    @classmethod
+    def from_conf(cls, conf: Dict[str, str]) -> "ApiConfig":
+        return cls(
+            token=str(conf.get("FOOTBALL_DATA_API_TOKEN", "")).strip(),
+            competition=str(conf.get("FOOTBALL_DATA_COMPETITION", "2021")),
+            season=str(conf.get("API_FOOTBALL_SEASON", "2025")),
+            timezone=str(conf.get("timezone", "UTC")),
+            current_gw=str(conf.get("current_gw", "")),
+        )
+
+ConfLike = Union[ApiConfig, Dict[str, str]]
+
+def _as_api(conf: ConfLike) -> ApiConfig:
+    return conf if isinstance(conf, ApiConfig) else ApiConfig.from_conf(conf or {})
+
+def _headers(api: ApiConfig) -> Dict[str, str]:
+    return {"X-Auth-Token": api.token} if api.token else {}
+
+def _league_and_season(api: ApiConfig) -> Tuple[str, str]:
+    return api.competition, api.season
 
 def _localize(dt_utc: datetime, tzname: str) -> datetime:
     tz = pytz.timezone(tzname or "UTC")
@@ -36,8 +71,9 @@ def _norm_id(x) -> str:
     s = "".join(ch for ch in str(x or "").strip() if ch.isdigit())
     return s or str(x or "").strip()
 
-def fetch_matches_window(day_window: int, comp: str, season: str, conf: Dict[str, str]) -> Tuple[List[Dict], str]:
+def fetch_matches_window(day_window: int, comp: str, season: str, conf: ConfLike) -> Tuple[List[Dict], str]:
     """今日から day_window 日の試合（EPL のみ）"""
+    api = _as_api(conf)
     today_utc = datetime.now(timezone.utc)
     to_utc = today_utc + timedelta(days=day_window)
     params = {
@@ -47,13 +83,13 @@ def fetch_matches_window(day_window: int, comp: str, season: str, conf: Dict[str
         "season": season,
     }
     url = f"{BASE}/matches"
-    r = _safe_get(url, _headers(conf), params)
+    r = _safe_get(url, _headers(api), params)
     if not r:
         return [], ""
 
     data = r.json()
     items = data.get("matches", [])
-    tzname = conf.get("timezone", "UTC")
+    tzname = api.timezone
     rows = []
     gw_name = ""
     for m in items:
@@ -66,24 +102,35 @@ def fetch_matches_window(day_window: int, comp: str, season: str, conf: Dict[str
             "away": m["awayTeam"]["name"],
             "status": m.get("status", "TIMED"),
         })
-        gw_name = f"GW{m.get('matchday','')}" if m.get("matchday") else conf.get("current_gw", "")
-    return rows, gw_name or conf.get("current_gw", "")
+        gw_name = f"GW{m.get('matchday','')}" if m.get("matchday") else api.current_gw
+    return rows, gw_name or api.current_gw
 
 @st.cache_data(ttl=60)
-def fetch_matches_next_gw(conf: Dict[str, str], day_window: int = 7) -> Tuple[List[Dict], str]:
-    comp, season = _league_and_season(conf)
-    rows, gw = fetch_matches_window(day_window, comp, season, conf)
+def _fetch_matches_next_gw(_api: ApiConfig, api_fp: str, day_window: int) -> Tuple[List[Dict], str]:
+    comp, season = _league_and_season(_api)
+    # current_gw は fingerprint に無いので、キャッシュする値には混ぜない（補完は呼び出し側）
+    rows, gw = fetch_matches_window(day_window, comp, season, replace(_api, current_gw=""))
     for r in rows:
         r["gw"] = gw
     return rows, gw
 
-def fetch_scores_for_match_ids(conf: Dict[str, str], match_ids: List[str]) -> Dict[str, Dict]:
+def fetch_matches_next_gw(conf: ConfLike, day_window: int = 7) -> Tuple[List[Dict], str]:
+    api = _as_api(conf)
+    # キャッシュキーは fingerprint のみ（_api はハッシュ対象外）
+    rows, gw = _fetch_matches_next_gw(api, api.fingerprint, day_window)
+    if not gw and api.current_gw:
+        gw = api.current_gw
+        rows = [dict(r, gw=gw) for r in rows]
+    return rows, gw
+
+def fetch_scores_for_match_ids(conf: ConfLike, match_ids: List[str]) -> Dict[str, Dict]:
     """
     指定 match_id 群のスコア（LIVE/FINISHED含む）。
     1) まず /matches?ids=... で一括取得（成功率が高い）
     2) 取りこぼし分だけ /matches/{id} で個別再試行
     403 などは静かにスキップし、可能な範囲で返す。
     """
+    api = _as_api(conf)
     out: Dict[str, Dict] = {}
     ids = [_norm_id(mid) for mid in (match_ids or [])]
     ids = [mid for mid in ids if mid]
@@ -108,7 +155,7 @@ def fetch_scores_for_match_ids(conf: Dict[str, str], match_ids: List[str]) -> Di
         chunk = 20
         for i in range(0, len(ids), chunk):
             batch = ids[i:i+chunk]
-            r = _safe_get(url, _headers(conf), params={"ids": ",".join(batch)})
+            r = _safe_get(url, _headers(api), params={"ids": ",".join(batch)})
             if not r:
                 continue
             matches = (r.json() or {}).get("matches", []) or []
@@ -121,7 +168,7 @@ def fetch_scores_for_match_ids(conf: Dict[str, str], match_ids: List[str]) -> Di
     missing = [mid for mid in ids if mid not in out]
     for mid in missing:
         try:
-            r = _safe_get(f"{BASE}/matches/{mid}", _headers(conf), params={})
+            r = _safe_get(f"{BASE}/matches/{mid}", _headers(api), params={})
             if not r:
                 continue
             m = (r.json() or {}).get("match", {}) or {}
@@ -133,27 +180,26 @@ def fetch_scores_for_match_ids(conf: Dict[str, str], match_ids: List[str]) -> Di
     return out
 
 # ===== 追加：GW名（GW7 / 7）からその節の全試合を取得 =====
-def fetch_matches_by_gw(conf: Dict[str, str], gw_name: str) -> Tuple[List[Dict], str]:
+def fetch_matches_by_gw(conf: ConfLike, gw_name: str) -> Tuple[List[Dict], str]:
     """
     指定GWの全試合を Football-Data から取得して返す。
     app.py の救済処理（odds.fd_match_id の自動補完）で使用。
     season がズレている可能性に備えてフォールバック（season無し → season-1）を行う。
     """
     # 'GW7' や '7' を数値に
-    s = str(gw_name or "").strip().upper()
-    num = "".join(ch for ch in s if ch.isdigit())
-    if not num:
-        return [], s or ""
-    matchday = int(num)
+    matchday = gw_key(gw_name)
+    if matchday is None:
+        return [], str(gw_name or "").strip().upper()
 
-    comp, season = _league_and_season(conf)
+    api = _as_api(conf)
+    comp, season = _league_and_season(api)
 
     def _fetch(season_param):
         url = f"{BASE}/competitions/{comp}/matches"
         params = {"matchday": matchday}
         if season_param is not None:
             params["season"] = season_param
-        r = _safe_get(url, _headers(conf), params)
+        r = _safe_get(url, _headers(api), params)
         return r.json().get("matches", []) if r else []
 
     # 1) conf の season で試行
@@ -165,7 +211,7 @@ def fetch_matches_by_gw(conf: Dict[str, str], gw_name: str) -> Tuple[List[Dict],
     if not items and season and str(season).isdigit():
         items = _fetch(str(int(season) - 1))
 
-    tzname = conf.get("timezone", "UTC")
+    tzname = api.timezone
     rows: List[Dict] = []
     for m in items or []:
         utc = datetime.fromisoformat(m["utcDate"].replace("Z", "+00:00"))
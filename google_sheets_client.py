@@ -1,9 +1,20 @@
 # google_sheets_client.py
 from __future__ import annotations
 
+import re
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
 import gspread
 import streamlit as st
 
+import sheet_decode
+import sqlite_store
+import storage_backend
+import write_journal
+
 # シート名固定
 SHEET_CONFIG = "config"
 SHEET_ODDS = "odds"
@@ -24,21 +35,233 @@ def _spreadsheet():
     ssid = st.secrets["sheets"]["sheet_id"]
     return gc.open_by_key(ssid)
 
+# ------------------------------------------------------------
+# クォータ制御（Sheets API の分あたり上限を読み・書きで別管理）
+#  - 直近60秒の呼び出し時刻を数える（ローリングウィンドウ）
+#  - interactive（画面操作）は上限いっぱいまで使え、空くまで少し待つ
+#  - background（WAL再生・アクセスログ・プリウォーム・レプリカ取り込み等）は
+#    予約分（INTERACTIVE_RESERVE）を残して打ち切り、QuotaDeferred で後回しにする
+#    （呼び出し側の既存のリトライ／バックオフに乗る）
+#  - interactive が待っている間は background に枠を渡さない
+#  - ただし同じスレッドの background が MAX_BACKGROUND_DEFER_SEC 見送られ続けたら、
+#    以後 BACKGROUND_FORCE_SEC の間は上限いっぱいまで通す（WAL 再生等を飢えさせない）
+# ------------------------------------------------------------
+QUOTA_WINDOW_SEC = 60.0
+QUOTA_PER_MIN = {"read": 60, "write": 60}   # Sheets API の既定（ユーザーあたり）
+INTERACTIVE_RESERVE = 0.3                    # background が使わずに残す割合
+INTERACTIVE_MAX_WAIT_SEC = 20.0              # これ以上は待たずに投げる（429 は gspread 側の再試行へ）
+MAX_BACKGROUND_DEFER_SEC = 90.0              # background を見送り続ける最長時間
+BACKGROUND_FORCE_SEC = 15.0                  # 見送りの上限を超えた後、続けて通す時間（1回の処理を完走させる）
+
+class QuotaDeferred(write_journal.Deferred):
+    """background の呼び出しをクォータ不足で見送った（WAL の失敗回数には数えない）"""
+
+_quota_cv = threading.Condition()
+_quota_calls = {kind: deque() for kind in QUOTA_PER_MIN}
+_quota_waiting = {kind: 0 for kind in QUOTA_PER_MIN}   # 待っている interactive の数
+_quota_deferred = {kind: 0 for kind in QUOTA_PER_MIN}
+_priority = threading.local()
+
+@contextmanager
+def background_priority():
+    """このスレッドでの Sheets 呼び出しを低優先度として扱う"""
+    prev = getattr(_priority, "background", False)
+    _priority.background = True
+    try:
+        yield
+    finally:
+        _priority.background = prev
+
+def is_background() -> bool:
+    return getattr(_priority, "background", False)
+
+def _prune(kind: str, now: float):
+    calls = _quota_calls[kind]
+    while calls and now - calls[0] >= QUOTA_WINDOW_SEC:
+        calls.popleft()
+
+def _spend(kind: str, n: int = 1):
+    """呼び出し前に枠を確保する（background は枠が無ければ QuotaDeferred）"""
+    limit = QUOTA_PER_MIN[kind]
+    with _quota_cv:
+        if is_background():
+            now = time.monotonic()
+            _prune(kind, now)
+            since = getattr(_priority, "deferred_since", None)
+            if since is not None and now - since >= MAX_BACKGROUND_DEFER_SEC:
+                _priority.forced_until = now + BACKGROUND_FORCE_SEC
+                _priority.deferred_since = None
+            forced = getattr(_priority, "forced_until", 0.0) > now
+            cap = limit if forced else int(limit * (1 - INTERACTIVE_RESERVE))
+            if (_quota_waiting[kind] and not forced) or len(_quota_calls[kind]) + n > cap:
+                if getattr(_priority, "deferred_since", None) is None:
+                    _priority.deferred_since = now
+                _quota_deferred[kind] += 1
+                raise QuotaDeferred(f"sheets {kind} quota: deferred background call")
+            if not forced:
+                _priority.deferred_since = None
+        else:
+            deadline = time.monotonic() + INTERACTIVE_MAX_WAIT_SEC
+            _quota_waiting[kind] += 1
+            try:
+                while True:
+                    now = time.monotonic()
+                    _prune(kind, now)
+                    calls = _quota_calls[kind]
+                    if len(calls) + n <= limit or now >= deadline:
+                        break
+                    _quota_cv.wait(min(deadline, calls[0] + QUOTA_WINDOW_SEC) - now)
+            finally:
+                _quota_waiting[kind] -= 1
+        now = time.monotonic()
+        _quota_calls[kind].extend([now] * n)
+
+def quota_headroom() -> dict:
+    """分あたり枠の残り（{"read": {...}, "write": {...}}）"""
+    now = time.monotonic()
+    out = {}
+    with _quota_cv:
+        for kind, limit in QUOTA_PER_MIN.items():
+            _prune(kind, now)
+            used = len(_quota_calls[kind])
+            out[kind] = {
+                "used": used,
+                "limit": limit,
+                "remaining": max(limit - used, 0),
+                "background_remaining": max(int(limit * (1 - INTERACTIVE_RESERVE)) - used, 0),
+                "deferred": _quota_deferred[kind],
+            }
+    return out
+
+# ------------------------------------------------------------
+# ワークシートのハンドル登録簿
+#  - sh.worksheet(name) は毎回メタデータをHTTP取得するため、
+#    sh.worksheets() 1回で全ハンドルを取り、以後は使い回す
+#  - ヘッダ（列名→列番号）とデータ行数もここで保持
+#  - シート追加時／スキーマ（ヘッダ）変更時のみ作り直す
+# ------------------------------------------------------------
+_registry_lock = threading.RLock()
+_ws_handles: dict = {}          # sheet_name -> Worksheet
+_header_maps: dict = {}         # sheet_name -> {col_name: 1始まり列番号}
+_row_counts: dict = {}          # sheet_name -> ヘッダを含む使用行数（不明なら未登録）
+_key_indexes: dict = {}         # (sheet_name, (key_col, ...)) -> {"map": {(key, ...): 行番号}, "rows": 行数, "built_at": t}
+KEY_INDEX_MAX_AGE_SEC = 300     # 手編集の取りこぼし対策：これより古い索引は作り直す
+
+def _load_registry():
+    _spend("read")
+    handles = {w.title: w for w in _spreadsheet().worksheets()}
+    with _registry_lock:
+        _ws_handles.clear()
+        _ws_handles.update(handles)
+
 def ws(sheet_name: str):
-    sh = _spreadsheet()
-    return sh.worksheet(sheet_name)
+    with _registry_lock:
+        h = _ws_handles.get(sheet_name)
+    if h is None:
+        # 未登録 → 追加されたシートかもしれないので1回だけ取り直す
+        _load_registry()
+        with _registry_lock:
+            h = _ws_handles.get(sheet_name)
+        if h is None:
+            raise gspread.WorksheetNotFound(sheet_name)
+    return h
+
+def invalidate_registry(sheet_name: str | None = None):
+    """シート追加・ヘッダ変更・手編集の後に呼ぶ（None で全体）"""
+    with _registry_lock:
+        if sheet_name is None:
+            _ws_handles.clear()
+            _header_maps.clear()
+            _row_counts.clear()
+            _key_indexes.clear()
+        else:
+            _ws_handles.pop(sheet_name, None)
+            _header_maps.pop(sheet_name, None)
+            _row_counts.pop(sheet_name, None)
+            _drop_key_indexes(sheet_name)
+
+def add_worksheet(sheet_name: str, header: list[str], rows: int = 100):
+    """シートを新規作成してヘッダを書き込み、登録簿に載せる（既存ならそれを返す。足りない列は右端に足す）"""
+    try:
+        w = ws(sheet_name)
+    except gspread.WorksheetNotFound:
+        w = None
+    if w is not None:
+        header_map = _header_index_map(w)
+        missing = [h for h in header if h not in header_map]
+        if missing:
+            first = max(header_map.values(), default=0) + 1
+            _spend("write", 2)
+            if w.col_count < first + len(missing) - 1:
+                w.add_cols(first + len(missing) - 1 - w.col_count)
+            w.update(f"{_col_letter(first)}1", [missing])
+            _header_index_map(w, refresh=True)
+        return w
+    _spend("write", 2)
+    w = _spreadsheet().add_worksheet(title=sheet_name, rows=rows, cols=max(len(header), 1))
+    w.update("A1", [header])
+    with _registry_lock:
+        _ws_handles[sheet_name] = w
+        _header_maps[sheet_name] = {h: i for i, h in enumerate(header, start=1)}
+        _row_counts[sheet_name] = 1
+    return w
+
+def data_row_count(sheet_name: str) -> int | None:
+    with _registry_lock:
+        return _row_counts.get(sheet_name)
+
+def _set_row_count(sheet_name: str, n: int | None):
+    with _registry_lock:
+        if n is None:
+            _row_counts.pop(sheet_name, None)
+            _drop_key_indexes(sheet_name)
+        else:
+            _row_counts[sheet_name] = n
+            # 行数が索引と食い違う＝外部で行が増減した → 索引を捨てる
+            for k in [k for k, idx in _key_indexes.items() if k[0] == sheet_name and idx["rows"] != n]:
+                del _key_indexes[k]
+
+def _drop_key_indexes(sheet_name: str):
+    with _registry_lock:
+        for k in [k for k in _key_indexes if k[0] == sheet_name]:
+            del _key_indexes[k]
 
 # ------------------------------------------------------------
 # 便利関数
 # ------------------------------------------------------------
-def _records(ws_) -> list[dict]:
+class SheetReadError(RuntimeError):
+    """シートの読み取り失敗（strict 読みのときだけ送出。空のシートとは区別する）"""
+
+
+def _records(ws_, strict: bool = False) -> list[dict]:
+    # 生値を宣言済みの列型で一括デコード（get_all_records の型推測で ID を壊さない）
+    _spend("read")
     try:
-        return ws_.get_all_records()
-    except Exception:
+        return sheet_decode.read_records(ws_.title, ws_)
+    except Exception as e:
+        # ★ 既定は従来どおり空として返す。置き換え・キャッシュに使う読みは strict で失敗を伝える
+        if strict:
+            raise SheetReadError(f"{ws_.title}: {e}") from e
         return []
 
-def read_rows_by_sheet(sheet_name: str) -> list[dict]:
-    return _records(ws(sheet_name))
+def _read_sheet(sheet_name: str, with_pending: bool = True, strict: bool = False) -> list[dict]:
+    ws_ = ws(sheet_name)  # 無いシートは WorksheetNotFound（従来どおり）
+    recs = _records(ws_, strict=strict)
+    if recs:
+        _set_row_count(sheet_name, len(recs) + 1)
+    # 未反映の書き込み（ジャーナル）を重ねて返す（自分の書き込みが直後に見える）
+    return write_journal.overlay(sheet_name, recs) if with_pending else recs
+
+def read_rows_by_sheet(sheet_name: str, strict: bool = False) -> list[dict]:
+    """strict=True は読み取り失敗を SheetReadError で伝える（既定は従来どおり空として返す）"""
+    return storage_backend.current().read_rows(sheet_name, strict=strict)
+
+def read_rows_if_exists(sheet_name: str, strict: bool = False) -> list[dict]:
+    """未作成があり得るシート（集計・アーカイブ等）用：無ければ空として読む"""
+    try:
+        return read_rows_by_sheet(sheet_name, strict=strict)
+    except gspread.WorksheetNotFound:
+        return []
 
 def read_config_map() -> dict:
     rows = read_rows_by_sheet(SHEET_CONFIG)
@@ -50,54 +273,372 @@ def read_config_map() -> dict:
             mp[k] = v
     return mp
 
-def _find_row_idx_by_key(worksheet, key: str, key_col: str = "key"):
-    # 1行目ヘッダ前提、対象列のインデックスを特定
-    header = worksheet.row_values(1)
-    try:
-        idx = header.index(key_col) + 1
-    except ValueError:
+# ------------------------------------------------------------
+# キー列の索引（(key, ...) → 行番号）
+#  - 初回だけキー列だけを1回の範囲読込（batch_get）で取得して構築、
+#    以後はネットワーク無しで引ける（単一キー／複合キー共通）
+#  - 追記時は append の応答（更新範囲）から行番号を登録
+#  - 行数の食い違い／一定時間経過／データ更新で作り直す
+#  - キーは読込（sheet_decode）と同じく UNFORMATTED_VALUE を同じ規則で文字列化して照合
+#    （表示形式で "1,234" や "7.0" になった値でも読み込んだ行のキーと一致させる）
+# ------------------------------------------------------------
+_UPDATED_ROW = re.compile(r"![A-Z]+(\d+)")
+
+def _col_letter(col: int) -> str:
+    return re.sub(r"\d+$", "", gspread.utils.rowcol_to_a1(1, col))
+
+def _key_index(worksheet, key_cols: tuple):
+    name = worksheet.title
+    with _registry_lock:
+        idx = _key_indexes.get((name, key_cols))
+        if idx is not None and time.monotonic() - idx["built_at"] <= KEY_INDEX_MAX_AGE_SEC:
+            return idx
+    header_map = _header_index_map(worksheet)
+    cols = [header_map.get(k) for k in key_cols]
+    if not all(cols):
         # key_col が存在しない場合は失敗
         return None
-    # 2行目以降を探索
-    col_vals = worksheet.col_values(idx)
-    for i, val in enumerate(col_vals[1:], start=2):
-        if str(val) == str(key):
-            return i
-    return None
-
-def _header_index_map(worksheet):
+    # キー列だけを1リクエストで取得（2行目以降）
+    ranges = [f"{_col_letter(c)}2:{_col_letter(c)}" for c in cols]
+    _spend("read")
+    col_vals = [[sheet_decode.cell_text(cell[0] if cell else "") for cell in vr]
+                for vr in worksheet.batch_get(ranges, value_render_option=sheet_decode.VALUE_RENDER)]
+    n_data = max((len(v) for v in col_vals), default=0)
+    mp = {}
+    for i in range(n_data):
+        key = tuple(v[i] if i < len(v) else "" for v in col_vals)
+        mp.setdefault(key, i + 2)   # 重複キーは従来どおり先頭行を採用
+    rows = max(n_data + 1, data_row_count(name) or 0)
+    idx = {"map": mp, "rows": rows, "built_at": time.monotonic()}
+    with _registry_lock:
+        _key_indexes[(name, key_cols)] = idx
+        _row_counts[name] = rows
+    return idx
+
+def _find_row_idx_by_keys(worksheet, key_vals: tuple, key_cols: tuple):
+    idx = _key_index(worksheet, tuple(key_cols))
+    if idx is None:
+        return None
+    return idx["map"].get(tuple(sheet_decode.cell_text(v) for v in key_vals))
+
+def _find_row_idx_by_key(worksheet, key: str, key_col: str = "key"):
+    return _find_row_idx_by_keys(worksheet, (key,), (key_col,))
+
+def _note_appended(sheet_name: str, rows: list[dict], resp):
+    """append_row(s) の応答から書き込まれた行番号を読み、行数と索引を更新"""
+    m = _UPDATED_ROW.search(str(((resp or {}).get("updates") or {}).get("updatedRange", "")))
+    if not m or not rows:
+        _set_row_count(sheet_name, None)
+        return
+    first_row = int(m.group(1))
+    last_row = first_row + len(rows) - 1
+    with _registry_lock:
+        _row_counts[sheet_name] = max(last_row, _row_counts.get(sheet_name, 0))
+        for (name, key_cols), idx in list(_key_indexes.items()):
+            if name != sheet_name:
+                continue
+            if first_row != idx["rows"] + 1:
+                # 想定外の位置に追記された（外部で行が増減している）→ 作り直し
+                del _key_indexes[(name, key_cols)]
+                continue
+            for i, row in enumerate(rows):
+                idx["map"].setdefault(tuple(sheet_decode.cell_text(row.get(k, "")) for k in key_cols), first_row + i)
+            idx["rows"] = last_row
+
+def _header_index_map(worksheet, refresh: bool = False):
+    name = worksheet.title
+    with _registry_lock:
+        cached = None if refresh else _header_maps.get(name)
+    if cached is not None:
+        return cached
+    _spend("read")
     header = worksheet.row_values(1)
-    return {h: i for i, h in enumerate(header, start=1)}
+    mp = {h: i for i, h in enumerate(header, start=1)}
+    with _registry_lock:
+        _header_maps[name] = mp
+    return mp
+
+def _row_values(header_map: dict, row: dict, raw: bool = False) -> list:
+    # 書き込む行データ（ヘッダ順に並べる）。raw=True は RAW 書き込み用（数値は数値のまま）
+    values = [""] * max(header_map.values(), default=0)
+    for col_name, idx in header_map.items():
+        v = row.get(col_name, "")
+        if raw:
+            values[idx - 1] = v if isinstance(v, (int, float)) and not isinstance(v, bool) else sheet_decode.cell_text(v)
+        else:
+            values[idx - 1] = str(v)
+    return values
+
+def _target_row(ws_, row: dict, key_col: str | None, key_cols: list[str] | None):
+    target_row = None
+
+    if key_col:
+        row_idx = _find_row_idx_by_key(ws_, row.get(key_col, ""), key_col=key_col)
+        if row_idx:
+            target_row = row_idx
+
+    if key_cols:
+        # 複合キーの索引で一致行を探す（全行は読まない）
+        row_idx = _find_row_idx_by_keys(ws_, tuple(row.get(k, "") for k in key_cols), tuple(key_cols))
+        if row_idx:
+            target_row = row_idx
+    return target_row
+
+def _targets_match(ws_, header_map: dict, entries: list[dict], targets: list) -> bool:
+    """索引で引いた行に今もそのキーが入っているか（キー列の該当範囲だけを1リクエストで確かめる）"""
+    want: dict[int, dict[int, str]] = {}   # 列番号 → {行番号: 期待するキー}
+    for e, target_row in zip(entries, targets):
+        if not target_row:
+            continue
+        row = e.get("row") or {}
+        for k in (e.get("key_cols") or [e.get("key_col")]):
+            want.setdefault(header_map[k], {})[target_row] = sheet_decode.cell_text(row.get(k, ""))
+    if not want:
+        return True
+    spans = [(c, min(rows_), max(rows_)) for c, rows_ in want.items()]
+    _spend("read")
+    got = ws_.batch_get([f"{_col_letter(c)}{lo}:{_col_letter(c)}{hi}" for c, lo, hi in spans],
+                        value_render_option=sheet_decode.VALUE_RENDER)
+    for (c, lo, _), vr in zip(spans, got):
+        for r, expect in want[c].items():
+            cell = vr[r - lo] if r - lo < len(vr) else []
+            if sheet_decode.cell_text(cell[0] if cell else "") != expect:
+                return False
+    return True
+
+def upsert_rows_now(sheet_name: str, entries: list[dict]):
+    """
+    upsert をまとめて即時反映（ジャーナルの再生用）。
+    entries: [{"row": {...}, "key_col": str|None, "key_cols": list|None, "op": "upsert"|"update_cols"}, ...]
+    既存行の更新は batch_update 1回、新規行は append_rows 1回で書き込む。
+    update_cols は一致行の該当セルだけを同じ batch_update に載せる（一致しなければ捨てる）。
+    """
+    if not entries:
+        return
+    ws_ = ws(sheet_name)
+    header_map = _header_index_map(ws_)
+    last_col = _col_letter(max(len(header_map), 1))
+
+    targets = [_target_row(ws_, e.get("row") or {}, e.get("key_col"), e.get("key_cols")) for e in entries]
+    if not _targets_match(ws_, header_map, entries, targets):
+        # ★ 手作業で行が消えた・並んだ等で索引がずれている → 作り直して引き直す（別キーの行を上書きしない）
+        _drop_key_indexes(sheet_name)
+        targets = [_target_row(ws_, e.get("row") or {}, e.get("key_col"), e.get("key_cols")) for e in entries]
+        if not _targets_match(ws_, header_map, entries, targets):
+            raise RuntimeError(f"{sheet_name}: key index disagrees with the sheet; retry later")
+
+    updates, appends = [], []
+    for e, target_row in zip(entries, targets):
+        row = e.get("row") or {}
+        if e.get("op") == "update_cols":
+            keys = set(e.get("key_cols") or [e.get("key_col")])
+            if target_row:
+                updates += [{"range": f"{_col_letter(header_map[k])}{target_row}", "values": [[str(v)]]}
+                            for k, v in row.items() if k in header_map and k not in keys]
+            continue
+        values = _row_values(header_map, row)
+        if target_row:
+            updates.append({"range": f"A{target_row}:{last_col}{target_row}", "values": [values]})
+        else:
+            appends.append((row, values))
+
+    _spend("write", int(bool(updates)) + int(bool(appends)))
+    if updates:
+        ws_.batch_update(updates)
+    if appends:
+        resp = ws_.append_rows([v for _, v in appends], value_input_option="USER_ENTERED")
+        _note_appended(sheet_name, [r for r, _ in appends], resp)
 
 def upsert_row(sheet_name: str, row: dict, key_col: str | None = None, key_cols: list[str] | None = None):
     """
     単一キー（key_col）または複合キー（key_cols）で upsert。
     見つかれば更新、なければ末尾に追加。
+    ※ 実際の書き込み先は設定で選んだストレージ（storage_backend）。
+    """
+    storage_backend.current().upsert_row(sheet_name, row, key_col=key_col, key_cols=key_cols)
+
+def update_cols(sheet_name: str, rows: list[dict], key_col: str | None = None, key_cols: list[str] | None = None):
+    """
+    キー一致行の、渡した列だけを書き換える（一括の再設定向け。無い行は追加しない）。
+    sheets ではジャーナル経由でまとめられ、1回の batch_update（セル範囲の集合）で反映される。
+    """
+    if not rows:
+        return
+    storage_backend.current().update_cols(sheet_name, rows, key_col=key_col, key_cols=key_cols)
+
+def append_rows(sheet_name: str, rows: list[dict]):
+    """
+    読まずに末尾へまとめて追記（追記専用ログ向け）。
     """
+    if not rows:
+        return
+    storage_backend.current().append_rows(sheet_name, rows)
+
+def ensure_sheet(sheet_name: str, header: list[str]):
+    """表が無ければヘッダ付きで作る（集計・アーカイブ用の派生シート）"""
+    storage_backend.current().ensure_sheet(sheet_name, header)
+
+def replace_rows(sheet_name: str, rows: list[dict]):
+    """
+    ヘッダ以外の中身を rows で丸ごと置き換える（アーカイブ後の書き戻し用）。
+    ※ 未反映のジャーナルがある間は呼ばないこと（置き換えで消える）。
+    """
+    storage_backend.current().replace_rows(sheet_name, rows)
+
+def _replace_rows_now(sheet_name: str, rows: list[dict]):
     ws_ = ws(sheet_name)
     header_map = _header_index_map(ws_)
+    last_col = _col_letter(max(len(header_map), 1))
+    # ★ RAW で書く（USER_ENTERED だと ID・日付・先頭ゼロのキーが再解釈される）。数値セルは数値のまま
+    values = [_row_values(header_map, row, raw=True) for row in rows]
+    # 先に新しい中身を上書きし、余った末尾だけを消す（途中で失敗してもシートが空にならない）
+    _spend("write", 2 if values else 1)
+    if values:
+        ws_.update(range_name=f"A2:{last_col}{len(values) + 1}", values=values, value_input_option="RAW")
+    ws_.batch_clear([f"A{len(values) + 2}:{last_col}"])
+    with _registry_lock:
+        _drop_key_indexes(sheet_name)
+    _set_row_count(sheet_name, len(values) + 1)
 
-    # 書き込む行データ（ヘッダ順に並べる）
-    values = [""] * len(header_map)
-    for col_name, idx in header_map.items():
-        values[idx - 1] = str(row.get(col_name, ""))
+def _append_rows_now(sheet_name: str, rows: list[dict]):
+    """シート末尾へ即時追記（1リクエストで複数行）"""
+    ws_ = ws(sheet_name)
+    header_map = _header_index_map(ws_)
+    values = [_row_values(header_map, row) for row in rows]
+    _spend("write")
+    resp = ws_.append_rows(values, value_input_option="USER_ENTERED")
+    _note_appended(sheet_name, rows, resp)
 
-    target_row = None
 
-    if key_col:
-        row_idx = _find_row_idx_by_key(ws_, str(row.get(key_col, "")), key_col=key_col)
-        if row_idx:
-            target_row = row_idx
+# ------------------------------------------------------------
+# ストレージ実装：sheets（既定）
+#  - 読み：シート＋未反映ジャーナルの重ね合わせ
+#  - 書き：ローカルのジャーナル（WAL）に記録して即座に戻り、
+#    シートへの反映はバックグラウンドでリトライ付きでまとめて行う
+# ------------------------------------------------------------
+class SheetsBackend:
+    name = "sheets"
 
-    if key_cols:
-        # 全行を読み、複合キー一致を探す
-        all_rows = ws_.get_all_records()
-        for i, r in enumerate(all_rows, start=2):
-            if all(str(r.get(k, "")) == str(row.get(k, "")) for k in key_cols):
-                target_row = i
-                break
-
-    if target_row:
-        ws_.update(f"A{target_row}:{chr(ord('A') + len(values) - 1)}{target_row}", [values])
-    else:
-        ws_.append_row(values, value_input_option="USER_ENTERED")
+    def __init__(self):
+        # ★ ジャーナルの再生先はシート。使われる実装になった時だけ登録する
+        #   （memory 等で動かしている間はシートへ再生しない）
+        write_journal.set_applier(_replay_in_background)
+
+    def read_rows(self, sheet_name: str, strict: bool = False) -> list[dict]:
+        return _read_sheet(sheet_name, strict=strict)
+
+    def upsert_row(self, sheet_name, row, key_col=None, key_cols=None):
+        write_journal.submit(sheet_name, row, key_col=key_col, key_cols=key_cols)
+
+    def update_cols(self, sheet_name, rows, key_col=None, key_cols=None):
+        write_journal.submit_many(sheet_name, rows, key_col=key_col, key_cols=key_cols, op="update_cols")
+
+    def append_rows(self, sheet_name, rows):
+        _append_rows_now(sheet_name, rows)
+
+    def replace_rows(self, sheet_name, rows):
+        _replace_rows_now(sheet_name, rows)
+
+    def ensure_sheet(self, sheet_name, header):
+        add_worksheet(sheet_name, header)
+
+
+# ------------------------------------------------------------
+# ストレージ実装：sqlite（SQLite を主、シートを非同期レプリカにする）
+#   st.secrets["storage"]["backend"] = "sqlite" で有効
+#  - 読み：ローカルDB（ミリ秒）
+#  - 書き：ローカルDB → ジャーナル経由でシートへ反映（push）
+#  - 取り込み：一定間隔でシートを読み、手編集をローカルDBへ反映（pull）
+#  - スキーマ未定義のシートは sheets と同じ経路
+# ------------------------------------------------------------
+REPLICA_PULL_INTERVAL_SEC = 120
+REPLICA_PULL_SHEETS = ("config", "odds", "bets", "result", "bm_log", "gw_summary", "standings")  # access_log は追記のみ（push専用）
+
+class SqliteBackend(SheetsBackend):
+    name = "sqlite"
+
+    def __init__(self):
+        super().__init__()
+        self._lock = threading.RLock()
+        self._replicator: threading.Thread | None = None
+
+    def read_rows(self, sheet_name, strict=False):
+        if sheet_name not in sqlite_store.SCHEMAS:
+            return super().read_rows(sheet_name, strict=strict)
+        self._ensure_replica(sheet_name)
+        return sqlite_store.read_rows(sheet_name)
+
+    def upsert_row(self, sheet_name, row, key_col=None, key_cols=None):
+        if sheet_name not in sqlite_store.SCHEMAS:
+            return super().upsert_row(sheet_name, row, key_col=key_col, key_cols=key_cols)
+        with self._lock:
+            sqlite_store.upsert(sheet_name, row, key_cols or ([key_col] if key_col else None))
+            write_journal.submit(sheet_name, row, key_col=key_col, key_cols=key_cols)
+
+    def update_cols(self, sheet_name, rows, key_col=None, key_cols=None):
+        if sheet_name not in sqlite_store.SCHEMAS:
+            return super().update_cols(sheet_name, rows, key_col=key_col, key_cols=key_cols)
+        with self._lock:
+            sqlite_store.update_cols(sheet_name, rows, key_cols or ([key_col] if key_col else None))
+            super().update_cols(sheet_name, rows, key_col=key_col, key_cols=key_cols)
+
+    def append_rows(self, sheet_name, rows):
+        if sheet_name in sqlite_store.SCHEMAS:
+            with self._lock:
+                for row in rows:
+                    sqlite_store.upsert(sheet_name, row)
+        super().append_rows(sheet_name, rows)
+
+    def replace_rows(self, sheet_name, rows):
+        if sheet_name in sqlite_store.SCHEMAS:
+            with self._lock:
+                sqlite_store.replace_all(sheet_name, [dict(r) for r in rows])
+        super().replace_rows(sheet_name, rows)
+
+    def pull_from_sheets(self, sheet_name: str):
+        """シートの内容でローカルDBを置き換える（未反映・直近反映のローカル書き込みは重ね直す）"""
+        started = time.time()
+        # ★ 読み取り失敗は SheetReadError（ローカルDBはそのまま）
+        recs = _read_sheet(sheet_name, with_pending=False, strict=True)
+        if not recs and sqlite_store.row_count(sheet_name):
+            # 空の取得で中身のある表を消さない：シートがヘッダだけと確かめられた時だけ空にする
+            _spend("read")
+            if len(ws(sheet_name).get_values("A1:A2")) != 1:
+                raise SheetReadError(f"{sheet_name}: empty read not confirmed; keeping local rows")
+        with self._lock:
+            rows = write_journal.overlay(sheet_name, [dict(r) for r in recs], since=started - 5)
+            sqlite_store.replace_all(sheet_name, rows)
+            sqlite_store.set_meta(f"pulled_at:{sheet_name}", str(time.time()))
+
+    def _replicator_loop(self):
+        with background_priority():
+            while True:
+                time.sleep(REPLICA_PULL_INTERVAL_SEC)
+                for sheet in REPLICA_PULL_SHEETS:
+                    try:
+                        self.pull_from_sheets(sheet)
+                    except Exception:
+                        continue
+
+    def _ensure_replica(self, sheet_name: str):
+        if sheet_name in REPLICA_PULL_SHEETS and sqlite_store.get_meta(f"pulled_at:{sheet_name}") is None:
+            # 初回だけ同期的に取り込む（空のDBを返さない）
+            try:
+                self.pull_from_sheets(sheet_name)
+            except Exception:
+                pass
+        with self._lock:
+            if self._replicator is None or not self._replicator.is_alive():
+                self._replicator = threading.Thread(target=self._replicator_loop,
+                                                    name="sqlite-replicator", daemon=True)
+                self._replicator.start()
+
+
+storage_backend.register("sheets", SheetsBackend)
+storage_backend.register("sqlite", SqliteBackend)
+
+
+def _replay_in_background(sheet_name: str, entries: list[dict]):
+    # WAL の再生は低優先度（枠不足なら QuotaDeferred → ジャーナル側のバックオフで再送）
+    with background_priority():
+        upsert_rows_now(sheet_name, entries)
@@ -0,0 +1,119 @@
+# liability.py
+from __future__ import annotations
+
+import threading
+from typing import Callable, Dict, Iterable, Mapping, Optional, Tuple
+
+from util import gw_key
+
+# ------------------------------------------------------------
+# BM の負債（エクスポージャー）索引：(GW, match_id, pick) → (stake 合計, 的中時の払戻合計)
+#  - 対象は OPEN のベットだけ（精算・取消で外れる）
+#  - ベット保存・オッズ再設定・精算のたびに observe(row) で差分更新
+#    （ベットキーごとに前回値を持ち、合計は差し引きで直す）
+#  - seed(load) で全件から作る。以後は差分だけで、シートは走査しない
+#    （データ更新＝世代の切替時に invalidate() → 次の seed で読み直し）
+#  - 試合の最悪ケース＝払戻が最大になる結果（BM の net = stake 合計 - その払戻）
+# ------------------------------------------------------------
+_lock = threading.RLock()
+_seeded = False
+_bets: Dict[str, Tuple[int, str, str, float, float]] = {}      # key -> (gw, match_id, pick, stake, odds)
+_index: Dict[Tuple[int, str, str], list] = {}                   # (gw, match_id, pick) -> [stake, payout]
+
+
+def _num(x, default: float = 0.0) -> float:
+    try:
+        return float(x)
+    except (TypeError, ValueError):
+        return default
+
+
+def _add(entry: Tuple[int, str, str, float, float], sign: int):
+    gw_n, mid, pick, stake, odds = entry
+    acc = _index.setdefault((gw_n, mid, pick), [0.0, 0.0])
+    acc[0] += sign * stake
+    acc[1] += sign * stake * odds
+    if abs(acc[0]) < 1e-9 and abs(acc[1]) < 1e-9:
+        del _index[(gw_n, mid, pick)]
+
+
+def _entry(row: Mapping, prev: Optional[Tuple] = None) -> Optional[Tuple[int, str, str, float, float]]:
+    """行 → 索引エントリ（OPEN 以外は None）。部分行（odds だけ等）は前回値で補う"""
+    if "status" in row and str(row.get("status") or "").upper() != "OPEN":
+        return None
+    p_gw, p_mid, p_pick, p_stake, p_odds = prev or (None, "", "", 0.0, 1.0)
+    gw_n = gw_key(row.get("gw") or None) if row.get("gw") else p_gw
+    if gw_n is None:
+        return None
+    mid = str(row.get("match_id") or p_mid)
+    pick = str(row.get("pick") or p_pick).upper()
+    stake = _num(row.get("stake"), p_stake) if "stake" in row else p_stake
+    odds = (_num(row.get("odds"), 1.0) or 1.0) if row.get("odds") not in (None, "") else p_odds
+    return gw_n, mid, pick, stake, odds
+
+
+def observe(row: Mapping):
+    """bets への書き込み1件を反映（キー無しの行は無視）"""
+    key = str(row.get("key") or "")
+    if not key:
+        return
+    with _lock:
+        prev = _bets.pop(key, None)
+        if prev is not None:
+            _add(prev, -1)
+        new = _entry(row, prev)
+        if new is not None:
+            _bets[key] = new
+            _add(new, +1)
+
+
+def invalidate():
+    """次の seed() で全件から作り直させる（手編集・世代の切替の後に呼ぶ）"""
+    global _seeded
+    with _lock:
+        _seeded = False
+
+
+def seed(load: Callable[[], Iterable[Mapping]]):
+    """未作成（または invalidate 後）なら load() の全件から作り直す"""
+    global _seeded
+    with _lock:
+        if _seeded:
+            return
+        _bets.clear()
+        _index.clear()
+        for b in load():
+            observe(b)
+        _seeded = True
+
+
+def exposure(gw) -> Dict[str, Dict[str, Tuple[float, float]]]:
+    """{match_id: {pick: (stake, 的中時の払戻)}}"""
+    n = gw_key(gw)
+    out: Dict[str, Dict[str, Tuple[float, float]]] = {}
+    with _lock:
+        for (g, mid, pick), (stake, payout) in _index.items():
+            if g == n:
+                out.setdefault(mid, {})[pick] = (stake, payout)
+    return out
+
+
+def open_bets(gw) -> Dict[str, list]:
+    """{match_id: [(key, pick, odds), ...]}（オッズ再設定で OPEN ベットを引く用）"""
+    n = gw_key(gw)
+    out: Dict[str, list] = {}
+    with _lock:
+        for key, (g, mid, pick, _, odds) in _bets.items():
+            if g == n:
+                out.setdefault(mid, []).append((key, pick, odds))
+    return out
+
+
+def worst_case(gw) -> Dict[str, dict]:
+    """{match_id: {stake, pick, payout, bm_net}}（払戻が最大になる結果）"""
+    out = {}
+    for mid, by_pick in exposure(gw).items():
+        stake = sum(s for s, _ in by_pick.values())
+        pick, (_, payout) = max(by_pick.items(), key=lambda kv: kv[1][1])
+        out[mid] = {"stake": stake, "pick": pick, "payout": payout, "bm_net": stake - payout}
+    return out
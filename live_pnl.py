@@ -0,0 +1,162 @@
+# live_pnl.py
+from __future__ import annotations
+
+import threading
+from typing import Dict, Hashable, Iterable, List, Mapping, NamedTuple, Optional, Tuple
+
+import cache_store
+import pnl
+
+# ------------------------------------------------------------
+# 時点損益（LIVE）の差分再計算グラフ
+#   試合(match) → ベット(bet) → ユーザー合計 → BM合計
+#  - スコアが変わった試合のベットだけを計算し直し、合計は差分で更新
+#  - 試合状態は「未開始」か「現時点の勝ち側（HOME/DRAW/AWAY）」に正規化
+#    （得点が動いても勝ち側が同じならベットは再計算しない）
+#  - グラフは (用途, GW, キャッシュ世代) ごとに1つ。再実行をまたいで使い回す
+#  - ベットキーは key 列。同じ key の行が複数あれば (key, 出現順) で区別する（合計から落とさない）
+# ------------------------------------------------------------
+PENDING = "-"        # 未開始・対応試合なし（ペイアウト 0）
+
+
+class BetSpec(NamedTuple):
+    key: Hashable
+    user: str
+    fd: str          # 対応する API 試合ID（無ければ ""）
+    pick: str
+    stake: float
+    odds: float
+
+
+def match_state(sc: Optional[Mapping]) -> str:
+    """スコア辞書 → 試合状態（PENDING か、現時点の勝ち側）"""
+    return pnl.live_outcome(sc) or PENDING
+
+
+def bet_payout(bet: BetSpec, state: str) -> float:
+    if not bet.fd or state == PENDING:
+        return 0.0
+    return pnl.payout(bet.stake, bet.odds, bet.pick, state)
+
+
+class LivePnlGraph:
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._bets: Dict[Hashable, BetSpec] = {}
+        self._by_match: Dict[str, Dict[Hashable, BetSpec]] = {}
+        self._state: Dict[str, str] = {}
+        self._value: Dict[Hashable, float] = {}       # bet key -> 時点ペイアウト
+        self._user_stake: Dict[str, float] = {}
+        self._user_payout: Dict[str, float] = {}
+        self._user_bets: Dict[str, int] = {}
+        self.recomputed = 0                             # 直近の graph() で計算し直したベット数
+
+    # ---- 内部：ノードの付け外し（合計は差分で） ----
+    def _attach(self, bet: BetSpec):
+        self._bets[bet.key] = bet
+        self._by_match.setdefault(bet.fd, {})[bet.key] = bet
+        v = bet_payout(bet, self._state.get(bet.fd, PENDING))
+        self._value[bet.key] = v
+        self._user_stake[bet.user] = self._user_stake.get(bet.user, 0.0) + bet.stake
+        self._user_payout[bet.user] = self._user_payout.get(bet.user, 0.0) + v
+        self._user_bets[bet.user] = self._user_bets.get(bet.user, 0) + 1
+        self.recomputed += 1
+
+    def _detach(self, key: Hashable):
+        bet = self._bets.pop(key)
+        self._by_match.get(bet.fd, {}).pop(key, None)
+        v = self._value.pop(key, 0.0)
+        self._user_stake[bet.user] -= bet.stake
+        self._user_payout[bet.user] -= v
+        self._user_bets[bet.user] -= 1
+        if not self._user_bets[bet.user]:
+            for d in (self._user_stake, self._user_payout, self._user_bets):
+                d.pop(bet.user, None)
+
+    # ---- 更新 ----
+    def sync_bets(self, bets: Iterable[BetSpec]):
+        """ベット集合を差し替え（増減・内容変更のあったベットだけ付け外し）"""
+        bets = list(bets)
+        incoming = {b.key: b for b in bets}
+        if len(incoming) != len(bets):
+            raise ValueError("duplicate bet keys (build BetSpec with specs())")
+        with self._lock:
+            for key in [k for k, b in self._bets.items() if incoming.get(k) != b]:
+                self._detach(key)
+            for key, b in incoming.items():
+                if key not in self._bets:
+                    self._attach(b)
+
+    def update_scores(self, scores: Mapping[str, Optional[Mapping]], fds: Optional[Iterable[str]] = None):
+        """試合状態を反映（状態が変わった試合の下流だけ再計算）"""
+        with self._lock:
+            for fd in (fds if fds is not None else list(self._by_match)):
+                if not fd:
+                    continue
+                new = match_state(scores.get(fd))
+                if self._state.get(fd) == new:
+                    continue
+                self._state[fd] = new
+                for key, bet in self._by_match.get(fd, {}).items():
+                    v = bet_payout(bet, new)
+                    self._user_payout[bet.user] += v - self._value[key]
+                    self._value[key] = v
+                    self.recomputed += 1
+
+    # ---- 参照 ----
+    def payout(self, key: Hashable) -> float:
+        with self._lock:
+            return self._value.get(key, 0.0)
+
+    def user_totals(self) -> Dict[str, Tuple[float, float]]:
+        """{user: (stake, 時点ペイアウト)}"""
+        with self._lock:
+            return {u: (self._user_stake[u], self._user_payout[u]) for u in self._user_stake}
+
+    def user_net(self, bm_user: str = "") -> Dict[str, float]:
+        """ユーザー別の時点収支（BM は他メンバー合計の符号反転）"""
+        net = {u: p - s for u, (s, p) in self.user_totals().items()}
+        if bm_user:
+            net[bm_user] = -sum(v for u, v in net.items() if u != bm_user)
+        return net
+
+    def totals(self) -> Tuple[float, float]:
+        """(stake 合計, 時点ペイアウト合計)"""
+        with self._lock:
+            return sum(b.stake for b in self._bets.values()), sum(self._value.values())
+
+
+_GRAPHS = cache_store.cache("live_pnl_graphs", max_entries=32, max_bytes=32 * 1024 * 1024)
+
+
+def graph(scope: Hashable, bets: Iterable[BetSpec], scores: Mapping[str, Optional[Mapping]]) -> LivePnlGraph:
+    """scope（例: ("realtime", gw, rev)）のグラフを取得し、ベットとスコアを反映して返す"""
+    g = _GRAPHS.get_or_load(scope, LivePnlGraph)
+    with g._lock:
+        g.recomputed = 0
+        g.sync_bets(bets)
+        g.update_scores(scores)
+    return g
+
+
+def bet_key(b: Mapping, i: int) -> Hashable:
+    """グラフ上のベットキー（key 列。無い行は (user, match_id, pick, 出現順) で代用）"""
+    return b.get("key") or (b.get("user"), b.get("match_id"), b.get("pick"), i)
+
+
+def specs(bets: Iterable[Mapping], resolve) -> List[BetSpec]:
+    """
+    ベット行 → BetSpec（行と同じ順）。resolve(b) は (fd, stake, odds) を返す関数（呼び出し側の対応表を使う）。
+    key が重複する行は (key, 出現順) にする。行ごとの参照は戻り値[i].key で行うこと。
+    """
+    bets = list(bets)
+    keys = [bet_key(b, i) for i, b in enumerate(bets)]
+    seen: Dict[Hashable, int] = {}
+    for k in keys:
+        seen[k] = seen.get(k, 0) + 1
+    out = []
+    for i, (b, k) in enumerate(zip(bets, keys)):
+        fd, stake, odds = resolve(b)
+        key = (k, i) if seen[k] > 1 else k
+        out.append(BetSpec(key, b.get("user") or "", fd or "", b.get("pick") or "", float(stake), float(odds)))
+    return out
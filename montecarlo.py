@@ -0,0 +1,133 @@
+# montecarlo.py
+from __future__ import annotations
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Hashable, Iterable, List, Mapping, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+import cache_store
+import pnl
+
+# ------------------------------------------------------------
+# シーズン順位のモンテカルロ予測（各ユーザーが1位で終わる確率）
+#  - 起点：standings の確定通算 total_net
+#  - 未確定（OPEN）ベットのある試合の結果を、odds シートの倍率から
+#    出した確率（1/odds を合計1に正規化＝控除分を除く）で抽選
+#    終了済みで未精算の試合は確定結果で固定
+#  - BM は各GWの他メンバーのベット収支を逆向きに受ける（gw_summary と同じ規則）
+#  - 行列：抽選 codes (N×k) と 試合×結果×ユーザーのペイアウト表 (k×3×U) の gather
+#  - N をチャンクに分け、WORKERS>0 ならプロセスプールで並列
+#  - 結果はキャッシュ（キーは呼び出し側：データ世代＋固定結果）
+# ------------------------------------------------------------
+N_SIMS = 100_000
+CHUNK = 25_000
+WORKERS = int(os.environ.get("PREM_PICKS_MC_WORKERS") or 0)
+_CODE = {o: i for i, o in enumerate(pnl.OUTCOMES)}
+
+
+class OpenBet(NamedTuple):
+    user: str
+    gw: int
+    match: Hashable      # (GW, match_id) など、odds 行と対応付くキー
+    pick: str
+    stake: float
+    odds: float
+
+
+class Market(NamedTuple):
+    users: List[str]
+    matches: List[Hashable]
+    probs: np.ndarray    # k×3
+    table: np.ndarray    # k×3×U（その結果のときの各ユーザーのペイアウト。BM の逆向き分を含む）
+    base: np.ndarray     # U（確定通算 - 未確定 stake ＋ BM が受ける stake）
+
+
+def implied_probs(odds_row: Optional[Mapping]) -> np.ndarray:
+    """odds 行（home_win/draw/away_win）→ 結果確率。欠けていれば一様"""
+    row = odds_row or {}
+    inv = []
+    for k in ("home_win", "draw", "away_win"):
+        try:
+            o = float(row.get(k) or 0)
+        except (TypeError, ValueError):
+            o = 0.0
+        inv.append(1.0 / o if o > 1.0 else 0.0)
+    p = np.array(inv)
+    if not (p > 0).all():
+        return np.full(3, 1.0 / 3)
+    return p / p.sum()
+
+
+def build_market(bets: Iterable[OpenBet], odds_by_match: Mapping[Hashable, Mapping],
+                 bm_by_gw: Mapping[int, str], base_by_user: Mapping[str, float],
+                 fixed: Optional[Mapping[Hashable, Optional[str]]] = None) -> Market:
+    bets = [b for b in bets if b.user]
+    fixed = fixed or {}
+    users = sorted(set(base_by_user) | {b.user for b in bets} | {bm for bm in bm_by_gw.values() if bm})
+    ui = {u: i for i, u in enumerate(users)}
+    matches = sorted({b.match for b in bets}, key=str)
+    ji = {m: j for j, m in enumerate(matches)}
+
+    probs = np.empty((len(matches), 3))
+    for m, j in ji.items():
+        o = fixed.get(m)
+        probs[j] = np.eye(3)[_CODE[o]] if o in _CODE else implied_probs(odds_by_match.get(m))
+    table = np.zeros((len(matches), 3, len(users)))
+    base = np.array([float(base_by_user.get(u, 0.0)) for u in users])
+    for b in bets:
+        u, j = ui[b.user], ji[b.match]
+        bm = bm_by_gw.get(b.gw, "")
+        base[u] -= b.stake
+        if b.pick in _CODE:
+            table[j, _CODE[b.pick], u] += b.stake * b.odds
+        if bm and bm != b.user:
+            # BM は他メンバーの net を逆向きに受ける
+            base[ui[bm]] += b.stake
+            if b.pick in _CODE:
+                table[j, _CODE[b.pick], ui[bm]] -= b.stake * b.odds
+    return Market(users, matches, probs, table, base)
+
+
+def _simulate(base: np.ndarray, table: np.ndarray, probs: np.ndarray, n: int, seed) -> Tuple[np.ndarray, np.ndarray]:
+    """n 回抽選して (1位回数, 最終収支の合計) をユーザー別に返す（プロセスプールから呼ばれる）
+    同点の1位は等分して数える（scenarios.lead_shares と同じ）"""
+    rng = np.random.default_rng(seed)
+    net = np.broadcast_to(base, (n, base.shape[0])).copy()
+    if table.shape[0]:
+        cum = np.cumsum(probs, axis=1)[:, :2]                       # k×2
+        u = rng.random((n, table.shape[0]))
+        codes = (u[:, :, None] >= cum[None, :, :]).sum(axis=2)      # N×k（0/1/2）
+        for j in range(table.shape[0]):
+            net += table[j][codes[:, j]]
+    is_top = np.abs(net - net.max(axis=1, keepdims=True)) <= 1e-9
+    wins = (is_top / is_top.sum(axis=1, keepdims=True)).sum(axis=0)
+    return wins, net.sum(axis=0)
+
+
+def simulate(market: Market, n_sims: int = N_SIMS, workers: int = WORKERS, seed: int = 0) -> List[dict]:
+    """[{user, p_first, mean_net}]（p_first の降順）"""
+    if not market.users:
+        return []
+    sizes = [min(CHUNK, n_sims - i) for i in range(0, n_sims, CHUNK)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    args = [(market.base, market.table, market.probs, n, s) for n, s in zip(sizes, seeds)]
+    if workers and len(args) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as ex:
+            parts = list(ex.map(_simulate, *zip(*args)))
+    else:
+        parts = [_simulate(*a) for a in args]
+    wins = sum(p[0] for p in parts)
+    total = sum(p[1] for p in parts)
+    out = [{"user": u, "p_first": float(wins[i] / n_sims), "mean_net": float(total[i] / n_sims)}
+           for i, u in enumerate(market.users)]
+    return sorted(out, key=lambda r: -r["p_first"])
+
+
+_CACHE = cache_store.cache("montecarlo", max_entries=8, max_bytes=4 * 1024 * 1024)
+
+
+def cached(key: Hashable, make_market, n_sims: int = N_SIMS, workers: int = WORKERS) -> List[dict]:
+    """key（例: (season, rev, 固定結果)）ごとに1回だけシミュレーション"""
+    return _CACHE.get_or_load((key, n_sims), lambda: simulate(make_market(), n_sims, workers))
@@ -0,0 +1,162 @@
+# pnl.py
+from __future__ import annotations
+
+from typing import Callable, Dict, Hashable, Iterable, List, Mapping, NamedTuple, Optional, Sequence, Tuple
+
+# ------------------------------------------------------------
+# 損益計算の共通カーネル（画面・精算・集計はすべてここを通す）
+#  - 1ベットの規則：的中なら stake × odds、外れは 0。net = payout - stake
+#  - 確定ベット（result が WIN/LOSE）は payout 列を優先、未記入なら odds から補う
+#  - 試合状態：未開始（SCHEDULED/TIMED/POSTPONED）は結果なし、
+#    それ以外は現在スコアの勝ち側（終了なら確定の勝者）
+#  - バッチ API：ベット行を列（Batch）にまとめ、payout / net の配列と
+#    ユーザー別・GW別の集計を返す。BM は他メンバー net 合計の符号反転
+#  ※ 依存なし（util / app から import される）
+# ------------------------------------------------------------
+OUTCOMES = ("HOME", "DRAW", "AWAY")
+NOT_STARTED = ("SCHEDULED", "TIMED", "POSTPONED")
+FINAL = ("FINISHED", "AWARDED")
+SETTLED_RESULTS = ("WIN", "LOSE")
+
+
+def _int(x, default: int = 0) -> int:
+    try:
+        return int(x)
+    except (TypeError, ValueError):
+        try:
+            return int(float(x))
+        except (TypeError, ValueError):
+            return default
+
+
+def _float(x, default: Optional[float] = None) -> Optional[float]:
+    if x in (None, ""):
+        return default
+    try:
+        return float(x)
+    except (TypeError, ValueError):
+        return default
+
+
+# ---- 1試合・1ベット ----
+def winner(home_score, away_score) -> str:
+    hs, as_ = _int(home_score), _int(away_score)
+    return "DRAW" if hs == as_ else ("HOME" if hs > as_ else "AWAY")
+
+
+def live_outcome(sc: Optional[Mapping]) -> Optional[str]:
+    """スコア辞書 → 現時点の結果（未開始なら None）"""
+    sc = sc or {}
+    if str(sc.get("status") or "").upper() in NOT_STARTED:
+        return None
+    return winner(sc.get("home_score", 0), sc.get("away_score", 0))
+
+
+def payout(stake: float, odds: float, pick: str, outcome: Optional[str]) -> float:
+    return float(stake) * float(odds) if outcome and pick == outcome else 0.0
+
+
+def settle(stake: float, odds: float, pick: str, outcome: str) -> Tuple[str, float, float]:
+    """精算値 (result, payout, net)"""
+    p = payout(stake, odds, pick, outcome)
+    return ("WIN" if pick == outcome else "LOSE"), p, p - float(stake)
+
+
+def is_settled(b: Mapping) -> bool:
+    return str(b.get("result") or "").upper() in SETTLED_RESULTS
+
+
+def settled_amounts(b: Mapping) -> Tuple[int, float]:
+    """確定ベットの (stake, payout)。payout 未記入なら odds から補う"""
+    stake = _int(b.get("stake", 0))
+    p = _float(b.get("payout"))
+    if p is None:
+        odds = _float(b.get("odds"), 1.0) or 1.0
+        p = stake * odds if str(b.get("result") or "").upper() == "WIN" else 0.0
+    return stake, p
+
+
+# ---- バッチ ----
+class Batch(NamedTuple):
+    users: List[str]
+    gws: List[Optional[int]]
+    picks: List[str]
+    stakes: List[int]
+    odds: List[float]
+    settled: List[bool]
+    payouts: List[float]      # 確定ベットの payout（未確定は 0）
+
+
+def batch(bets: Iterable[Mapping], gw_of: Callable[[Mapping], Optional[int]] = lambda b: None) -> Batch:
+    """ベット行 → 列（確定ベットの payout はここで1回だけ解決）"""
+    cols = Batch([], [], [], [], [], [], [])
+    for b in bets:
+        settled = is_settled(b)
+        stake, p = settled_amounts(b) if settled else (_int(b.get("stake", 0)), 0.0)
+        cols.users.append(b.get("user") or "")
+        cols.gws.append(gw_of(b))
+        cols.picks.append(str(b.get("pick") or "").upper())
+        cols.stakes.append(stake)
+        cols.odds.append(_float(b.get("odds"), 1.0) or 1.0)
+        cols.settled.append(settled)
+        cols.payouts.append(p)
+    return cols
+
+
+def evaluate(cols: Batch, outcomes: Sequence[Optional[str]],
+             odds: Optional[Sequence[float]] = None) -> Tuple[List[float], List[float]]:
+    """各ベットを与えた結果で評価 → (payout 配列, net 配列)。odds を渡せばそちらを使う"""
+    odds = cols.odds if odds is None else odds
+    pay = [s * o if oc and p == oc else 0.0
+           for s, o, p, oc in zip(cols.stakes, odds, cols.picks, outcomes)]
+    return pay, [p - s for p, s in zip(pay, cols.stakes)]
+
+
+def rollup(keys: Sequence[Hashable], values: Sequence[float],
+           mask: Optional[Sequence[bool]] = None) -> Dict[Hashable, float]:
+    out: Dict[Hashable, float] = {}
+    for i, k in enumerate(keys):
+        if mask is None or mask[i]:
+            out[k] = out.get(k, 0.0) + values[i]
+    return out
+
+
+def settled_by_gw_user(cols: Batch) -> Dict[Tuple[Optional[int], str], Tuple[int, float, float]]:
+    """確定ベットの (GW, user) 別 (件数, stake, payout)"""
+    out: Dict[Tuple[Optional[int], str], list] = {}
+    for u, n, s, p, ok in zip(cols.users, cols.gws, cols.stakes, cols.payouts, cols.settled):
+        if not ok:
+            continue
+        acc = out.setdefault((n, u), [0, 0.0, 0.0])
+        acc[0] += 1
+        acc[1] += s
+        acc[2] += p
+    return {k: (v[0], v[1], v[2]) for k, v in out.items()}
+
+
+def bm_net(net_by_user: Mapping[str, float], bm_user: str) -> float:
+    """BM の損益（他メンバー net 合計 × -1）"""
+    return -sum(v for u, v in net_by_user.items() if u != bm_user) if bm_user else 0.0
+
+
+def totals_with_bm(cols: Batch, bm_by_gw: Mapping[int, str],
+                   users: Sequence[str]) -> Dict[str, Dict[str, float]]:
+    """
+    確定分のユーザー別総収支 {user: {total_net, bet_net, bm_contrib}}
+    総収支 = 自分のベット net ＋ 自分が BM の GW の BM 寄与
+    """
+    per = settled_by_gw_user(cols)
+    net_by_gw: Dict[Optional[int], Dict[str, float]] = {}
+    for (n, u), (_, s, p) in per.items():
+        net_by_gw.setdefault(n, {})[u] = net_by_gw.get(n, {}).get(u, 0.0) + (p - s)
+    out = {u: {"total_net": 0.0, "bet_net": 0.0, "bm_contrib": 0.0} for u in users}
+    for n, nets in net_by_gw.items():
+        for u, v in nets.items():
+            if u in out:
+                out[u]["bet_net"] += v
+    for n, bm in bm_by_gw.items():
+        if bm in out:
+            out[bm]["bm_contrib"] += bm_net(net_by_gw.get(n, {}), bm)
+    for v in out.values():
+        v["total_net"] = v["bet_net"] + v["bm_contrib"]
+    return out
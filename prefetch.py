@@ -0,0 +1,40 @@
+# prefetch.py
+from __future__ import annotations
+
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+import cache_store
+
+# ------------------------------------------------------------
+# 再実行（rerun）冒頭の並列プリフェッチ
+#  - ページが必要とする読込（シート／API）をスレッドプールで同時に投げる
+#  - 結果は共有キャッシュに入り、ページ側は必要なものだけ待つ
+#    （同じキーの読込は cache_store の single-flight で合流する）
+#  - プールはプロセスで1つ（このモジュールは再実行されない）
+# ------------------------------------------------------------
+MAX_WORKERS = 8
+
+_pool = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="prefetch")
+
+
+def submit(fn: Callable[..., Any], *args, rev: Optional[int] = None, **kwargs) -> Future:
+    """fn をプールで実行（rev を指定するとスレッド内のキャッシュ世代を固定）"""
+    def _run():
+        with cache_store.pinned_rev(rev):
+            return fn(*args, **kwargs)
+    return _pool.submit(_run)
+
+
+def submit_all(tasks: Dict[str, Callable[[], Any]], rev: Optional[int] = None) -> Dict[str, Future]:
+    return {name: submit(fn, rev=rev) for name, fn in tasks.items()}
+
+
+def result(fut: Optional[Future], default=None, timeout: Optional[float] = None):
+    """失敗したプリフェッチは default（呼び出し側で通常読込にフォールバック）"""
+    if fut is None:
+        return default
+    try:
+        return fut.result(timeout=timeout)
+    except Exception:
+        return default
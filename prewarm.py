@@ -0,0 +1,69 @@
+# prewarm.py
+from __future__ import annotations
+
+import threading
+from typing import Callable, Optional
+
+import cache_store
+
+# ------------------------------------------------------------
+# 起動時（およびキャッシュ全クリア直後）のプリウォーム
+#  - プロセスにつき1回、バックグラウンドスレッドでタスクを実行
+#  - 完了は ready イベントで公開（UIは完了までスケルトン表示）
+#  - スレッド内では cache_store.pinned_rev() でキャッシュ世代を固定
+#    （セッション外なので st.session_state は使えない）
+# ------------------------------------------------------------
+_lock = threading.Lock()
+_ready = threading.Event()
+_generation = 0
+_started_generation: Optional[int] = None
+_target_rev = 0
+
+
+def _run(task: Callable[[int], None], rev: int, generation: int):
+    try:
+        with cache_store.pinned_rev(rev):
+            task(rev)
+    except Exception:
+        # 失敗しても通常経路（各ページでのインライン読込）にフォールバックするだけ
+        pass
+    finally:
+        with _lock:
+            if generation == _generation:
+                _ready.set()
+
+
+def start(task: Callable[[int], None], rev: int = 0) -> bool:
+    """現在の世代でまだ走っていなければ開始（開始したら True）"""
+    global _started_generation, _target_rev
+    with _lock:
+        if _started_generation == _generation:
+            return False
+        _started_generation = _generation
+        _target_rev = rev
+        generation = _generation
+    threading.Thread(target=_run, args=(task, rev, generation),
+                     name=f"prewarm-{generation}", daemon=True).start()
+    return True
+
+
+def restart(task: Callable[[int], None], rev: int = 0) -> bool:
+    """キャッシュ全クリア後に呼ぶ：世代を進めて readiness を落としてから再開"""
+    global _generation
+    with _lock:
+        _generation += 1
+        _ready.clear()
+    return start(task, rev)
+
+
+def target_rev() -> int:
+    """現在のプリウォームが温めているキャッシュ世代"""
+    return _target_rev
+
+
+def is_ready() -> bool:
+    return _ready.is_set()
+
+
+def wait(timeout: Optional[float] = None) -> bool:
+    return _ready.wait(timeout)
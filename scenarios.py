@@ -0,0 +1,154 @@
+# scenarios.py
+from __future__ import annotations
+
+from typing import Dict, Hashable, Iterable, List, Mapping, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+import cache_store
+import pnl
+from live_pnl import BetSpec
+
+# ------------------------------------------------------------
+# 結果シナリオ（「残りの試合が ○○ で終わったら」）
+#  - 未終了の試合 k 個の HOME/DRAW/AWAY 全組み合わせ 3^k 通りを一括評価
+#    （終了済みの試合は確定結果で固定。精算済みのベットは記録済みの払戻で固定＝
+#     スコアが取れない試合でも開いたまま扱わない）
+#  - 行列：codes (S×k, 0/1/2) と、試合×結果×ユーザーのペイアウト表 P (k×3×U)
+#    → net[s, u] = Σ_j P[j, codes[s, j], u] + 確定分 - stake
+#  - BM 列は他メンバー net 合計の符号反転
+#  - 首位が同点のシナリオは、同点の人数で按分して数える（全員 100% にはしない）
+#  - 結果は (スコープ, 試合状態の組) でキャッシュ（状態が変わらない再実行は計算しない）
+# ------------------------------------------------------------
+MAX_OPEN = 11          # 3^11 = 177,147 通りまで（それ以上は対象外）
+_CODE = {o: i for i, o in enumerate(pnl.OUTCOMES)}
+
+
+class Scenarios(NamedTuple):
+    users: List[str]            # 列の並び（BM を含む）
+    open_fds: List[str]         # 未終了の試合（codes の列の並び）
+    codes: np.ndarray           # S×k（0=HOME, 1=DRAW, 2=AWAY）
+    net: np.ndarray             # S×U
+    bm_user: str
+
+
+def fixed_outcomes(scores: Mapping[str, Optional[Mapping]], fds: Iterable[str]) -> Dict[str, Optional[str]]:
+    """試合ごとの確定結果（終了済みのみ。未終了は None）"""
+    out = {}
+    for fd in fds:
+        sc = scores.get(fd) or {}
+        if str(sc.get("status") or "").upper() in pnl.FINAL:
+            out[fd] = pnl.winner(sc.get("home_score", 0), sc.get("away_score", 0))
+        else:
+            out[fd] = None
+    return out
+
+
+def enumerate_outcomes(k: int) -> np.ndarray:
+    """3^k × k の結果コード行列（最初の試合が最上位の桁）"""
+    if k == 0:
+        return np.zeros((1, 0), dtype=np.int8)
+    return np.indices((3,) * k, dtype=np.int8).reshape(k, -1).T
+
+
+def build(bets: Sequence[BetSpec], fixed: Mapping[str, Optional[str]], bm_user: str = "",
+          settled: Optional[Mapping[Hashable, float]] = None) -> Optional[Scenarios]:
+    """
+    シナリオ表を作る（未終了が MAX_OPEN を超えるなら None）。
+    settled: 精算済みベットの {BetSpec.key: 記録済みの払戻}
+    """
+    settled = settled or {}
+    live_fds = {b.fd for b in bets if b.user and b.key not in settled}
+    open_fds = sorted(fd for fd, o in fixed.items() if o is None and fd in live_fds)
+    if len(open_fds) > MAX_OPEN:
+        return None
+    users = sorted({b.user for b in bets if b.user} | ({bm_user} if bm_user else set()))
+    ui = {u: i for i, u in enumerate(users)}
+    ji = {fd: j for j, fd in enumerate(open_fds)}
+
+    table = np.zeros((len(open_fds), 3, len(users)))
+    base = np.zeros(len(users))
+    for b in bets:
+        if not b.user:
+            continue
+        u = ui[b.user]
+        base[u] -= b.stake
+        if b.key in settled:
+            base[u] += settled[b.key]
+        elif b.fd in ji and b.pick in _CODE:
+            table[ji[b.fd], _CODE[b.pick], u] += b.stake * b.odds
+        elif b.fd:
+            base[u] += pnl.payout(b.stake, b.odds, b.pick, fixed.get(b.fd))
+
+    codes = enumerate_outcomes(len(open_fds))
+    net = np.broadcast_to(base, (codes.shape[0], len(users))).copy()
+    for j in range(len(open_fds)):
+        net += table[j][codes[:, j]]
+    if bm_user:
+        b = ui[bm_user]
+        net[:, b] = 0.0
+        net[:, b] = -net.sum(axis=1)
+    return Scenarios(users, open_fds, codes, net, bm_user)
+
+
+def outcome_labels(sc: Scenarios, row: int) -> Dict[str, str]:
+    return {fd: pnl.OUTCOMES[c] for fd, c in zip(sc.open_fds, sc.codes[row])}
+
+
+def lead_shares(sc: Scenarios) -> np.ndarray:
+    """S×U：各シナリオで首位の取り分（単独首位 1、n 人同点なら各 1/n）"""
+    top = sc.net.max(axis=1, keepdims=True)
+    is_top = np.abs(sc.net - top) <= 1e-9
+    return is_top / is_top.sum(axis=1, keepdims=True)
+
+
+def extremes(sc: Scenarios) -> List[dict]:
+    """ユーザー別の最良・最悪と、そのときの結果、首位になるシナリオの割合（同点は按分）"""
+    shares = lead_shares(sc)
+    out = []
+    for u, name in enumerate(sc.users):
+        col = sc.net[:, u]
+        best, worst = int(col.argmax()), int(col.argmin())
+        out.append({
+            "user": name,
+            "best": float(col[best]),
+            "best_outcomes": outcome_labels(sc, best),
+            "worst": float(col[worst]),
+            "worst_outcomes": outcome_labels(sc, worst),
+            "lead_share": float(shares[:, u].mean()),
+        })
+    return out
+
+
+def swings(sc: Scenarios) -> List[dict]:
+    """
+    試合ごとに、結果別の「最も多く首位になるユーザー」とその割合（同点は按分）。
+    取り分が並んだユーザーは「・」でつなぐ。結果によって首位が入れ替わる試合は swing=True
+    """
+    shares = lead_shares(sc)
+    out = []
+    for j, fd in enumerate(sc.open_fds):
+        by_outcome = {}
+        for c, o in enumerate(pnl.OUTCOMES):
+            mask = sc.codes[:, j] == c
+            counts = shares[mask].sum(axis=0)
+            best = counts.max()
+            names = "・".join(u for u, v in zip(sc.users, counts) if abs(v - best) <= 1e-9)
+            by_outcome[o] = (names, float(best / max(1, mask.sum())))
+        out.append({"fd": fd, "leaders": by_outcome,
+                    "swing": len({v[0] for v in by_outcome.values()}) > 1})
+    return out
+
+
+_CACHE = cache_store.cache("scenarios", max_entries=16, max_bytes=256 * 1024 * 1024)
+
+
+def cached(scope: Hashable, bets: Sequence[BetSpec], scores: Mapping[str, Optional[Mapping]],
+           fds: Iterable[str], bm_user: str = "",
+           settled: Optional[Mapping[Hashable, float]] = None) -> Optional[Scenarios]:
+    """scope（例: (GW, rev)）と試合状態・精算済みベットの組ごとに1回だけ build する"""
+    fixed = fixed_outcomes(scores, fds)
+    settled = dict(settled or {})
+    key = (scope, bm_user, tuple(sorted(fixed.items(), key=lambda kv: kv[0])),
+           tuple(sorted(settled.items(), key=lambda kv: str(kv[0]))))
+    return _CACHE.get_or_load(key, lambda: build(bets, fixed, bm_user, settled))
@@ -0,0 +1,101 @@
+# season_export.py
+from __future__ import annotations
+
+import os
+from typing import Dict, Iterable, List, Optional
+
+from google_sheets_client import read_rows_by_sheet, read_rows_if_exists
+from sheet_decode import NUMERIC_COLUMNS
+from util import gw_key
+
+# ------------------------------------------------------------
+# シーズンの列指向エクスポート（Parquet, season/GW でパーティション）
+#  - bets / odds / result / bm_log をホット＋アーカイブ（archive.py）から集めて書き出す
+#  - 出力：EXPORT_DIR/<table>/season=<season>/gw_n=<n>/*.parquet（hive 形式）
+#  - 同じ season/GW のパーティションは上書き（何度実行しても同じ結果）
+#  - 型はシート読込と同じ宣言（sheet_decode.NUMERIC_COLUMNS）。それ以外は文字列
+#  ※ pyarrow は requirements.txt で入れる（import は使う時だけ）
+# ------------------------------------------------------------
+EXPORT_DIR = os.environ.get("PREM_PICKS_EXPORT_DIR") or os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), ".cache", "export")
+TABLES = ("bets", "odds", "result", "bm_log")
+ARCHIVED_TABLES = ("bets", "odds", "result")   # bm_log はアーカイブしない
+
+
+def _gw_of(r) -> Optional[int]:
+    n = gw_key(r.get("gw") or None)
+    return n if n is not None else gw_key(r.get("gw_number") or None)
+
+
+def _collect(table: str, season: str) -> List[dict]:
+    import archive
+    recs = [dict(r) for r in read_rows_by_sheet(table)]
+    if table in ARCHIVED_TABLES:
+        # アーカイブ未実行のシーズンはシートが無い
+        recs += [dict(r) for r in read_rows_if_exists(archive.archive_sheet_name(table, season))]
+    return recs
+
+
+def _to_arrow(table: str, season: str, recs: Iterable[dict]):
+    import pyarrow as pa
+
+    recs = [r for r in recs if _gw_of(r) is not None]
+    numeric = NUMERIC_COLUMNS.get(table, {})
+    names: List[str] = []
+    for r in recs:
+        for k in r:
+            if k not in names and not str(k).startswith("_"):
+                names.append(k)
+    arrays, fields = [], []
+    for name in names:
+        kind = numeric.get(name)
+        vals = [r.get(name) for r in recs]
+        if kind is not None:
+            typ = pa.int64() if kind is int else pa.float64()
+            conv = []
+            for v in vals:
+                try:
+                    conv.append(None if v in (None, "") else kind(float(v)))
+                except (TypeError, ValueError):
+                    conv.append(None)
+            arrays.append(pa.array(conv, type=typ))
+        else:
+            typ = pa.string()
+            arrays.append(pa.array([None if v is None else str(v) for v in vals], type=typ))
+        fields.append(pa.field(name, typ))
+    arrays += [pa.array([season] * len(recs), type=pa.string()),
+               pa.array([_gw_of(r) for r in recs], type=pa.int32())]
+    fields += [pa.field("season", pa.string()), pa.field("gw_n", pa.int32())]
+    return pa.Table.from_arrays(arrays, schema=pa.schema(fields))
+
+
+def export_season(season: str, out_dir: Optional[str] = None,
+                  tables: Iterable[str] = TABLES) -> Dict[str, int]:
+    """シーズン分を Parquet に書き出して、表ごとの行数を返す"""
+    import pyarrow.dataset as ds
+
+    out_dir = out_dir or EXPORT_DIR
+    counts: Dict[str, int] = {}
+    for table in tables:
+        tbl = _to_arrow(table, str(season), _collect(table, str(season)))
+        counts[table] = tbl.num_rows
+        if not tbl.num_rows:
+            continue
+        ds.write_dataset(
+            tbl,
+            os.path.join(out_dir, table),
+            format="parquet",
+            partitioning=["season", "gw_n"],
+            partitioning_flavor="hive",
+            existing_data_behavior="delete_matching",
+            basename_template=f"{table}-{{i}}.parquet",
+        )
+    return counts
+
+
+def exported_seasons(out_dir: Optional[str] = None) -> List[str]:
+    base = os.path.join(out_dir or EXPORT_DIR, "bets")
+    try:
+        return sorted(d.split("=", 1)[1] for d in os.listdir(base) if d.startswith("season="))
+    except FileNotFoundError:
+        return []
@@ -0,0 +1,116 @@
+# sheet_decode.py
+from __future__ import annotations
+
+from itertools import zip_longest
+from typing import Callable, Dict, List, Sequence
+
+# ------------------------------------------------------------
+# シート生値（get_values / UNFORMATTED_VALUE）の高速デコーダ
+#  - get_all_records は全セルの型を推測して1行ずつ dict を作る（遅い）うえ、
+#    "007" → 7 のように先頭ゼロの ID や数字だけのキーを数値に変えてしまう
+#  - ここではシートごとに宣言した列型で「列単位」に一括変換する
+#    （未宣言の列は文字列のまま＝ID・キーを壊さない）
+#  - 数値セルは UNFORMATTED_VALUE なので数値で届く（表示形式の影響を受けない）
+#  - 日時セルは FORMATTED_STRING で受ける（シリアル値にしない）
+# ------------------------------------------------------------
+VALUE_RENDER = "UNFORMATTED_VALUE"
+DATETIME_RENDER = "FORMATTED_STRING"
+
+# シートごとの数値列（ここに無い列は文字列）
+NUMERIC_COLUMNS: Dict[str, Dict[str, type]] = {
+    "bets": {"stake": int, "odds": float, "payout": float, "net": float},
+    "odds": {"home_win": float, "draw": float, "away_win": float},
+    "result": {"home_score": int, "away_score": int},
+}
+
+
+def _to_str(v) -> str:
+    if v is None or v == "":
+        return ""
+    if isinstance(v, bool):
+        return "TRUE" if v else "FALSE"
+    if isinstance(v, float) and v.is_integer():
+        return str(int(v))
+    return v if isinstance(v, str) else str(v)
+
+
+def cell_text(v) -> str:
+    """UNFORMATTED_VALUE のセル → 文字列列と同じ規則の文字列（キー照合用）"""
+    return _to_str(v)
+
+
+def _to_number(kind: type) -> Callable[[object], object]:
+    def conv(v):
+        if v is None or v == "":
+            return None
+        if isinstance(v, str):
+            try:
+                v = float(v.replace(",", "").strip())
+            except ValueError:
+                return None
+        if kind is int and float(v).is_integer():
+            return int(v)
+        return float(v)
+    return conv
+
+
+class Columns:
+    """列名 → 値の配列（行順はシートの2行目以降と同じ）"""
+    __slots__ = ("header", "data", "n_rows")
+
+    def __init__(self, header: List[str], data: Dict[str, list], n_rows: int):
+        self.header = header
+        self.data = data
+        self.n_rows = n_rows
+
+    def __getitem__(self, col: str) -> list:
+        return self.data[col]
+
+    def __len__(self) -> int:
+        return self.n_rows
+
+    def records(self) -> List[dict]:
+        """get_all_records 互換の行 dict（数値列の空セルは ""）"""
+        cols = [[("" if v is None else v) for v in self.data[h]] for h in self.header]
+        return [dict(zip(self.header, vals)) for vals in zip(*cols)] if cols else []
+
+
+def decode(sheet: str, values: Sequence[Sequence[object]]) -> Columns:
+    """1行目をヘッダとして列配列に変換（空ヘッダの列は捨てる）"""
+    if not values:
+        return Columns([], {}, 0)
+    header_raw = [_to_str(h).strip() for h in values[0]]
+    body = values[1:]
+    n_rows = len(body)
+    # 行→列の転置を1回で（短い行は "" で埋める）
+    transposed = list(zip_longest(*body, fillvalue="")) if body else []
+    numeric = NUMERIC_COLUMNS.get(sheet, {})
+    header: List[str] = []
+    data: Dict[str, list] = {}
+    for i, name in enumerate(header_raw):
+        if not name or name in data:
+            continue
+        col = transposed[i] if i < len(transposed) else ("",) * n_rows
+        kind = numeric.get(name)
+        header.append(name)
+        if kind:
+            conv = _to_number(kind)
+            data[name] = [v if v.__class__ is kind else conv(v) for v in col]
+        else:
+            # 文字列列はほぼ str のまま届くので、そうでないセルだけ変換
+            data[name] = [v if v.__class__ is str else _to_str(v) for v in col]
+    return Columns(header, data, n_rows)
+
+
+def fetch_values(worksheet) -> List[List[object]]:
+    """生値を1リクエストで取得"""
+    return worksheet.get_values(value_render_option=VALUE_RENDER,
+                                date_time_render_option=DATETIME_RENDER)
+
+
+def read_columns(sheet: str, worksheet) -> Columns:
+    return decode(sheet, fetch_values(worksheet))
+
+
+def read_records(sheet: str, worksheet) -> List[dict]:
+    return read_columns(sheet, worksheet).records()
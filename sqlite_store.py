@@ -0,0 +1,229 @@
+# sqlite_store.py
+from __future__ import annotations
+
+import json
+import os
+import sqlite3
+import threading
+from typing import Dict, List, Optional, Sequence
+
+from sheet_decode import cell_text
+from util import gw_key
+
+# ------------------------------------------------------------
+# ローカル SQLite ストア（シートと同じ表をミリ秒で読み書き）
+#  - 各シートと同名のテーブル。既知の列は TEXT 列、それ以外は extra(JSON) に退避
+#    値はシートの文字列列と同じ規則で文字列化（1000.0 → "1000"、None → ""。NULL は入れない）
+#  - gw 番号（_gw）・user・match_id に索引
+#  - シート側への反映／シートからの取り込みは google_sheets_client 側のレプリケータが担当
+# ------------------------------------------------------------
+DB_DIR = os.environ.get("PREM_PICKS_CACHE_DIR") or os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache")
+DB_PATH = os.path.join(DB_DIR, "prem_picks.sqlite3")
+
+# シートごとの列（シートのヘッダ順）と主キー
+SCHEMAS: Dict[str, Dict[str, Sequence[str]]] = {
+    "config": {
+        "columns": ("key", "value"),
+        "key": ("key",),
+    },
+    "odds": {
+        "columns": ("gw", "match_id", "fd_match_id", "home", "away",
+                    "home_win", "draw", "away_win", "locked", "updated_at"),
+        "key": ("match_id", "gw"),
+    },
+    "bets": {
+        "columns": ("key", "gw", "user", "match_id", "match", "pick", "stake", "odds",
+                    "placed_at", "status", "result", "payout", "net", "settled_at", "updated_at"),
+        "key": ("key",),
+    },
+    "result": {
+        "columns": ("match_id", "gw", "home", "away", "status", "home_score", "away_score",
+                    "winner", "finalized_at", "source", "raw_json", "updated_at"),
+        "key": ("match_id",),
+    },
+    "bm_log": {
+        "columns": ("gw", "gw_number", "bookmaker", "decided_at"),
+        "key": ("gw", "gw_number"),
+    },
+    "gw_summary": {
+        "columns": ("season", "gw", "user", "role", "n_bets", "stake", "payout",
+                    "bet_net", "bm_net", "total_net", "archived", "updated_at", "bets_sig"),
+        "key": ("season", "gw", "user"),
+    },
+    "standings": {
+        "columns": ("season", "user", "n_bets", "stake", "payout",
+                    "bet_net", "bm_net", "total_net", "updated_at"),
+        "key": ("season", "user"),
+    },
+    "access_log": {
+        "columns": ("username", "access_time", "display_size", "devicePixelRatio"),
+        "key": ("username", "access_time"),
+    },
+}
+INDEXED = ("_gw", "user", "match_id")
+
+_tls = threading.local()
+_init_lock = threading.Lock()
+_initialized = False
+
+
+def _q(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _conn() -> sqlite3.Connection:
+    c = getattr(_tls, "conn", None)
+    if c is None:
+        os.makedirs(DB_DIR, exist_ok=True)
+        c = sqlite3.connect(DB_PATH, timeout=30)
+        c.execute("PRAGMA journal_mode=WAL")
+        c.execute("PRAGMA synchronous=NORMAL")
+        _tls.conn = c
+        _ensure_schema(c)
+    return c
+
+
+def _ensure_schema(c: sqlite3.Connection):
+    global _initialized
+    with _init_lock:
+        if _initialized:
+            return
+        for sheet, sc in SCHEMAS.items():
+            cols = ", ".join(f"{_q(col)} TEXT" for col in sc["columns"])
+            c.execute(f"CREATE TABLE IF NOT EXISTS {_q(sheet)} "
+                      f"(_rowid INTEGER PRIMARY KEY, _gw INTEGER, {cols}, extra TEXT)")
+            # 後から増えた列は既存のDBに足す（列は名前で読み書きするので末尾でよい）
+            have = {r[1] for r in c.execute(f"PRAGMA table_info({_q(sheet)})")}
+            for col in sc["columns"]:
+                if col not in have:
+                    c.execute(f"ALTER TABLE {_q(sheet)} ADD COLUMN {_q(col)} TEXT")
+            keycols = ", ".join(_q(k) for k in sc["key"])
+            c.execute(f"CREATE INDEX IF NOT EXISTS {_q(f'ix_{sheet}_key')} ON {_q(sheet)} ({keycols})")
+            for col in INDEXED:
+                if col == "_gw" or col in sc["columns"]:
+                    c.execute(f"CREATE INDEX IF NOT EXISTS {_q(f'ix_{sheet}_{col}')} ON {_q(sheet)} ({_q(col)})")
+        c.execute("CREATE TABLE IF NOT EXISTS _meta (name TEXT PRIMARY KEY, value TEXT)")
+        c.commit()
+        _initialized = True
+
+
+def _schema(sheet: str) -> Dict[str, Sequence[str]]:
+    sc = SCHEMAS.get(sheet)
+    if sc is None:
+        raise KeyError(f"unknown sheet: {sheet}")
+    return sc
+
+
+def _text(v) -> str:
+    # ★ 整数値の float を "1000.0" で入れると parse_int が 0 に落ちる → "1000" に揃える
+    return cell_text(v)
+
+
+def _key_where(key_cols: Sequence[str]) -> str:
+    # 列をそのまま比較（COALESCE で包むと ix_{sheet}_key が使われない）
+    return " AND ".join(f"{_q(k)} = ?" for k in key_cols)
+
+
+def _split(sheet: str, row: dict):
+    cols = _schema(sheet)["columns"]
+    known = [_text(row.get(col)) for col in cols]
+    extra = {k: v for k, v in row.items() if k not in cols and not str(k).startswith("_")}
+    gw = gw_key(row.get("gw") or None)
+    if gw is None:
+        gw = gw_key(row.get("gw_number") or None)
+    return gw, known, (json.dumps(extra, ensure_ascii=False, default=str) if extra else None)
+
+
+def _to_dict(sheet: str, rec: sqlite3.Row) -> dict:
+    cols = _schema(sheet)["columns"]
+    out = {col: rec[i] for i, col in enumerate(cols)}
+    extra = rec[len(cols)]
+    if extra:
+        try:
+            out.update(json.loads(extra))
+        except ValueError:
+            pass
+    return out
+
+
+# ---- 読み出し ----
+def read_rows(sheet: str, where: Optional[Dict[str, object]] = None) -> List[dict]:
+    cols = _schema(sheet)["columns"]
+    sel = ", ".join(_q(col) for col in cols) + ", extra"
+    sql = f"SELECT {sel} FROM {_q(sheet)}"
+    params: list = []
+    if where:
+        sql += " WHERE " + " AND ".join(f"{_q(k)} = ?" for k in where)
+        params = list(where.values())
+    sql += " ORDER BY _rowid"
+    return [_to_dict(sheet, r) for r in _conn().execute(sql, params)]
+
+
+def row_count(sheet: str) -> int:
+    return int(_conn().execute(f"SELECT COUNT(*) FROM {_q(sheet)}").fetchone()[0])
+
+
+# ---- 書き込み ----
+def upsert(sheet: str, row: dict, key_cols: Optional[Sequence[str]] = None):
+    """key_cols（省略時はスキーマの主キー）で一致行を更新、無ければ追加"""
+    cols = _schema(sheet)["columns"]
+    key_cols = tuple(key_cols or _schema(sheet)["key"])
+    gw, known, extra = _split(sheet, row)
+    c = _conn()
+    with c:
+        hit = c.execute(f"SELECT _rowid FROM {_q(sheet)} WHERE {_key_where(key_cols)} ORDER BY _rowid LIMIT 1",
+                        [_text(row.get(k)) for k in key_cols]).fetchone()
+        if hit:
+            sets = ", ".join(f"{_q(col)} = ?" for col in cols)
+            c.execute(f"UPDATE {_q(sheet)} SET _gw = ?, {sets}, extra = ? WHERE _rowid = ?",
+                      [gw, *known, extra, hit[0]])
+        else:
+            names = ", ".join(_q(col) for col in cols)
+            marks = ", ".join("?" for _ in cols)
+            c.execute(f"INSERT INTO {_q(sheet)} (_gw, {names}, extra) VALUES (?, {marks}, ?)",
+                      [gw, *known, extra])
+
+
+def update_cols(sheet: str, rows: List[dict], key_cols: Optional[Sequence[str]] = None) -> int:
+    """一致行の指定列だけを書き換える（無い行は追加しない）。書き換えた行数を返す"""
+    cols = _schema(sheet)["columns"]
+    key_cols = tuple(key_cols or _schema(sheet)["key"])
+    where = _key_where(key_cols)
+    n = 0
+    c = _conn()
+    with c:
+        for row in rows:
+            sets = [k for k in row if k in cols and k not in key_cols]
+            if not sets:
+                continue
+            cur = c.execute(f"UPDATE {_q(sheet)} SET {', '.join(f'{_q(k)} = ?' for k in sets)} WHERE {where}",
+                            [_text(row[k]) for k in sets] + [_text(row.get(k)) for k in key_cols])
+            n += cur.rowcount
+    return n
+
+
+def replace_all(sheet: str, rows: List[dict]):
+    """テーブルの中身を丸ごと差し替え（シートからの取り込み用・1トランザクション）"""
+    cols = _schema(sheet)["columns"]
+    names = ", ".join(_q(col) for col in cols)
+    marks = ", ".join("?" for _ in cols)
+    c = _conn()
+    with c:
+        c.execute(f"DELETE FROM {_q(sheet)}")
+        c.executemany(
+            f"INSERT INTO {_q(sheet)} (_gw, {names}, extra) VALUES (?, {marks}, ?)",
+            [[gw, *known, extra] for gw, known, extra in (_split(sheet, r) for r in rows)],
+        )
+
+
+# ---- メタ情報（最終取り込み時刻など）----
+def get_meta(name: str) -> Optional[str]:
+    r = _conn().execute("SELECT value FROM _meta WHERE name = ?", (name,)).fetchone()
+    return r[0] if r else None
+
+
+def set_meta(name: str, value: str):
+    c = _conn()
+    with c:
+        c.execute("INSERT INTO _meta (name, value) VALUES (?, ?) "
+                  "ON CONFLICT(name) DO UPDATE SET value = excluded.value", (name, value))
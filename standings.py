@@ -0,0 +1,192 @@
+# standings.py
+from __future__ import annotations
+
+import hashlib
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Set
+
+import pnl
+import sheet_decode
+from google_sheets_client import ensure_sheet, read_rows_by_sheet, upsert_row
+from util import gw_key
+
+# ------------------------------------------------------------
+# 確定収支の実体化テーブル（精算時に更新、画面は読むだけ）
+#  - gw_summary：シーズン×GW×ユーザーの確定集計（BM寄与込み）
+#  - standings ：シーズン×ユーザーの通算（gw_summary の合計）
+#  - 精算で変わったGW（＋集計漏れ・BM変更のGW）だけ作り直し、値が変わった行だけ書く
+#  - アーカイブ済み（archived=YES）のGWは明細がホットに無いので触らない
+#  - bets_sig：集計元の確定ベット（stake・payout・結果など）の指紋。
+#    手修正で明細が変わったGWは指紋が食い違うので作り直し対象になる
+# ------------------------------------------------------------
+SUMMARY_SHEET = "gw_summary"
+SUMMARY_HEADER = ["season", "gw", "user", "role", "n_bets", "stake", "payout",
+                  "bet_net", "bm_net", "total_net", "archived", "updated_at", "bets_sig"]
+SUMMARY_KEY = ["season", "gw", "user"]
+STANDINGS_SHEET = "standings"
+STANDINGS_HEADER = ["season", "user", "n_bets", "stake", "payout",
+                    "bet_net", "bm_net", "total_net", "updated_at"]
+STANDINGS_KEY = ["season", "user"]
+_VALUE_COLS = ("role", "n_bets", "stake", "payout", "bet_net", "bm_net", "total_net", "bets_sig")
+_SIG_COLS = ("key", "user", "stake", "odds", "result", "payout")
+
+
+def _num(x, default: float = 0.0) -> float:
+    try:
+        return float(x)
+    except (TypeError, ValueError):
+        return default
+
+
+def _gw_of(r) -> Optional[int]:
+    n = gw_key(r.get("gw") or None)
+    return n if n is not None else gw_key(r.get("gw_number") or None)
+
+
+def bm_by_gw(bm_logs: Iterable) -> Dict[int, str]:
+    out = {}
+    for r in bm_logs:
+        n = _gw_of(r)
+        bm = str(r.get("bookmaker") or r.get("user") or "").strip()
+        if n is not None and bm:
+            out[n] = bm
+    return out
+
+
+def bets_sig(gw_bets: Iterable) -> str:
+    """GWの確定ベットの指紋（行順・数値の表記ゆれ 1500.0 / "1500" には左右されない）"""
+    items = sorted("|".join(sheet_decode.cell_text(b.get(k)) for k in _SIG_COLS)
+                   for b in gw_bets if pnl.is_settled(b))
+    return hashlib.sha1("\n".join(items).encode("utf-8")).hexdigest()[:12]
+
+
+def summarize_gw(season: str, gw_n: int, gw_bets: List, usernames: List[str], bm_user: str,
+                 archived: bool = False) -> List[dict]:
+    """GW×ユーザーの確定集計（BM は他メンバーの確定 net の符号反転を加算）"""
+    now = datetime.utcnow().isoformat(timespec="seconds")
+    per = {u: {"n_bets": 0, "stake": 0.0, "payout": 0.0} for u in usernames}
+    for (_, u), (n_bets, stake, payout) in pnl.settled_by_gw_user(pnl.batch(gw_bets)).items():
+        if u in per:
+            per[u] = {"n_bets": n_bets, "stake": float(stake), "payout": payout}
+    bm_total = pnl.bm_net({u: v["payout"] - v["stake"] for u, v in per.items()}, bm_user)
+    sig = bets_sig(gw_bets)
+    out = []
+    for u in usernames:
+        v = per[u]
+        bet_net = v["payout"] - v["stake"]
+        bm_net = bm_total if (bm_user and u == bm_user) else 0.0
+        out.append({
+            "season": season,
+            "gw": f"GW{gw_n}",
+            "user": u,
+            "role": "BM" if u == bm_user else "PLAYER",
+            "n_bets": v["n_bets"],
+            "stake": round(v["stake"], 2),
+            "payout": round(v["payout"], 2),
+            "bet_net": round(bet_net, 2),
+            "bm_net": round(bm_net, 2) or 0.0,
+            "total_net": round(bet_net + bm_net, 2),
+            "archived": "YES" if archived else "",
+            "updated_at": now,
+            "bets_sig": sig,
+        })
+    return out
+
+
+def _same(old, new) -> bool:
+    for k in _VALUE_COLS:
+        if k not in new:
+            continue
+        a, b = old.get(k), new.get(k)
+        if isinstance(b, (int, float)):
+            # 空欄・非数値（NaN）は「違う」扱い（書き直す）
+            if not abs(_num(a, float("nan")) - b) <= 0.005:
+                return False
+        elif str(a or "") != str(b or ""):
+            return False
+    return True
+
+
+def stale_gws(season: str, bets_rows: Iterable, bm_logs: Iterable, summary_rows: Iterable) -> Set[int]:
+    """集計漏れ（確定ベットがあるのに gw_summary に無い）・BM が食い違う・明細が手修正されたGW"""
+    have: Dict[int, Dict[str, str]] = {}
+    sigs: Dict[int, Set[str]] = {}
+    archived: Set[int] = set()
+    for r in summary_rows:
+        n = _gw_of(r)
+        if str(r.get("season") or "") != season or n is None:
+            continue
+        have.setdefault(n, {})[str(r.get("user") or "")] = str(r.get("role") or "").upper()
+        sigs.setdefault(n, set()).add(str(r.get("bets_sig") or ""))
+        if str(r.get("archived") or "").upper() == "YES":
+            archived.add(n)
+    by_gw: Dict[int, list] = {}
+    for b in bets_rows:
+        n = _gw_of(b)
+        if n is not None:
+            by_gw.setdefault(n, []).append(b)
+    out = {n for n, gw_bets in by_gw.items() if n not in have and any(pnl.is_settled(b) for b in gw_bets)}
+    for n, bm in bm_by_gw(bm_logs).items():
+        roles = have.get(n)
+        if roles is not None and roles.get(bm) != "BM":
+            out.add(n)
+    # 明細（確定ベット）の指紋が集計時と違う → 作り直す（アーカイブ済みは明細がホットに無いので除く）
+    for n, seen in sigs.items():
+        if n not in archived and seen != {bets_sig(by_gw.get(n, []))}:
+            out.add(n)
+    return out - archived
+
+
+def refresh(season: str, gws: Iterable[int], bets_rows: List, bm_logs: List,
+            usernames: List[str], summary_rows: Optional[List] = None) -> Dict[str, int]:
+    """指定GWの gw_summary と、シーズンの standings を更新（書いた行数を返す）"""
+    gws = sorted(set(gws))
+    if not gws:
+        return {"gw_summary": 0, "standings": 0}
+    ensure_sheet(SUMMARY_SHEET, SUMMARY_HEADER)
+    ensure_sheet(STANDINGS_SHEET, STANDINGS_HEADER)
+    if summary_rows is None:
+        summary_rows = read_rows_by_sheet(SUMMARY_SHEET)
+    summary = {tuple(str(r.get(k, "")) for k in SUMMARY_KEY): dict(r) for r in summary_rows}
+    archived = {_gw_of(r) for r in summary.values()
+                if str(r.get("season") or "") == season and str(r.get("archived") or "").upper() == "YES"}
+    bms = bm_by_gw(bm_logs)
+    by_gw: Dict[int, list] = {}
+    for b in bets_rows:
+        n = _gw_of(b)
+        if n in gws:
+            by_gw.setdefault(n, []).append(b)
+
+    written = {"gw_summary": 0, "standings": 0}
+    for n in gws:
+        if n in archived:
+            continue
+        for row in summarize_gw(season, n, by_gw.get(n, []), usernames, bms.get(n, "")):
+            key = tuple(str(row[k]) for k in SUMMARY_KEY)
+            old = summary.get(key)
+            if old is not None and _same(old, row):
+                continue
+            upsert_row(SUMMARY_SHEET, row, key_cols=SUMMARY_KEY)
+            summary[key] = row
+            written["gw_summary"] += 1
+
+    # 通算：このシーズンの gw_summary を合計（小さな表なので全件でよい）
+    totals = {u: {"n_bets": 0, "stake": 0.0, "payout": 0.0, "bet_net": 0.0, "bm_net": 0.0, "total_net": 0.0}
+              for u in usernames}
+    for r in summary.values():
+        u = r.get("user")
+        if str(r.get("season") or "") != season or u not in totals:
+            continue
+        for k in totals[u]:
+            totals[u][k] += _num(r.get(k))
+    current = {tuple(str(r.get(k, "")) for k in STANDINGS_KEY): r for r in read_rows_by_sheet(STANDINGS_SHEET)}
+    now = datetime.utcnow().isoformat(timespec="seconds")
+    for u, t in totals.items():
+        row = {"season": season, "user": u, "n_bets": int(t["n_bets"]),
+               **{k: round(v, 2) for k, v in t.items() if k != "n_bets"}, "updated_at": now}
+        old = current.get((season, u))
+        if old is not None and _same(old, row):
+            continue
+        upsert_row(STANDINGS_SHEET, row, key_cols=STANDINGS_KEY)
+        written["standings"] += 1
+    return written
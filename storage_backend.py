@@ -0,0 +1,167 @@
+# storage_backend.py
+from __future__ import annotations
+
+import json
+import os
+import threading
+from typing import Callable, Dict, List, Optional, Protocol, Sequence, runtime_checkable
+
+# ------------------------------------------------------------
+# ストレージの差し替え口
+#  - 読み書きの入口（read_rows / upsert_row / update_cols / append_rows / replace_rows / ensure_sheet）を StorageBackend として定義
+#  - 実装：sheets（gspread・既定）／sqlite（ローカル主＋シートレプリカ）／memory（オフライン用）
+#    sheets / sqlite は google_sheets_client が import 時に登録する
+#  - どれを使うかは設定で選ぶ：環境変数 PREM_PICKS_STORAGE ＞ st.secrets["storage"]["backend"]
+#  ※ このモジュールは gspread / streamlit に依存しない（ベンチ・検証をオフラインで回せる）
+# ------------------------------------------------------------
+DEFAULT_BACKEND = "sheets"
+
+
+@runtime_checkable
+class StorageBackend(Protocol):
+    name: str
+
+    def read_rows(self, sheet: str, strict: bool = False) -> List[dict]:
+        """シート（表）の全行。戻り値は呼び出し側が書き換えてよいコピー
+        strict=True なら読み取り失敗を例外で返す（空の表と区別したい読み用）"""
+        ...
+
+    def upsert_row(self, sheet: str, row: dict,
+                   key_col: Optional[str] = None, key_cols: Optional[Sequence[str]] = None) -> None:
+        """キー一致行を更新、無ければ追加（キー無しは常に追加）"""
+        ...
+
+    def update_cols(self, sheet: str, rows: List[dict],
+                    key_col: Optional[str] = None, key_cols: Optional[Sequence[str]] = None) -> None:
+        """キー一致行の、渡した列だけを書き換え（一致しない行は捨てる）"""
+        ...
+
+    def append_rows(self, sheet: str, rows: List[dict]) -> None:
+        """読まずに末尾へまとめて追記"""
+        ...
+
+    def replace_rows(self, sheet: str, rows: List[dict]) -> None:
+        """中身（ヘッダ以外）を丸ごと置き換え"""
+        ...
+
+    def ensure_sheet(self, sheet: str, header: List[str]) -> None:
+        """表が無ければ作る"""
+        ...
+
+
+def _key_of(row: dict, cols: Sequence[str]) -> tuple:
+    return tuple(str(row.get(k, "")) for k in cols)
+
+
+class MemoryBackend:
+    """
+    プロセス内の dict だけで完結する実装（ネットワーク・ディスク無し）。
+    seed: {sheet: [row, ...]} または同形式の JSON ファイルのパス
+    """
+    name = "memory"
+
+    def __init__(self, seed: Optional[object] = None):
+        self._lock = threading.RLock()
+        self._tables: Dict[str, List[dict]] = {}
+        if isinstance(seed, str):
+            with open(seed, encoding="utf-8") as f:
+                seed = json.load(f)
+        for sheet, rows in dict(seed or {}).items():
+            self._tables[sheet] = [dict(r) for r in rows]
+
+    def read_rows(self, sheet: str, strict: bool = False) -> List[dict]:
+        with self._lock:
+            return [dict(r) for r in self._tables.get(sheet, [])]
+
+    def upsert_row(self, sheet, row, key_col=None, key_cols=None):
+        cols = list(key_cols or ([key_col] if key_col else []))
+        clean = {k: v for k, v in dict(row).items() if not str(k).startswith("_")}
+        with self._lock:
+            table = self._tables.setdefault(sheet, [])
+            if cols:
+                key = _key_of(clean, cols)
+                for i, r in enumerate(table):
+                    if _key_of(r, cols) == key:
+                        # シートと同じく行全体の置き換え（渡さなかった列は空欄）
+                        table[i] = {**{k: "" for k in r}, **clean}
+                        return
+            table.append(clean)
+
+    def update_cols(self, sheet, rows, key_col=None, key_cols=None):
+        cols = list(key_cols or [key_col])
+        with self._lock:
+            table = self._tables.get(sheet, [])
+            pos = {_key_of(r, cols): i for i, r in reversed(list(enumerate(table)))}
+            for row in rows:
+                i = pos.get(_key_of(row, cols))
+                if i is not None:
+                    table[i] = {**table[i], **{k: v for k, v in dict(row).items() if not str(k).startswith("_")}}
+
+    def append_rows(self, sheet, rows):
+        with self._lock:
+            self._tables.setdefault(sheet, []).extend(
+                {k: v for k, v in dict(r).items() if not str(k).startswith("_")} for r in rows
+            )
+
+    def replace_rows(self, sheet, rows):
+        with self._lock:
+            self._tables[sheet] = [
+                {k: v for k, v in dict(r).items() if not str(k).startswith("_")} for r in rows
+            ]
+
+    def ensure_sheet(self, sheet, header):
+        with self._lock:
+            self._tables.setdefault(sheet, [])
+
+    def dump(self) -> Dict[str, List[dict]]:
+        with self._lock:
+            return {s: [dict(r) for r in rows] for s, rows in self._tables.items()}
+
+
+# ------------------------------------------------------------
+# 登録と選択（名前ごとに1インスタンス）
+# ------------------------------------------------------------
+_lock = threading.Lock()
+_factories: Dict[str, Callable[[], StorageBackend]] = {
+    "memory": lambda: MemoryBackend(os.environ.get("PREM_PICKS_MEMORY_SEED") or None),
+}
+_instances: Dict[str, StorageBackend] = {}
+_override: Optional[StorageBackend] = None
+
+
+def register(name: str, factory: Callable[[], StorageBackend]):
+    with _lock:
+        _factories[name] = factory
+        _instances.pop(name, None)
+
+
+def configured_name() -> str:
+    name = os.environ.get("PREM_PICKS_STORAGE")
+    if not name:
+        try:
+            import streamlit as st
+            name = (st.secrets.get("storage") or {}).get("backend")
+        except Exception:
+            name = None
+    return str(name or DEFAULT_BACKEND).strip().lower()
+
+
+def use(backend: Optional[StorageBackend]):
+    """設定を無視して使う実装を固定（ベンチ・検証用。None で解除）"""
+    global _override
+    _override = backend
+
+
+def current() -> StorageBackend:
+    if _override is not None:
+        return _override
+    name = configured_name()
+    with _lock:
+        b = _instances.get(name)
+        if b is None:
+            factory = _factories.get(name)
+            if factory is None:
+                raise KeyError(f"unknown storage backend: {name} (available: {', '.join(sorted(_factories))})")
+            b = factory()
+            _instances[name] = b
+        return b
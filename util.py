@@ -1,7 +1,12 @@
 from __future__ import annotations
 import json, re
+from functools import lru_cache
 from typing import Dict, Optional, Iterable
 
+import pnl
+
+_GW_DIGITS = re.compile(r"(\d+)")
+
 def safe_int(v, default=0):
     try:
         return int(float(v))
@@ -17,30 +22,47 @@ def fmt_yen(n: float | int) -> str:
 def to_local(dt, tz):
     return dt.astimezone(tz)
 
+@lru_cache(maxsize=4096)
+def gw_key(gw: str|int|None) -> Optional[int]:
+    """
+    GW表記の正規化キー（"GW7" / "gw 7" / "7" / 7 → 7、解釈不能なら None）。
+    キャッシュ・索引・比較はすべてこの整数を使う。表記ごとに1回だけ解析される。
+    """
+    if gw is None or isinstance(gw, bool):
+        return None
+    if isinstance(gw, int):
+        return gw
+    if isinstance(gw, float):
+        return int(gw)
+    m = _GW_DIGITS.search(str(gw))
+    return int(m.group(1)) if m else None
+
 def gw_label(gw: str|int|None) -> str:
     if gw is None: return "GW"
-    s = str(gw)
-    return s if s.startswith("GW") else f"GW{safe_int(s,0)}"
+    n = gw_key(gw)
+    return f"GW{n if n is not None else 0}"
 
 def gw_sort_key(gw: str) -> tuple:
     """'GW7','GW10' 等を正しく昇順にするキー"""
-    m = re.search(r"(\d+)", str(gw))
-    n = int(m.group(1)) if m else 0
-    return (n, str(gw))
+    n = gw_key(gw)
+    return (n if n is not None else 0, str(gw))
 
 def outcome_text_jp(o: Optional[str]) -> str:
     return {"HOME":"ホーム勝ち","DRAW":"引き分け","AWAY":"アウェイ勝ち"}.get(o or "", "-")
 
 def calc_payout_and_net(pick: str|None, outcome: str|None, stake: int|float,
                         odds_home: float, odds_draw: float, odds_away: float) -> tuple[int,int]:
+    """1ベットの (payout, net) を整数で（計算は pnl に委譲）"""
     pick = (pick or "").upper()
     outcome = (outcome or "").upper()
+    if not pick:
+        return 0, 0
     stake = safe_int(stake, 0)
-    if pick and outcome and pick == outcome:
-        odd = {"HOME":odds_home, "DRAW":odds_draw, "AWAY":odds_away}[pick]
-        payout = int(round(stake * float(odd)))
-        return payout, payout - stake
-    return 0, -stake if pick else 0
+    odds = {"HOME":odds_home, "DRAW":odds_draw, "AWAY":odds_away}
+    # 的中時に未知の pick なら従来どおり KeyError
+    odd = odds[pick] if pick == outcome else odds.get(pick, 1.0)
+    payout = int(round(pnl.payout(stake, float(odd), pick, outcome or None)))
+    return payout, payout - stake
 
 def safe_userlist_from_config(users_json: str) -> list[dict]:
     try:
@@ -0,0 +1,136 @@
+# warm_cache.py
+from __future__ import annotations
+
+import gzip
+import json
+import os
+import threading
+import time
+from typing import Dict, List, Optional
+
+# ------------------------------------------------------------
+# ディスク永続のウォームキャッシュ
+#  - シート表（生の行）と「確定済みスコア」をローカルの圧縮ファイルに保存
+#  - プロセス起動時に読み込み、最初の描画はスナップショットで返す
+#    （呼び出し側がバックグラウンドで再取得して差し替える）
+#  - 保存は変更後しばらく待ってまとめて1回（デバウンス）
+#  - config シートは保存しない（API トークンや users_json のパスワードを含む）
+# ------------------------------------------------------------
+CACHE_DIR = os.environ.get("PREM_PICKS_CACHE_DIR") or os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache")
+SNAPSHOT_PATH = os.path.join(CACHE_DIR, "warm_cache.json.gz")
+MAX_AGE_SEC = 3600                        # シート行：これより古いスナップショットは使わない
+FINAL_SCORES_MAX_AGE_SEC = 3 * 24 * 3600  # 確定スコアは変わらないので長めに使う
+EXCLUDED_SHEETS = frozenset({"config"})
+FLUSH_DELAY_SEC = 5.0
+
+FINAL_STATUSES = ("FINISHED", "AWARDED")
+
+_lock = threading.RLock()
+_state: Dict[str, dict] = {"sheets": {}, "final_scores": {}}
+_consumed: set = set()           # 起動後すでにスナップショットを返したシート
+_loaded = False
+_flush_timer: Optional[threading.Timer] = None
+
+
+def _load_once():
+    global _loaded
+    with _lock:
+        if _loaded:
+            return
+        _loaded = True
+        try:
+            with gzip.open(SNAPSHOT_PATH, "rt", encoding="utf-8") as f:
+                data = json.load(f)
+            age = time.time() - float(data.get("saved_at", 0))
+            sheets = dict(data.get("sheets") or {})
+            if age <= MAX_AGE_SEC:
+                _state["sheets"] = {k: v for k, v in sheets.items() if k not in EXCLUDED_SHEETS}
+            if age <= FINAL_SCORES_MAX_AGE_SEC:
+                _state["final_scores"] = dict(data.get("final_scores") or {})
+            if EXCLUDED_SHEETS & set(sheets):
+                # 旧版が保存した config をファイルから消す
+                _schedule_flush()
+        except Exception:
+            # 無い・壊れている → コールドスタート扱い
+            pass
+
+
+def _flush():
+    global _flush_timer
+    with _lock:
+        _flush_timer = None
+        payload = {
+            "saved_at": time.time(),
+            "sheets": dict(_state["sheets"]),
+            "final_scores": dict(_state["final_scores"]),
+        }
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        tmp = SNAPSHOT_PATH + ".tmp"
+        with gzip.open(tmp, "wt", encoding="utf-8", compresslevel=6) as f:
+            json.dump(payload, f, ensure_ascii=False, default=str)
+        os.replace(tmp, SNAPSHOT_PATH)
+    except Exception:
+        # 保存失敗はキャッシュが温まらないだけ（動作には影響させない）
+        pass
+
+
+def _schedule_flush():
+    global _flush_timer
+    with _lock:
+        if _flush_timer is not None:
+            return
+        _flush_timer = threading.Timer(FLUSH_DELAY_SEC, _flush)
+        _flush_timer.daemon = True
+        _flush_timer.start()
+
+
+# ---- シート表 ----
+def take_sheet(sheet: str) -> Optional[List[dict]]:
+    """
+    起動後の初回だけスナップショットの行を返す（2回目以降・未保存は None）。
+    呼び出し側は返した行で描画し、並行して最新を取り直すこと。
+    """
+    _load_once()
+    with _lock:
+        if sheet in _consumed:
+            return None
+        _consumed.add(sheet)
+        rows_ = _state["sheets"].get(sheet)
+        return [dict(r) for r in rows_] if rows_ is not None else None
+
+
+def remember_sheet(sheet: str, rows_: List[dict]):
+    if sheet in EXCLUDED_SHEETS:
+        return
+    _load_once()
+    with _lock:
+        _consumed.add(sheet)
+        _state["sheets"][sheet] = [
+            {k: v for k, v in r.items() if not str(k).startswith("_")} for r in rows_
+        ]
+    _schedule_flush()
+
+
+# ---- 確定スコア（FINISHED/AWARDED は二度と変わらないので再取得しない）----
+def final_scores() -> Dict[str, dict]:
+    _load_once()
+    with _lock:
+        return _state["final_scores"]
+
+
+def remember_final_scores(scores: Dict[str, dict]):
+    fin = {k: dict(v) for k, v in (scores or {}).items()
+           if (str((v or {}).get("status") or "")).upper() in FINAL_STATUSES}
+    if not fin:
+        return
+    _load_once()
+    with _lock:
+        new = {k: v for k, v in fin.items() if _state["final_scores"].get(k) != v}
+        if not new:
+            return
+        # 読み手に渡している dict は差し替えで更新（反復中の変更を避ける）
+        merged = dict(_state["final_scores"])
+        merged.update(new)
+        _state["final_scores"] = merged
+    _schedule_flush()
@@ -0,0 +1,376 @@
+# write_journal.py
+from __future__ import annotations
+
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional
+
+# ------------------------------------------------------------
+# シート書き込みのローカル先行ログ（WAL）
+#  - upsert はまずローカルのジャーナルに追記（fsync）して即座に戻る
+#  - バックグラウンドスレッドがシートへまとめて再生（失敗時は指数バックオフで再試行）
+#  - 反映済みになったエントリだけジャーナルから消す（プロセスが落ちても再起動後に再生）
+#  - 未反映分は読込結果に重ねて返す（overlay）ので、書いた直後の再描画でも見える
+#  - op は "upsert"（行全体）か "update_cols"（キー一致行の指定列だけ。無い行は追加しない）
+#  - シート単位のまとめ書きが失敗したら1件ずつ当て直し、反映できない行だけを切り分ける
+#    （見送り＝Deferred は失敗に数えない）。MAX_ATTEMPTS 回失敗し、かつ最初の失敗から
+#    DEAD_AFTER_SEC 経ったエントリは dead letter（別ファイル）へ移し、後続を止めない
+#  - held(sheets) の間は指定シートの再生だけを止める（記録は続く。読み直し→置き換え用）
+# ------------------------------------------------------------
+JOURNAL_DIR = os.environ.get("PREM_PICKS_CACHE_DIR") or os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache")
+JOURNAL_PATH = os.path.join(JOURNAL_DIR, "sheets_wal.jsonl")
+DEAD_PATH = os.path.join(JOURNAL_DIR, "sheets_wal_dead.jsonl")
+BATCH_DELAY_SEC = 0.5      # 連続した書き込みをまとめるための待ち
+MAX_BATCH = 500
+MAX_BACKOFF_SEC = 300.0
+MAX_ATTEMPTS = 5
+DEAD_AFTER_SEC = 600.0
+
+Applier = Callable[[str, List[dict]], None]
+
+class Deferred(Exception):
+    """反映の見送り（クォータ待ち等）。エントリの失敗回数には数えない"""
+
+
+_lock = threading.RLock()
+_pending: List[dict] = []
+_dead: List[dict] = []
+_recent: "deque[dict]" = deque(maxlen=2000)   # 反映済みの直近エントリ（取り込みとの競合解消用）
+_seq = 0
+_applier: Optional[Applier] = None
+_worker: Optional[threading.Thread] = None
+_held: Dict[str, int] = {}                      # 再生を止めているシート → 入れ子の数
+_replay_lock = threading.Lock()                # 1バッチの再生中は held に入らせない
+_wake = threading.Event()
+_idle = threading.Event()
+_idle.set()
+last_error: Optional[str] = None
+
+
+def _identity(e: dict):
+    """同じ行への書き込みを判定するキー（キー無しの追記は毎回別物）"""
+    row = e.get("row") or {}
+    if e.get("key_cols"):
+        return (e["sheet"], tuple(e["key_cols"]), tuple(str(row.get(k, "")) for k in e["key_cols"]))
+    if e.get("key_col"):
+        return (e["sheet"], (e["key_col"],), (str(row.get(e["key_col"], "")),))
+    return (e["sheet"], "seq", e["seq"])
+
+
+# ---- ジャーナルファイル ----
+def _append_to_file(entries: List[dict]):
+    os.makedirs(JOURNAL_DIR, exist_ok=True)
+    with open(JOURNAL_PATH, "a", encoding="utf-8") as f:
+        for entry in entries:
+            f.write(json.dumps(entry, ensure_ascii=False, default=str) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def _rewrite_file(entries: List[dict], path: str = JOURNAL_PATH):
+    os.makedirs(JOURNAL_DIR, exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        for e in entries:
+            f.write(json.dumps(e, ensure_ascii=False, default=str) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def _read_lines(path: str) -> List[dict]:
+    out = []
+    try:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    out.append(json.loads(line))
+                except ValueError:
+                    continue   # 書きかけの最終行などは捨てる
+    except FileNotFoundError:
+        pass
+    return out
+
+
+def _load_file():
+    global _seq
+    _pending.extend(_read_lines(JOURNAL_PATH))
+    _dead.extend(_read_lines(DEAD_PATH))
+    _seq = max([_seq] + [int(e.get("seq", 0)) for e in _pending + _dead])
+
+
+# ---- 再生 ----
+def _coalesce(entries: List[dict]) -> List[dict]:
+    """
+    同じ行への連続した書き込みを1件にまとめる。
+    upsert は行全体を書くので最後の1件、update_cols は直前の書き込みに列を重ねる
+    """
+    last: Dict[tuple, dict] = {}
+    for e in entries:
+        ident = _identity(e)
+        prev = last.pop(ident, None)
+        if prev is not None and e.get("op") == "update_cols":
+            e = {**prev, "row": {**prev["row"], **e["row"]}, "seq": e["seq"]}
+        last[ident] = e
+    return sorted(last.values(), key=lambda e: e["seq"])
+
+
+def _apply(sheet: str, entries: List[dict]) -> Optional[Exception]:
+    try:
+        _applier(sheet, entries)
+        return None
+    except Exception as ex:
+        return ex
+
+
+def _note_failure(originals: List[dict], ex: Exception, now: float) -> bool:
+    """失敗を記録（_lock 内で呼ぶ）。dead letter に回すべきなら True"""
+    attempts = max(int(e.get("attempts", 0)) for e in originals) + 1
+    first = min(float(e.get("first_failed_at") or now) for e in originals)
+    for e in originals:
+        e["attempts"], e["first_failed_at"], e["error"] = attempts, first, str(ex)
+    return attempts >= MAX_ATTEMPTS and now - first >= DEAD_AFTER_SEC
+
+
+def _replay_once() -> bool:
+    """保留分を1バッチ再生。全部成功したら True"""
+    global last_error
+    with _lock:
+        batch = [e for e in _pending if e["sheet"] not in _held][:MAX_BATCH]
+    if not batch or _applier is None:
+        return True
+    members: Dict[tuple, List[dict]] = {}
+    for e in batch:
+        members.setdefault(_identity(e), []).append(e)
+    by_sheet: Dict[str, List[dict]] = {}
+    for e in _coalesce(batch):
+        by_sheet.setdefault(e["sheet"], []).append(e)
+
+    done, failed = [], []          # 反映できた／失敗した（まとめ後の）エントリ
+    ok = True
+    for sheet, entries in by_sheet.items():
+        ex = _apply(sheet, entries)
+        if ex is None:
+            done += entries
+            continue
+        ok = False
+        last_error = f"{sheet}: {ex}"
+        if isinstance(ex, Deferred):
+            continue
+        if len(entries) == 1:
+            failed.append((entries[0], ex))
+            continue
+        # まとめ書きが失敗 → 1件ずつ当て直して、反映できない行だけを切り分ける
+        # （1件も通らないうちに失敗したら回線断等とみなし、残りは次回へ）
+        for e in entries:
+            ex1 = _apply(sheet, [e])
+            if ex1 is None:
+                done.append(e)
+                continue
+            if isinstance(ex1, Deferred):
+                break
+            last_error = f"{sheet}: {ex1}"
+            failed.append((e, ex1))
+            if not any(d["sheet"] == sheet for d in done):
+                break
+
+    now = time.time()
+    with _lock:
+        done_seqs = {o["seq"] for e in done for o in members[_identity(e)]}
+        dead = []
+        for e, ex in failed:
+            originals = members[_identity(e)]
+            if _note_failure(originals, ex, now):
+                dead += originals
+        dead_seqs = {e["seq"] for e in dead}
+        _recent.extend(e for e in _pending if e["seq"] in done_seqs)
+        _pending[:] = [e for e in _pending if e["seq"] not in done_seqs | dead_seqs]
+        if dead:
+            _dead.extend(dead)
+        try:
+            if dead:
+                _rewrite_file(_dead, DEAD_PATH)
+            _rewrite_file(_pending)
+        except Exception:
+            pass
+    if ok:
+        last_error = None
+    return ok
+
+
+def _loop():
+    backoff = 1.0
+    while True:
+        _wake.wait()
+        time.sleep(BATCH_DELAY_SEC)
+        _wake.clear()
+        with _replay_lock:
+            ok = _replay_once()
+        with _lock:
+            # 止めているシートの分は held を抜けたときに起こし直す
+            remaining = any(e["sheet"] not in _held for e in _pending)
+            if not _pending:
+                _idle.set()
+        if remaining:
+            if ok:
+                backoff = 1.0
+            else:
+                time.sleep(backoff)
+                backoff = min(backoff * 2, MAX_BACKOFF_SEC)
+            _wake.set()
+        else:
+            backoff = 1.0
+
+
+def _ensure_worker():
+    global _worker
+    with _lock:
+        if _worker is None or not _worker.is_alive():
+            _worker = threading.Thread(target=_loop, name="sheets-wal-replay", daemon=True)
+            _worker.start()
+
+
+# ---- 公開API ----
+def set_applier(fn: Applier):
+    """シートへ反映する関数を登録（google_sheets_client から）。保留分があれば再生開始"""
+    global _applier
+    _applier = fn
+    with _lock:
+        has_pending = bool(_pending)
+    if has_pending:
+        _idle.clear()
+        _ensure_worker()
+        _wake.set()
+
+
+def submit(sheet: str, row: dict, key_col: Optional[str] = None, key_cols: Optional[List[str]] = None,
+           op: str = "upsert"):
+    """書き込みをジャーナルに記録して戻る（シートへの反映は非同期）"""
+    submit_many(sheet, [row], key_col=key_col, key_cols=key_cols, op=op)
+
+
+def submit_many(sheet: str, rows: List[dict], key_col: Optional[str] = None,
+                key_cols: Optional[List[str]] = None, op: str = "upsert"):
+    """複数行をまとめて記録（fsync は1回）"""
+    global _seq
+    if not rows:
+        return
+    now = time.time()
+    with _lock:
+        entries = []
+        for row in rows:
+            _seq += 1
+            entries.append({
+                "seq": _seq,
+                "sheet": sheet,
+                "row": {k: v for k, v in dict(row).items() if not str(k).startswith("_")},
+                "key_col": key_col,
+                "key_cols": list(key_cols) if key_cols else None,
+                "op": op,
+                "ts": now,
+            })
+        _append_to_file(entries)
+        _pending.extend(entries)
+        _idle.clear()
+    _ensure_worker()
+    _wake.set()
+
+
+def pending_count(sheet: Optional[str] = None) -> int:
+    with _lock:
+        return sum(1 for e in _pending if sheet is None or e["sheet"] == sheet)
+
+
+def dead_letters() -> List[dict]:
+    """反映をあきらめたエントリ（error / attempts 付き）"""
+    with _lock:
+        return [dict(e) for e in _dead]
+
+
+def requeue_dead_letters() -> int:
+    """dead letter を保留に戻して再送する（原因を直した後に使う）"""
+    with _lock:
+        if not _dead:
+            return 0
+        back = [{k: v for k, v in e.items() if k not in ("attempts", "first_failed_at", "error")} for e in _dead]
+        _pending.extend(back)
+        _pending.sort(key=lambda e: e["seq"])
+        _dead.clear()
+        _rewrite_file(_pending)
+        _rewrite_file(_dead, DEAD_PATH)
+        _idle.clear()
+    _ensure_worker()
+    _wake.set()
+    return len(back)
+
+
+def wait_idle(timeout: Optional[float] = None) -> bool:
+    """保留分がすべて反映されるまで待つ"""
+    return _idle.wait(timeout)
+
+
+@contextmanager
+def held(sheets: List[str]):
+    """
+    指定シートの再生を止める（進行中のバッチは終わるのを待つ）。
+    その間の書き込みは保留のまま overlay で読みに重なり、抜けた後にシートへ再生される。
+    """
+    sheets = list(sheets)
+    with _replay_lock:
+        with _lock:
+            for s in sheets:
+                _held[s] = _held.get(s, 0) + 1
+    try:
+        yield
+    finally:
+        with _lock:
+            for s in sheets:
+                _held[s] -= 1
+                if not _held[s]:
+                    del _held[s]
+            has_pending = bool(_pending)
+        if has_pending:
+            _ensure_worker()
+            _wake.set()
+
+
+def overlay(sheet: str, recs: List[dict], since: Optional[float] = None) -> List[dict]:
+    """
+    シートから読んだ行に、未反映の書き込みを重ねた結果を返す。
+    since を渡すと、その時刻以降に記録されて既に反映済みのものも重ねる
+    （読込と反映が行き違った場合の取りこぼし防止）。
+    """
+    with _lock:
+        entries = [e for e in _pending if e["sheet"] == sheet]
+        if since is not None:
+            applied = [e for e in _recent if e["sheet"] == sheet and e["ts"] >= since]
+            entries = sorted(applied + entries, key=lambda e: e["seq"])
+    if not entries:
+        return recs
+    out = list(recs)
+    for e in entries:
+        row = e["row"]
+        cols = e.get("key_cols") or ([e["key_col"]] if e.get("key_col") else None)
+        hit = None
+        if cols:
+            key = tuple(str(row.get(k, "")) for k in cols)
+            hit = next((i for i, r in enumerate(out)
+                        if tuple(str(r.get(k, "")) for k in cols) == key), None)
+        if hit is None:
+            if e.get("op") != "update_cols":
+                out.append(dict(row))
+        else:
+            merged = dict(out[hit])
+            merged.update({k: v for k, v in row.items() if k in merged})
+            out[hit] = merged
+    return out
+
+
+_load_file()